@@ -3,6 +3,11 @@ ASGI config for conf project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live leaderboard stream (``/api/classements/flux/``) is an async view:
+serve the project through this entry point (uvicorn, daphne) so that each
+connected client holds a coroutine instead of a worker thread. Under WSGI the
+stream answers 204 and pages keep their server-rendered leaderboard.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +19,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
 
 application = get_asgi_application()
+
+# Chargement du tableau des classements en mémoire au démarrage du processus
+from soiree.tableau_classements import prechauffer_tableau  # noqa: E402
+prechauffer_tableau()
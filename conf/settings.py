@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'soiree.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +55,8 @@ ROOT_URLCONF = 'conf.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Moteur Django dont le rendu est chronométré par soiree.middleware.PerformanceMiddleware
+        'BACKEND': 'soiree.middleware.GabaritsMesures',
         'DIRS': [
             BASE_DIR / 'templates'
         ],
@@ -79,6 +81,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Une transaction qui lit puis écrit (inscription : unicité vérifiée puis
+            # création) échoue aussitôt avec « database is locked » si une autre écriture
+            # est en cours : SQLite ne fait pas attendre la promotion d'un verrou de
+            # lecture. En IMMEDIATE, le verrou d'écriture est demandé au BEGIN et
+            # attendu jusqu'à `timeout` secondes. Le code n'ouvre de transaction
+            # (atomic) que pour écrire ; les lectures hors transaction n'attendent pas.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+}
+
+
+# Cache partagé par tous les processus (versions des données pour les ETag,
+# statistiques et tarifs en cache) : un cache mémoire local ne verrait pas les
+# saisies faites par les autres workers. Table créée par la migration 0014
+# (ou `python manage.py createcachetable`). CacheBaseDonnees écrit les lots de
+# clés (set_many) en une transaction au lieu d'une série de requêtes par clé.
+CACHES = {
+    'default': {
+        'BACKEND': 'soiree.cache.CacheBaseDonnees',
+        'LOCATION': 'soiree_cache',
     }
 }
 
@@ -128,6 +153,28 @@ MEDIA_URL = '/media/'
 #MEDIA_ROOT = BASE_DIR/'media'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # This is now a string
+
+# Route /media/ servie par Django (soiree.medias) : en développement seulement,
+# ou explicitement derrière nginx avec MEDIA_ENVOI = 'x-accel-redirect'. Sinon
+# le serveur frontal sert /media/ lui-même, sans les dossiers videos/demandes/partiels
+# (envois inachevés) ni .contenu (fichiers adressés par contenu).
+MEDIA_SERVIR = DEBUG
+
+# Envoi des médias (soiree.medias) : 'django' (wsgi.file_wrapper / sendfile),
+# 'x-accel-redirect' derrière nginx (location interne MEDIA_ENVOI_PREFIXE) ou 'x-sendfile'
+MEDIA_ENVOI = 'django'
+MEDIA_ENVOI_PREFIXE = '/media-interne/'
+
+# Adresse du client (limite des envois de vidéo par adresse, soiree.televersement) :
+# derrière nginx, REMOTE_ADDR est celle du proxy ; utiliser l'en-tête qu'il pose
+# (proxy_set_header X-Real-IP $remote_addr -> 'HTTP_X_REAL_IP'), ou None.
+ADRESSE_CLIENT_META = 'REMOTE_ADDR'
+
+# Médias adressés par contenu : fichiers identiques stockés une fois (soiree.stockage)
+STORAGES = {
+    'default': {'BACKEND': 'soiree.stockage.StockageContenu'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -143,3 +190,28 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'votre_email@gmail.com'  # Remplacez par votre email Gmail
 EMAIL_HOST_PASSWORD = 'votre_mot_de_passe_app'  # Remplacez par votre mot de passe d'application Gmail
 DEFAULT_FROM_EMAIL = 'votre_email@gmail.com'  # Remplacez par votre email Gmail
+
+# Mesure des performances par requête (soiree.middleware.PerformanceMiddleware)
+# Désactivée en développement (et donc pendant les tests) ; en production, 5 % des
+# requêtes sont mesurées. Chaque mesure est une ligne JSON du logger
+# « soiree.performance », transmise aux handlers habituels (racine) et, si
+# PERFORMANCE_JOURNAL est renseigné, écrite aussi dans ce fichier.
+# L'en-tête Server-Timing (nombre et durée des requêtes SQL, cache) n'est envoyé
+# qu'en développement : il renseignerait n'importe quel client sur le serveur.
+PERFORMANCE_ECHANTILLONNAGE = 0.0 if DEBUG else 0.05  # part des requêtes mesurées
+PERFORMANCE_SERVER_TIMING = DEBUG
+PERFORMANCE_JOURNAL = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'performance': {'class': 'logging.FileHandler', 'filename': PERFORMANCE_JOURNAL, 'delay': True},
+    } if PERFORMANCE_JOURNAL else {},
+    'loggers': {
+        'soiree.performance': {
+            'handlers': ['performance'] if PERFORMANCE_JOURNAL else [],
+            'level': 'INFO',
+        },
+    },
+}
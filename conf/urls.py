@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 
+from soiree.views import servir_media
+
 admin.site.site_header = "Soirée Clash"
 admin.site.index_title = "ADMINISTRATION Soirée Clash"
 admin.site.site_title= "BOOM! BOOM!"
@@ -42,3 +45,8 @@ urlpatterns = [
         template_name='registration/password_reset_complete.html'
     ), name='password_reset_complete'),
 ]
+
+# Médias servis par Django seulement si demandé (MEDIA_SERVIR) : en production
+# le serveur frontal sert /media/
+if getattr(settings, 'MEDIA_SERVIR', settings.DEBUG):
+    urlpatterns.append(path(f"{settings.MEDIA_URL.strip('/')}/<path:chemin>", servir_media, name='media'))
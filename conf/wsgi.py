@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conf.settings')
 
 application = get_wsgi_application()
+
+# Chargement du tableau des classements en mémoire au démarrage du processus
+from soiree.tableau_classements import prechauffer_tableau  # noqa: E402
+prechauffer_tableau()
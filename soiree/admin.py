@@ -1,12 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.contrib.auth.models import User
 import uuid
 from .models import (
     Service, TypeBoisson, Profile, Gestionnaire, Participant, 
     ConsommationParticipant, Trophee, Pari, DemandeAdhesion,
-    ClassementQuotidien, ClassementEtablissement
+    ClassementQuotidien, ClassementEtablissement, VentesSoiree, DepensesSoiree, PseudoReserve
 )
+from .reglement_paris import SoireeNonTerminee, regler_paris
+from .utils import copy_file_to_service
 
 
 @admin.register(DemandeAdhesion)
@@ -14,7 +16,7 @@ class DemandeAdhesionAdmin(admin.ModelAdmin):
     list_display = ['pseudo', 'nom_etablissement', 'type_etablissement', 'quartier', 'ville', 'statut', 'date_demande']
     list_filter = ['statut', 'type_etablissement', 'ville', 'date_demande']
     search_fields = ['pseudo', 'nom_etablissement', 'nom_gestionnaire', 'prenom_gestionnaire']
-    readonly_fields = ['date_demande']
+    readonly_fields = ['date_demande', 'date_traitement']
     actions = ['approuver_demandes', 'rejeter_demandes']
     
     def approuver_demandes(self, request, queryset):
@@ -30,34 +32,16 @@ class DemandeAdhesionAdmin(admin.ModelAdmin):
                     actif=True
                 )
                 
-                # Copier la vidéo et la miniature si elles existent
+                # Reprendre la vidéo et la miniature (liens vers le même contenu, sans recopie)
                 if demande.video_etablissement:
-                    import shutil
-                    import os
-                    from django.conf import settings
-                    
-                    # Créer le dossier de destination s'il n'existe pas
-                    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'videos/etablissements/'), exist_ok=True)
-                    
-                    # Copier la vidéo
-                    nom_fichier_video = os.path.basename(demande.video_etablissement.name)
-                    chemin_destination_video = os.path.join(settings.MEDIA_ROOT, 'videos/etablissements/', nom_fichier_video)
-                    shutil.copy2(demande.video_etablissement.path, chemin_destination_video)
-                    
-                    # Mettre à jour le chemin dans le service
-                    service.video_etablissement = f'videos/etablissements/{nom_fichier_video}'
+                    service.video_etablissement = copy_file_to_service(
+                        demande.video_etablissement, 'videos/etablissements', 'video'
+                    )
                 
                 if demande.miniature_video:
-                    # Créer le dossier de destination s'il n'existe pas
-                    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'miniatures/videos/'), exist_ok=True)
-                    
-                    # Copier la miniature
-                    nom_fichier_miniature = os.path.basename(demande.miniature_video.name)
-                    chemin_destination_miniature = os.path.join(settings.MEDIA_ROOT, 'miniatures/videos/', nom_fichier_miniature)
-                    shutil.copy2(demande.miniature_video.path, chemin_destination_miniature)
-                    
-                    # Mettre à jour le chemin dans le service
-                    service.miniature_video = f'miniatures/videos/{nom_fichier_miniature}'
+                    service.miniature_video = copy_file_to_service(
+                        demande.miniature_video, 'miniatures/videos', 'miniature'
+                    )
                 
                 # Sauvegarder le service avec les vidéos
                 service.save()
@@ -81,7 +65,7 @@ class DemandeAdhesionAdmin(admin.ModelAdmin):
                 )
                 
                 # Créer le gestionnaire
-                gestionnaire = Gestionnaire.objects.create(
+                gestionnaire = Gestionnaire(
                     user=user,
                     pseudo=demande.pseudo,
                     nom=demande.nom_gestionnaire,
@@ -91,6 +75,8 @@ class DemandeAdhesionAdmin(admin.ModelAdmin):
                     fonction='gerant',
                     mot_de_passe_reinitialise=False
                 )
+                # Le pseudo réservé par la demande approuvée passe au gestionnaire
+                gestionnaire.save(reprise_pseudo=demande)
                 
                 # Marquer la demande comme approuvée
                 demande.statut = 'approuvee'
@@ -343,11 +329,19 @@ class PariAdmin(admin.ModelAdmin):
     actions = ['calculer_resultats']
     
     def calculer_resultats(self, request, queryset):
-        for pari in queryset.filter(gagne__isnull=True):
-            # Ici vous pouvez implémenter la logique de calcul des résultats
-            # basée sur les consommations des participants
-            pass
-        self.message_user(request, f"Calcul des résultats lancé pour {queryset.count()} pari(s).")
+        gagnes = perdus = 0
+        soirees = queryset.filter(gagne__isnull=True).values_list('date_evenement', flat=True).distinct()
+        for soiree in sorted(soirees):
+            try:
+                resultat = regler_paris(soiree, queryset)
+            except SoireeNonTerminee:
+                self.message_user(
+                    request, f"Soirée du {soiree:%d/%m/%Y} non terminée : paris laissés ouverts.", messages.WARNING
+                )
+                continue
+            gagnes += resultat['gagnes']
+            perdus += resultat['perdus']
+        self.message_user(request, f"{gagnes} pari(s) gagné(s) et {perdus} pari(s) perdu(s) réglés.")
     calculer_resultats.short_description = "Calculer les résultats des paris"
 
 
@@ -371,7 +365,34 @@ class ClassementEtablissementAdmin(admin.ModelAdmin):
     ordering = ['date', 'type_etablissement', 'position']
 
 
+@admin.register(VentesSoiree)
+class VentesSoireeAdmin(admin.ModelAdmin):
+    list_display = ['date_soiree', 'service', 'montant_total', 'nombre_consommations']
+    list_filter = ['date_soiree', 'service__type']
+    search_fields = ['service__nom']
+    readonly_fields = ['service', 'date_soiree', 'montant_total', 'nombre_consommations']
+    date_hierarchy = 'date_soiree'
+    ordering = ['-date_soiree', '-montant_total']
+
+
+@admin.register(DepensesSoiree)
+class DepensesSoireeAdmin(admin.ModelAdmin):
+    list_display = ['date_soiree', 'participant', 'montant_total', 'nombre_consommations']
+    list_filter = ['date_soiree', 'participant__service__type']
+    search_fields = ['participant__pseudo']
+    readonly_fields = ['participant', 'date_soiree', 'montant_total', 'nombre_consommations']
+    date_hierarchy = 'date_soiree'
+    ordering = ['-date_soiree', '-montant_total']
+
+
 # Configuration de l'admin
 admin.site.site_header = "Administration Soirée Clash"
 admin.site.site_title = "Soirée Clash Admin"
 admin.site.index_title = "Gestion de la plateforme Soirée Clash"
+
+
+@admin.register(PseudoReserve)
+class PseudoReserveAdmin(admin.ModelAdmin):
+    list_display = ['pseudo', 'normalise', 'demande', 'gestionnaire', 'participant', 'date_reservation']
+    search_fields = ['pseudo', 'normalise']
+    readonly_fields = ['normalise', 'pseudo', 'demande', 'gestionnaire', 'participant', 'date_reservation']
@@ -0,0 +1,105 @@
+"""
+Attribution des trophées de la soirée
+
+Par établissement et par soirée :
+- Sultan du Maquis : plus grosses dépenses dans un maquis
+- Roi des Ventes Maquis : plus grand nombre de consommations dans un maquis
+- Empereur de la Boîte : plus grosses dépenses dans une boîte
+- Bouquet d'Or : plus grosses dépenses en champagne dans une boîte
+
+Les consommations de la période sont lues en une seule requête, regroupées par
+soirée, établissement, participant et catégorie de boisson. Les égalités sont
+départagées par pseudo, comme pour les classements.
+"""
+from django.db.models import Q, Sum
+
+from .classements import SoireeNonTerminee
+from .models import (
+    ConsommationParticipant, Trophee, HEURE_OUVERTURE_SOIREE, HEURE_FERMETURE_SOIREE,
+    date_soiree_courante,
+)
+
+
+# type de trophée -> (type d'établissement, critère)
+TROPHEES = {
+    'sultan_maquis': ('maquis', 'montant'),
+    'roi_ventes_maquis': ('maquis', 'quantite'),
+    'empereur_boite': ('boite', 'montant'),
+    'bouquet_or': ('boite', 'champagne'),
+}
+
+
+def _cumuls_participants(debut, fin):
+    """
+    Cumuls par (soirée, établissement, participant) en un seul parcours
+    Returns:
+        dict: {(soiree, service_id, type): {participant_id: {'pseudo', 'montant', 'quantite', 'champagne'}}}
+    """
+    lignes = ConsommationParticipant.objects.filter(
+        Q(date_consommation__time__gte=HEURE_OUVERTURE_SOIREE) |
+        Q(date_consommation__time__lt=HEURE_FERMETURE_SOIREE),
+        date_soiree__range=[debut, fin]
+    ).values_list(
+        'date_soiree', 'service_id', 'service__type', 'participant_id', 'participant__pseudo',
+        'type_boisson__categorie'
+    ).annotate(
+        montant=Sum('montant_total'),
+        quantite=Sum('quantite'),
+    ).order_by()
+
+    cumuls = {}
+    for soiree, service_id, type_etablissement, participant_id, pseudo, categorie, montant, quantite in (
+        lignes.iterator(chunk_size=5000)
+    ):
+        participants = cumuls.setdefault((soiree, service_id, type_etablissement), {})
+        cumul = participants.setdefault(participant_id, {'pseudo': pseudo, 'montant': 0, 'quantite': 0, 'champagne': 0})
+        cumul['montant'] += montant
+        cumul['quantite'] += quantite
+        if categorie == 'champagne':
+            cumul['champagne'] += montant
+    return cumuls
+
+
+def attribuer_trophees(debut, fin=None):
+    """
+    Attribue les trophées des soirées terminées d'une période
+    Les trophées déjà attribués (même type, soirée et établissement) sont conservés.
+    Returns:
+        int: nombre de trophées créés
+    Raises:
+        SoireeNonTerminee: si la période inclut une soirée en cours
+    """
+    fin = fin or debut
+    if fin >= date_soiree_courante():
+        raise SoireeNonTerminee(fin)
+
+    trophees = []
+    for (soiree, service_id, type_etablissement), participants in _cumuls_participants(debut, fin).items():
+        for type_trophee, (type_requis, critere) in TROPHEES.items():
+            if type_etablissement != type_requis:
+                continue
+            candidats = [
+                (-cumul[critere], cumul['pseudo'], participant_id, cumul)
+                for participant_id, cumul in participants.items() if cumul[critere] > 0
+            ]
+            if not candidats:
+                continue
+            _, pseudo, participant_id, cumul = min(candidats)
+            montant = cumul['champagne'] if critere == 'champagne' else cumul['montant']
+            trophees.append(Trophee(
+                type_trophee=type_trophee, gagnant_id=participant_id, etablissement_id=service_id,
+                date_attribution=soiree, montant_total=montant,
+                description=_description(type_trophee, cumul),
+            ))
+
+    avant = Trophee.objects.filter(date_attribution__range=[debut, fin]).count()
+    Trophee.objects.bulk_create(trophees, batch_size=1000, ignore_conflicts=True)
+    return Trophee.objects.filter(date_attribution__range=[debut, fin]).count() - avant
+
+
+def _description(type_trophee, cumul):
+    if type_trophee == 'roi_ventes_maquis':
+        return f"{cumul['quantite']} consommations pour {cumul['montant']:.0f} FCFA"
+    if type_trophee == 'bouquet_or':
+        return f"{cumul['champagne']:.0f} FCFA de champagne"
+    return f"{cumul['montant']:.0f} FCFA de dépenses"
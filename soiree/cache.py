@@ -0,0 +1,73 @@
+"""
+Cache partagé en base de données
+
+Le DatabaseCache de Django écrit chaque clé de set_many séparément (comptage,
+point de sauvegarde, lecture, écriture : cinq requêtes par clé). Les
+statistiques du dashboard d'un administrateur mettent en cache une entrée par
+établissement : CacheBaseDonnees les écrit toutes en une seule transaction.
+Ses lectures sont comptées dans les mesures de performance (soiree.middleware).
+"""
+import base64
+import pickle
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.db import DatabaseError, connections, router, transaction
+from django.utils.timezone import now
+
+from .middleware import compter_cache
+
+
+class CacheBaseDonnees(DatabaseCache):
+    """DatabaseCache dont set_many remplace toutes les clés en deux requêtes"""
+
+    def get_many(self, keys, version=None):
+        # get() passe aussi par get_many : chaque lecture n'est comptée qu'une fois
+        keys = list(keys)
+        valeurs = super().get_many(keys, version)
+        compter_cache(len(valeurs), len(keys) - len(valeurs))
+        return valeurs
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        cles = {self.make_and_validate_key(cle, version=version): cle for cle in data}
+        timeout = self.get_backend_timeout(timeout)
+        db = router.db_for_write(self.cache_model_class)
+        connection = connections[db]
+        quote_name = connection.ops.quote_name
+        table = quote_name(self._table)
+
+        if timeout is None:
+            expiration = datetime.max
+        else:
+            expiration = datetime.fromtimestamp(timeout, tz=dt_timezone.utc if settings.USE_TZ else None)
+        expiration = connection.ops.adapt_datetimefield_value(expiration.replace(microsecond=0))
+        parametres = []
+        for cle, cle_origine in cles.items():
+            valeur = base64.b64encode(pickle.dumps(data[cle_origine], self.pickle_protocol)).decode('latin1')
+            parametres += [cle, valeur, expiration]
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            nombre = cursor.fetchone()[0]
+            if nombre > self._max_entries:
+                self._cull(db, cursor, now().replace(microsecond=0), nombre)
+            marques = ', '.join(['%s'] * len(cles))
+            lignes = ', '.join(['(%s, %s, %s)'] * len(cles))
+            try:
+                with transaction.atomic(using=db):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE {quote_name('cache_key')} IN ({marques})", list(cles)
+                    )
+                    cursor.execute(
+                        f"INSERT INTO {table} ({quote_name('cache_key')}, {quote_name('value')}, "
+                        f"{quote_name('expires')}) VALUES {lignes}",
+                        parametres
+                    )
+            except DatabaseError:
+                # Comme DatabaseCache : une écriture du cache qui échoue n'interrompt pas la requête
+                return list(data)
+        return []
@@ -0,0 +1,385 @@
+"""
+Banc de charge HTTP : utilisateurs virtuels et percentiles de latence par point d'accès
+
+Chaque utilisateur virtuel enchaîne des parcours réalistes (visiteur de la page
+d'accueil, inscription d'un participant, saisie d'un gestionnaire, suivi des
+classements, pari) contre l'application, soit en processus via le client de
+test Django, soit contre un serveur local en marche (--url). Les comptes
+utilisés sont ceux de la base, par exemple générés par « generer_donnees ».
+
+Le rapport donne par point d'accès le nombre de requêtes, les erreurs, le
+débit et les latences p50 / p95 / p99. Il peut être enregistré comme
+référence et comparé aux exécutions suivantes pour signaler les régressions.
+
+Les parcours écrivent dans la base (comptes charge_*, consommations, paris).
+En processus, le banc refuse de tourner sans base_jetable (--base-jetable) et
+supprime à la fin ce qu'il a créé, puis recalcule les cumuls de soirée
+concernés. Les threads ont chacun leur connexion : une transaction annulée à
+la fin ne couvrirait pas leurs écritures.
+"""
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPErrorProcessor, Request, build_opener
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from .classements import reconstruire_ventes_soiree
+from .models import ConsommationParticipant, Gestionnaire, Pari, Participant, Service, TypeBoisson
+from .statistiques import invalider_statistiques
+from .tableau_classements import tableau_classements
+from .versions import PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS, incrementer_version
+
+
+# Poids relatifs des parcours dans le trafic simulé
+PARCOURS = {
+    'visiteur': 30,
+    'classements': 35,
+    'gestionnaire': 15,
+    'pari': 15,
+    'inscription': 5,
+}
+SEUIL_ABSOLU_REGRESSION_MS = 5  # en dessous, un écart relève du bruit de mesure
+PREFIXE_COMPTES_CHARGE = 'charge_'
+
+
+class BaseNonJetable(Exception):
+    """Banc en processus demandé sans confirmer que la base peut être modifiée"""
+
+
+class _SansRedirection(HTTPErrorProcessor):
+    """Les redirections (302 après connexion ou formulaire) sont des réponses à mesurer, pas à suivre"""
+
+    def http_response(self, request, response):
+        return response
+
+    https_response = http_response
+
+
+class ClientServeur:
+    """Client HTTP minimal (cookies et jeton CSRF) pour un serveur en marche"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _SansRedirection())
+
+    def _jeton_csrf(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def requete(self, methode, chemin, donnees=None, json_donnees=None, en_tetes=None):
+        """Returns: tuple (statut, en-têtes de la réponse)"""
+        en_tetes = dict(en_tetes or {})
+        corps = None
+        if methode == 'POST':
+            jeton = self._jeton_csrf()
+            en_tetes['X-CSRFToken'] = jeton
+            en_tetes['Referer'] = self.url + chemin
+            if json_donnees is not None:
+                corps = json.dumps(json_donnees).encode()
+                en_tetes['Content-Type'] = 'application/json'
+            else:
+                corps = urlencode({**(donnees or {}), 'csrfmiddlewaretoken': jeton}).encode()
+                en_tetes['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            with self.opener.open(Request(self.url + chemin, data=corps, headers=en_tetes, method=methode), timeout=30) as reponse:
+                reponse.read()
+                return reponse.status, dict(reponse.headers)
+        except HTTPError as e:
+            return e.code, dict(e.headers or {})
+        except URLError:
+            return 0, {}
+
+
+class ClientProcessus:
+    """Même interface, en processus via le client de test Django"""
+
+    def __init__(self):
+        self.client = Client(SERVER_NAME='localhost')
+
+    def requete(self, methode, chemin, donnees=None, json_donnees=None, en_tetes=None):
+        en_tetes = {f'HTTP_{nom.upper().replace("-", "_")}': valeur for nom, valeur in (en_tetes or {}).items()}
+        if methode == 'POST' and json_donnees is not None:
+            reponse = self.client.post(chemin, json.dumps(json_donnees), content_type='application/json', **en_tetes)
+        elif methode == 'POST':
+            reponse = self.client.post(chemin, donnees or {}, **en_tetes)
+        else:
+            reponse = self.client.get(chemin, **en_tetes)
+        if reponse.streaming:
+            b''.join(reponse.streaming_content)
+        return reponse.status_code, dict(reponse.headers)
+
+
+class Mesures:
+    """Durées et erreurs par point d'accès, partagées entre les utilisateurs virtuels"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.durees = {}
+        self.erreurs = {}
+
+    def enregistrer(self, point, duree, erreur):
+        with self.verrou:
+            self.durees.setdefault(point, []).append(duree)
+            if erreur:
+                self.erreurs[point] = self.erreurs.get(point, 0) + 1
+
+
+def percentile(valeurs_triees, rang):
+    """Percentile au rang le plus proche d'une liste triée"""
+    if not valeurs_triees:
+        return 0
+    return valeurs_triees[max(0, math.ceil(rang / 100 * len(valeurs_triees)) - 1)]
+
+
+def charger_comptes(prefixe=''):
+    """Comptes et identifiants de la base utilisés par les parcours (noms d'utilisateur commençant par `prefixe`)"""
+    participants = list(Participant.objects.filter(actif=True, user__username__startswith=prefixe).values_list(
+        'pk', 'user__username', 'service_id'
+    ))
+    boissons = {}
+    for boisson_id, service_id in TypeBoisson.objects.filter(actif=True).values_list('pk', 'service_id'):
+        boissons.setdefault(service_id, []).append(boisson_id)
+    participants_par_service = {}
+    for participant_id, _, service_id in participants:
+        participants_par_service.setdefault(service_id, []).append(participant_id)
+    gestionnaires = [
+        (username, service_id)
+        for username, service_id in Gestionnaire.objects.filter(user__username__startswith=prefixe).values_list(
+            'user__username', 'service_id'
+        )
+        if boissons.get(service_id) and participants_par_service.get(service_id)
+    ]
+    return {
+        'participants': participants,
+        'participants_par_service': participants_par_service,
+        'boissons': boissons,
+        'gestionnaires': gestionnaires,
+        'services': list(Service.objects.filter(actif=True, types_boissons_enregistres=True).values_list('pk', flat=True)),
+    }
+
+
+class UtilisateurVirtuel:
+    """Enchaîne des parcours tirés au hasard jusqu'à l'échéance"""
+
+    def __init__(self, client, comptes, mesures, aleatoire, mot_de_passe):
+        self.client = client
+        self.comptes = comptes
+        self.mesures = mesures
+        self.aleatoire = aleatoire
+        self.mot_de_passe = mot_de_passe
+        self.etag_classements = None
+
+    def appeler(self, point, methode, chemin, statuts_attendus=(200,), **kwargs):
+        debut = time.perf_counter()
+        statut, en_tetes = self.client.requete(methode, chemin, **kwargs)
+        self.mesures.enregistrer(point, time.perf_counter() - debut, statut not in statuts_attendus)
+        return statut, en_tetes
+
+    def se_connecter(self, username):
+        self.appeler('GET /login/', 'GET', '/login/')
+        statut, _ = self.appeler(
+            'POST /login/', 'POST', '/login/', statuts_attendus=(302,),
+            donnees={'username': username, 'password': self.mot_de_passe}
+        )
+        return statut == 302
+
+    def parcours_visiteur(self):
+        self.appeler('GET /', 'GET', '/')
+        self.appeler('GET /api/classements/', 'GET', '/api/classements/')
+
+    def parcours_classements(self):
+        # Rafraîchissement périodique d'un écran : requêtes conditionnelles
+        for _ in range(5):
+            en_tetes = {'If-None-Match': self.etag_classements} if self.etag_classements else {}
+            statut, reponse = self.appeler(
+                'GET /api/classements/', 'GET', '/api/classements/', statuts_attendus=(200, 304), en_tetes=en_tetes
+            )
+            self.etag_classements = reponse.get('ETag', self.etag_classements)
+
+    def parcours_inscription(self):
+        if not self.comptes['services']:
+            return
+        self.appeler('GET /inscription-participant/', 'GET', '/inscription-participant/')
+        pseudo = f'{PREFIXE_COMPTES_CHARGE}{uuid.uuid4().hex[:12]}'
+        self.appeler('POST /inscription-participant/', 'POST', '/inscription-participant/', statuts_attendus=(302,), donnees={
+            'pseudo': pseudo, 'nom': 'Charge', 'prenom': 'Test', 'email': f'{pseudo}@example.com',
+            'service': self.aleatoire.choice(self.comptes['services']),
+        })
+
+    def parcours_gestionnaire(self):
+        if not self.comptes['gestionnaires']:
+            return
+        username, service_id = self.aleatoire.choice(self.comptes['gestionnaires'])
+        if not self.se_connecter(username):
+            return
+        for _ in range(self.aleatoire.randint(1, 5)):
+            lignes = [
+                {
+                    'participant': self.aleatoire.choice(self.comptes['participants_par_service'][service_id]),
+                    'type_boisson': self.aleatoire.choice(self.comptes['boissons'][service_id]),
+                    'quantite': self.aleatoire.randint(1, 3),
+                }
+                for _ in range(self.aleatoire.randint(1, 5))
+            ]
+            self.appeler(
+                'POST /api/consommations/lot/', 'POST', '/api/consommations/lot/',
+                statuts_attendus=(201,), json_donnees={'lignes': lignes}
+            )
+
+    def parcours_pari(self):
+        if not self.comptes['participants']:
+            return
+        _, username, _ = self.aleatoire.choice(self.comptes['participants'])
+        if not self.se_connecter(username):
+            return
+        self.appeler('GET /paris/', 'GET', '/paris/')
+        participant_id, _, _ = self.aleatoire.choice(self.comptes['participants'])
+        self.appeler('POST /paris/', 'POST', '/paris/', statuts_attendus=(302,), donnees={
+            'montant': self.aleatoire.choice([500, 1000, 2000]), 'participant': participant_id,
+            'evenement': self.aleatoire.choice(['GAIN', 'PERTE']),
+            'date_evenement': (timezone.localdate() + timedelta(days=1)).isoformat(),
+        })
+
+    def executer(self, echeance):
+        noms, poids = zip(*PARCOURS.items())
+        try:
+            while time.monotonic() < echeance:
+                getattr(self, f'parcours_{self.aleatoire.choices(noms, poids)[0]}')()
+        finally:
+            # Chaque thread a ses propres connexions à la base
+            connections.close_all()
+
+
+def instantane_base():
+    """Dernières clés primaires avant la charge : ce qui est créé ensuite appartient au banc"""
+    return {
+        'consommation': ConsommationParticipant.objects.aggregate(dernier=Max('pk'))['dernier'] or 0,
+        'pari': Pari.objects.aggregate(dernier=Max('pk'))['dernier'] or 0,
+        'utilisateur': User.objects.aggregate(dernier=Max('pk'))['dernier'] or 0,
+    }
+
+
+def nettoyer_charge(instantane):
+    """
+    Supprime les consommations, paris et comptes charge_* créés depuis `instantane`
+    Les consommations sont supprimées en bloc : les cumuls des soirées
+    concernées sont ensuite recalculés et les caches invalidés.
+    Returns:
+        dict: nombre d'éléments supprimés par type
+    """
+    consommations = ConsommationParticipant.objects.filter(pk__gt=instantane['consommation'])
+    soirees = consommations.aggregate(debut=Min('date_soiree'), fin=Max('date_soiree'))
+    services = set(consommations.values_list('service_id', flat=True).distinct())
+    with transaction.atomic():
+        supprimes = {
+            'paris': Pari.objects.filter(pk__gt=instantane['pari']).delete()[0],
+            'consommations': consommations.delete()[0],
+            'comptes': User.objects.filter(
+                pk__gt=instantane['utilisateur'], username__startswith=PREFIXE_COMPTES_CHARGE
+            ).delete()[1].get(User._meta.label, 0),
+        }
+        if soirees['debut'] is not None:
+            reconstruire_ventes_soiree(soirees['debut'], soirees['fin'])
+    for service_id in services:
+        invalider_statistiques(service_id)
+    incrementer_version(PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS)
+    tableau_classements.invalider()
+    return supprimes
+
+
+def lancer_charge(nombre_utilisateurs, duree, url=None, graine=None, mot_de_passe='motdepasse', prefixe='',
+                  base_jetable=False):
+    """
+    Exécute le banc de charge
+    Args:
+        url: serveur à solliciter, None pour le client de test en processus
+        duree: durée de la charge en secondes
+        prefixe: préfixe des comptes à utiliser (ceux de generer_donnees partagent un mot de passe)
+        base_jetable: confirme qu'en processus le banc peut écrire dans la base configurée
+    Returns:
+        dict: rapport par point d'accès
+    Raises:
+        BaseNonJetable: en processus sans base_jetable
+    """
+    if url is None and not base_jetable:
+        raise BaseNonJetable(
+            'Le banc en processus écrit dans la base configurée : '
+            'utiliser une base jetable (--base-jetable) ou un serveur (--url).'
+        )
+    comptes = charger_comptes(prefixe)
+    mesures = Mesures()
+    aleatoire = random.Random(graine)
+    utilisateurs = [
+        UtilisateurVirtuel(
+            ClientServeur(url) if url else ClientProcessus(), comptes, mesures,
+            random.Random(aleatoire.random()), mot_de_passe
+        )
+        for _ in range(nombre_utilisateurs)
+    ]
+    instantane = instantane_base() if not url else None
+    try:
+        # En processus, les emails de bienvenue restent en mémoire
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend') if not url else nullcontext():
+            debut = time.monotonic()
+            with ThreadPoolExecutor(max_workers=nombre_utilisateurs) as executeur:
+                for resultat in [executeur.submit(utilisateur.executer, debut + duree) for utilisateur in utilisateurs]:
+                    resultat.result()
+            duree_reelle = time.monotonic() - debut
+    finally:
+        if instantane is not None:
+            nettoyer_charge(instantane)
+    return rapport(mesures, duree_reelle)
+
+
+def rapport(mesures, duree):
+    """Nombre de requêtes, erreurs, débit et latences (ms) par point d'accès"""
+    points = {}
+    for point, durees in sorted(mesures.durees.items()):
+        durees = sorted(durees)
+        points[point] = {
+            'requetes': len(durees),
+            'erreurs': mesures.erreurs.get(point, 0),
+            'debit': round(len(durees) / duree, 2),
+            'p50_ms': round(percentile(durees, 50) * 1000, 2),
+            'p95_ms': round(percentile(durees, 95) * 1000, 2),
+            'p99_ms': round(percentile(durees, 99) * 1000, 2),
+        }
+    return {'duree': round(duree, 2), 'points': points}
+
+
+def comparer(resultat, reference, tolerance=0.25):
+    """
+    Régressions par rapport à une exécution de référence
+    Un point régresse si son p95 dépasse celui de la référence de plus de
+    `tolerance` (et de plus de SEUIL_ABSOLU_REGRESSION_MS), ou si son taux
+    d'erreurs augmente.
+    Returns:
+        list: messages décrivant chaque régression
+    """
+    regressions = []
+    for point, mesure in resultat['points'].items():
+        precedente = reference.get('points', {}).get(point)
+        if not precedente:
+            continue
+        limite = max(precedente['p95_ms'] * (1 + tolerance), precedente['p95_ms'] + SEUIL_ABSOLU_REGRESSION_MS)
+        if mesure['p95_ms'] > limite:
+            regressions.append(f'{point} : p95 {mesure["p95_ms"]} ms (référence {precedente["p95_ms"]} ms)')
+        taux = mesure['erreurs'] / mesure['requetes']
+        taux_reference = precedente['erreurs'] / precedente['requetes'] if precedente['requetes'] else 0
+        if taux > taux_reference + 0.01:
+            regressions.append(f'{point} : {taux:.1%} d\'erreurs (référence {taux_reference:.1%})')
+    return regressions
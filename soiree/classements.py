@@ -0,0 +1,168 @@
+"""
+Classements des soirées : reconstruction des cumuls de ventes et
+matérialisation des classements quotidiens
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Count, Window
+from django.db.models.functions import RowNumber
+
+from .models import (
+    ConsommationParticipant, VentesSoiree, DepensesSoiree,
+    ClassementQuotidien, ClassementEtablissement,
+    HEURE_OUVERTURE_SOIREE, HEURE_FERMETURE_SOIREE, date_soiree_courante,
+)
+
+
+def _consommations_par_soiree(debut=None, fin=None):
+    """Consommations de la fenêtre de classement, annotées de leur date de soirée"""
+    consommations = ConsommationParticipant.objects.filter(
+        Q(date_consommation__time__gte=HEURE_OUVERTURE_SOIREE) |
+        Q(date_consommation__time__lt=HEURE_FERMETURE_SOIREE)
+    ).annotate(
+        soiree=F('date_soiree')
+    )
+    if debut:
+        consommations = consommations.filter(date_soiree__gte=debut)
+    if fin:
+        consommations = consommations.filter(date_soiree__lte=fin)
+    return consommations
+
+
+def _reconcilier(modele, cle, attendus, existants, corriger):
+    """Compare les cumuls attendus aux cumuls stockés et corrige les écarts"""
+    a_creer, a_modifier = [], []
+    for identifiant, (montant, nombre) in attendus.items():
+        ligne = existants.pop(identifiant, None)
+        if ligne is None:
+            a_creer.append(modele(
+                date_soiree=identifiant[1], montant_total=montant,
+                nombre_consommations=nombre, **{cle: identifiant[0]}
+            ))
+        elif ligne.montant_total != montant or ligne.nombre_consommations != nombre:
+            ligne.montant_total = montant
+            ligne.nombre_consommations = nombre
+            a_modifier.append(ligne)
+    a_supprimer = [ligne.pk for ligne in existants.values()]
+
+    if corriger:
+        modele.objects.bulk_create(a_creer, batch_size=1000)
+        modele.objects.bulk_update(a_modifier, ['montant_total', 'nombre_consommations'], batch_size=1000)
+        modele.objects.filter(pk__in=a_supprimer).delete()
+
+    return {
+        'manquants': len(a_creer),
+        'incorrects': len(a_modifier),
+        'orphelins': len(a_supprimer),
+    }
+
+
+def reconstruire_ventes_soiree(debut=None, fin=None, corriger=True):
+    """
+    Recalcule les cumuls de soirée à partir des consommations brutes
+    Args:
+        debut, fin: bornes (dates de soirée incluses), None pour tout l'historique
+        corriger: si False, se contente de compter les écarts
+    Returns:
+        dict: écarts constatés pour les établissements et les participants
+    """
+    consommations = _consommations_par_soiree(debut, fin)
+    resultats = {}
+
+    with transaction.atomic():
+        for modele, cle in ((VentesSoiree, 'service_id'), (DepensesSoiree, 'participant_id')):
+            champ = cle[:-3]
+            attendus = {
+                (ligne[champ], ligne['soiree']): (ligne['total'], ligne['nombre'])
+                for ligne in consommations.values(champ, 'soiree').annotate(
+                    total=Sum('montant_total'),
+                    nombre=Count('id')
+                ).order_by()
+            }
+
+            stockes = modele.objects.all()
+            if debut:
+                stockes = stockes.filter(date_soiree__gte=debut)
+            if fin:
+                stockes = stockes.filter(date_soiree__lte=fin)
+            existants = {
+                (getattr(ligne, cle), ligne.date_soiree): ligne
+                for ligne in stockes.iterator(chunk_size=2000)
+            }
+
+            resultats[modele._meta.model_name] = _reconcilier(modele, cle, attendus, existants, corriger)
+
+    if corriger and any(sum(ecarts.values()) for ecarts in resultats.values()):
+        from .versions import incrementer_version, PORTEE_CLASSEMENTS
+        incrementer_version(PORTEE_CLASSEMENTS)
+    return resultats
+
+
+class SoireeNonTerminee(Exception):
+    """Les consommations de la soirée peuvent encore évoluer"""
+
+
+def derniere_soiree_terminee():
+    """Date de la dernière soirée dont la fenêtre de classement est close"""
+    return date_soiree_courante() - timedelta(days=1)
+
+
+def materialiser_classements(soiree):
+    """
+    Calcule et enregistre les classements d'une soirée par type d'établissement
+    Les positions sont calculées en base (fonction de fenêtrage) à partir des
+    cumuls de la soirée, puis remplacent l'ancien instantané en une transaction.
+    Returns:
+        tuple: (nombre de participants classés, nombre d'établissements classés)
+    """
+    participants = DepensesSoiree.objects.filter(
+        date_soiree=soiree,
+        montant_total__gt=0
+    ).annotate(
+        type_etablissement=F('participant__service__type'),
+        position=Window(
+            RowNumber(),
+            partition_by=[F('participant__service__type')],
+            order_by=[F('montant_total').desc(), F('participant__pseudo').asc()]
+        )
+    ).values_list(
+        'type_etablissement', 'participant_id', 'participant__service_id', 'montant_total', 'position'
+    )
+
+    etablissements = VentesSoiree.objects.filter(
+        date_soiree=soiree,
+        montant_total__gt=0
+    ).annotate(
+        type_etablissement=F('service__type'),
+        position=Window(
+            RowNumber(),
+            partition_by=[F('service__type')],
+            order_by=[F('montant_total').desc(), F('service__nom').asc()]
+        )
+    ).values_list('type_etablissement', 'service_id', 'montant_total', 'position')
+
+    classements_participants = [
+        ClassementQuotidien(
+            date=soiree, type_etablissement=type_etablissement, participant_id=participant_id,
+            etablissement_id=etablissement_id, montant_total=montant, position=position
+        )
+        for type_etablissement, participant_id, etablissement_id, montant, position
+        in participants.iterator(chunk_size=5000)
+    ]
+    classements_etablissements = [
+        ClassementEtablissement(
+            date=soiree, type_etablissement=type_etablissement, etablissement_id=etablissement_id,
+            montant_total=montant, position=position
+        )
+        for type_etablissement, etablissement_id, montant, position in etablissements
+    ]
+
+    # Remplacement de l'instantané : les lecteurs voient l'ancien ou le nouveau, jamais un mélange
+    with transaction.atomic():
+        ClassementQuotidien.objects.filter(date=soiree).delete()
+        ClassementEtablissement.objects.filter(date=soiree).delete()
+        ClassementQuotidien.objects.bulk_create(classements_participants, batch_size=2000)
+        ClassementEtablissement.objects.bulk_create(classements_etablissements, batch_size=2000)
+
+    return len(classements_participants), len(classements_etablissements)
@@ -0,0 +1,190 @@
+"""
+Diffusion en direct des classements (Server-Sent Events)
+
+Un seul diffuseur par processus lit l'évolution du classement dans le tableau
+en mémoire après une saisie et la transmet à tous les clients connectés via un broker. Le broker
+en mémoire suffit pour un processus unique et pour les tests.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Service, date_soiree_courante
+
+
+logger = logging.getLogger(__name__)
+
+TAILLE_FILE_CLIENT = 100
+INTERVALLE_HEARTBEAT = 15  # secondes
+
+
+class Abonnement:
+    """File d'attente d'un client connecté au flux"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.boucle = asyncio.get_running_loop()
+        self.file = asyncio.Queue(maxsize=TAILLE_FILE_CLIENT)
+        self.actif = True
+
+    def _deposer(self, message):
+        try:
+            self.file.put_nowait(message)
+        except asyncio.QueueFull:
+            # Client trop lent : on le déconnecte plutôt que d'accumuler en mémoire
+            self.fermer()
+
+    def deposer(self, message):
+        """Dépose un message depuis n'importe quel thread"""
+        if not self.actif:
+            return
+        if self.boucle.is_closed():
+            # Boucle de la requête terminée : le client n'est plus joignable
+            self.fermer()
+            return
+        try:
+            self.boucle.call_soon_threadsafe(self._deposer, message)
+        except RuntimeError:
+            # Boucle fermée entre le test et le dépôt
+            self.fermer()
+
+    async def recevoir(self, timeout=None):
+        return await asyncio.wait_for(self.file.get(), timeout)
+
+    def fermer(self):
+        self.actif = False
+        self.broker.desabonner(self)
+
+
+class BrokerMemoire:
+    """Broker local : distribue chaque message aux abonnés du processus"""
+
+    def __init__(self):
+        self._abonnes = set()
+        self._verrou = threading.Lock()
+
+    def abonner(self):
+        abonnement = Abonnement(self)
+        with self._verrou:
+            self._abonnes.add(abonnement)
+        return abonnement
+
+    def desabonner(self, abonnement):
+        with self._verrou:
+            self._abonnes.discard(abonnement)
+
+    def nombre_abonnes(self):
+        return len(self._abonnes)
+
+    def publier(self, message):
+        with self._verrou:
+            abonnes = list(self._abonnes)
+        for abonnement in abonnes:
+            # La publication part du on_commit d'une saisie : un abonné en
+            # erreur ne doit jamais faire échouer l'enregistrement
+            try:
+                abonnement.deposer(message)
+            except Exception:
+                logger.exception("Diffusion impossible vers un abonné, désabonnement")
+                self.desabonner(abonnement)
+
+
+class DiffuseurClassements:
+    """Calcule une fois l'évolution du classement et la publie à tous les clients"""
+
+    def __init__(self, broker=None):
+        self.broker = broker or BrokerMemoire()
+        self._derniers = {}
+        self._verrou = threading.Lock()
+
+    def instantane(self, type_etablissement):
+        """Positions et totaux de la soirée en cours pour un type d'établissement"""
+        from .tableau_classements import tableau_classements
+        return {
+            ligne['id']: {
+                'id': ligne['id'], 'nom': ligne['nom'],
+                'total': ligne['total_ventes'], 'position': ligne['position'],
+            }
+            for ligne in tableau_classements.top_etablissements(type_etablissement)
+        }
+
+    def signaler(self, type_etablissement):
+        """Recalcule le classement d'un type après une saisie et publie les changements"""
+        if not self.broker.nombre_abonnes():
+            # Personne n'écoute : l'instantané sera recalculé à la prochaine connexion
+            self._derniers.pop(type_etablissement, None)
+            return None
+
+        with self._verrou:
+            soiree = date_soiree_courante()
+            nouveau = self.instantane(type_etablissement)
+            precedent, soiree_precedente = self._derniers.get(type_etablissement, ({}, None))
+            if soiree_precedente != soiree:
+                precedent = {}
+            self._derniers[type_etablissement] = (nouveau, soiree)
+
+        changements = []
+        for service_id, ligne in nouveau.items():
+            ancienne = precedent.get(service_id)
+            if ancienne is None or ancienne['total'] != ligne['total'] or ancienne['position'] != ligne['position']:
+                changements.append({
+                    **ligne,
+                    'ancienne_position': ancienne['position'] if ancienne else None,
+                })
+        if not changements:
+            return None
+
+        message = {
+            'soiree': soiree,
+            'type': type_etablissement,
+            'etablissements': changements,
+        }
+        self.broker.publier(message)
+        return message
+
+    def etat_initial(self):
+        """Classement complet envoyé à un client qui se connecte"""
+        soiree = date_soiree_courante()
+        classements = {}
+        for type_etablissement, _ in Service.TYPE_CHOICES:
+            instantane = self.instantane(type_etablissement)
+            with self._verrou:
+                self._derniers[type_etablissement] = (instantane, soiree)
+            classements[type_etablissement] = list(instantane.values())
+        return {'soiree': soiree, 'classements': classements}
+
+
+diffuseur_classements = DiffuseurClassements()
+
+
+def signaler_consommation(service_id):
+    """Déclenche la diffusion après l'enregistrement d'une consommation"""
+    if not diffuseur_classements.broker.nombre_abonnes():
+        return
+    type_etablissement = Service.objects.filter(pk=service_id).values_list('type', flat=True).first()
+    if type_etablissement:
+        diffuseur_classements.signaler(type_etablissement)
+
+
+def evenement_sse(evenement, donnees):
+    """Formate un événement Server-Sent Events"""
+    return f"event: {evenement}\ndata: {json.dumps(donnees, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def flux_evenements(abonnement, etat_initial):
+    """Générateur asynchrone du flux SSE d'un client"""
+    try:
+        yield evenement_sse('classements', etat_initial)
+        while abonnement.actif:
+            try:
+                message = await abonnement.recevoir(timeout=INTERVALLE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Commentaire SSE pour garder la connexion ouverte à travers les proxys
+                yield ": heartbeat\n\n"
+                continue
+            yield evenement_sse('evolution', message)
+    finally:
+        abonnement.fermer()
@@ -0,0 +1,250 @@
+"""
+Génération de données synthétiques pour les tests de charge et de volumétrie
+
+Établissements, boissons, gestionnaires, participants, consommations, paris et
+trophées sont insérés par lots (bulk_create) sans passer par save() : les
+champs calculés (montant, date de soirée), le registre des pseudos et les
+cumuls de soirée sont donc renseignés ici, en une passe.
+
+Les heures de consommation suivent la fréquentation d'une soirée (pic entre
+22h et 2h) et quelques gros consommateurs concentrent les dépenses, comme
+dans les vrais classements. Avec la même graine, le jeu de données est
+identique d'une exécution à l'autre.
+"""
+import random
+from itertools import accumulate
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Service, TypeBoisson, Gestionnaire, Participant, ConsommationParticipant, Pari,
+    PseudoReserve, HEURE_OUVERTURE_SOIREE, date_soiree_courante, normaliser_pseudo,
+)
+
+
+TAILLE_LOT_DEFAUT = 10000
+
+# Prix de vente par catégorie (FCFA)
+PRIX_CATEGORIES = {
+    'champagne': Decimal('60000'),
+    'whisky': Decimal('35000'),
+    'liqueur': Decimal('15000'),
+    'g_guiness': Decimal('1000'),
+    'p_guiness': Decimal('700'),
+    'brakina': Decimal('700'),
+    'sobbra': Decimal('800'),
+    'soft': Decimal('500'),
+    'autre': Decimal('1500'),
+}
+CATEGORIES_BOITE = ['champagne', 'whisky', 'liqueur', 'soft', 'g_guiness', 'autre', 'brakina', 'sobbra', 'p_guiness']
+CATEGORIES_MAQUIS = ['brakina', 'sobbra', 'p_guiness', 'g_guiness', 'soft', 'liqueur', 'autre', 'whisky', 'champagne']
+
+# Fréquentation relative par heure, de l'ouverture (17h30) à la fermeture (11h00)
+FREQUENTATION_HORAIRE = [
+    (17, 1), (18, 2), (19, 4), (20, 6), (21, 9), (22, 12), (23, 14), (0, 14), (1, 12),
+    (2, 9), (3, 6), (4, 4), (5, 2), (6, 1), (7, 0.5), (8, 0.5), (9, 0.5), (10, 0.5),
+]
+QUANTITES = [1, 2, 3, 4, 6]
+POIDS_QUANTITES = [55, 25, 10, 6, 4]
+
+
+class GenerateurDonnees:
+    """
+    Générateur de jeu de données de taille connue
+    Args:
+        prefixe: préfixe des noms d'utilisateur et pseudos (évite les collisions entre deux jeux)
+        graine: graine du générateur aléatoire, pour reproduire le même jeu
+        taille_lot: nombre de lignes par insertion
+    """
+
+    def __init__(self, prefixe='synth', graine=None, taille_lot=TAILLE_LOT_DEFAUT, mot_de_passe='motdepasse'):
+        self.prefixe = prefixe
+        self.aleatoire = random.Random(graine)
+        self.taille_lot = taille_lot
+        # Un seul hachage pour tous les comptes : les tests de charge peuvent se connecter
+        self.mot_de_passe = make_password(mot_de_passe)
+        self._cumul_heures = list(accumulate(poids for _, poids in FREQUENTATION_HORAIRE))
+        self._cumul_quantites = list(accumulate(POIDS_QUANTITES))
+        self._creneaux = {}
+
+    def _creer_utilisateurs(self, usernames):
+        """Crée les comptes et renvoie leurs ids dans l'ordre des noms"""
+        User.objects.bulk_create(
+            [User(username=username, password=self.mot_de_passe, email=f'{username}@example.com')
+             for username in usernames],
+            batch_size=self.taille_lot
+        )
+        ids = dict(User.objects.filter(username__startswith=f'{self.prefixe}_').values_list('username', 'id'))
+        return [ids[username] for username in usernames]
+
+    def _reserver_pseudos(self, champ, comptes):
+        PseudoReserve.objects.bulk_create(
+            [PseudoReserve(normalise=normaliser_pseudo(compte.pseudo), pseudo=compte.pseudo, **{champ: compte})
+             for compte in comptes],
+            batch_size=self.taille_lot
+        )
+
+    def creer_etablissements(self, nombre, nombre_boissons, gestionnaires_par_etablissement, participants_par_etablissement):
+        """
+        Établissements avec leurs boissons, gestionnaires et participants
+        Returns:
+            list: un dict par établissement (service, boissons, gestionnaires, participants)
+        """
+        proprietaire_id, = self._creer_utilisateurs([f'{self.prefixe}_proprietaire'])
+        maintenant = timezone.now()
+        services = Service.objects.bulk_create([
+            Service(
+                nom=f'{self.prefixe.title()} {"Boîte" if numero % 2 else "Maquis"} {numero}',
+                type='boite' if numero % 2 else 'maquis',
+                localisation=f'Secteur {numero % 30 + 1}', adresse=f'Secteur {numero % 30 + 1}, Ouagadougou',
+                proprietaire_id=proprietaire_id, types_boissons_enregistres=True,
+                derniere_mise_a_jour_boissons=maintenant,
+            )
+            for numero in range(nombre)
+        ])
+        if services and services[0].pk is None:
+            services = list(Service.objects.filter(proprietaire_id=proprietaire_id).order_by('pk'))
+
+        boissons = TypeBoisson.objects.bulk_create([
+            TypeBoisson(service=service, categorie=categorie, prix_vente=PRIX_CATEGORIES[categorie])
+            for service in services
+            for categorie in (CATEGORIES_BOITE if service.type == 'boite' else CATEGORIES_MAQUIS)[:nombre_boissons]
+        ])
+        if boissons and boissons[0].pk is None:
+            boissons = list(TypeBoisson.objects.filter(service__in=services).order_by('pk'))
+
+        comptes = []
+        for service in services:
+            comptes += [('gestionnaire', service, rang) for rang in range(gestionnaires_par_etablissement)]
+            comptes += [('participant', service, rang) for rang in range(participants_par_etablissement)]
+        pseudos = [f'{self.prefixe}_{role[0]}{service.pk}_{rang}' for role, service, rang in comptes]
+        user_ids = self._creer_utilisateurs(pseudos)
+
+        gestionnaires, participants = [], []
+        for (role, service, rang), pseudo, user_id in zip(comptes, pseudos, user_ids):
+            if role == 'gestionnaire':
+                gestionnaires.append(Gestionnaire(
+                    user_id=user_id, pseudo=pseudo, service=service, tel='70000000',
+                    fonction='gerant' if rang == 0 else 'animateur'
+                ))
+            else:
+                participants.append(Participant(
+                    user_id=user_id, pseudo=pseudo, nom='Synthétique', prenom=str(rang), service=service
+                ))
+        Gestionnaire.objects.bulk_create(gestionnaires, batch_size=self.taille_lot)
+        Participant.objects.bulk_create(participants, batch_size=self.taille_lot)
+        # Les ids ne sont pas renvoyés par toutes les bases : relecture par établissement
+        gestionnaires = list(Gestionnaire.objects.filter(service__in=services).order_by('pk'))
+        participants = list(Participant.objects.filter(service__in=services).order_by('pk'))
+        self._reserver_pseudos('gestionnaire', gestionnaires)
+        self._reserver_pseudos('participant', participants)
+
+        etablissements = {
+            service.pk: {'service': service, 'boissons': [], 'gestionnaires': [], 'participants': [], 'parieurs': []}
+            for service in services
+        }
+        for boisson in boissons:
+            etablissements[boisson.service_id]['boissons'].append((boisson.pk, boisson.prix_vente))
+        for gestionnaire in gestionnaires:
+            etablissements[gestionnaire.service_id]['gestionnaires'].append(gestionnaire.pk)
+        for participant in participants:
+            etablissements[participant.service_id]['participants'].append(participant.pk)
+            etablissements[participant.service_id]['parieurs'].append(participant.user_id)
+        for etablissement in etablissements.values():
+            # Quelques gros consommateurs : poids décroissants (loi de Zipf)
+            nombre_participants = len(etablissement['participants'])
+            etablissement['cumul_participants'] = list(accumulate(1 / (rang + 1) for rang in range(nombre_participants)))
+            self.aleatoire.shuffle(etablissement['participants'])
+        return list(etablissements.values())
+
+    def _creneaux_soiree(self, soiree):
+        """Début (aware) et première seconde ouverte de chaque heure de la soirée, calculés une fois"""
+        if soiree not in self._creneaux:
+            creneaux = []
+            for heure, _ in FREQUENTATION_HORAIRE:
+                jour = soiree + timedelta(days=1) if heure < HEURE_OUVERTURE_SOIREE.hour else soiree
+                debut = timezone.make_aware(datetime(jour.year, jour.month, jour.day, heure))
+                premiere_seconde = HEURE_OUVERTURE_SOIREE.minute * 60 if heure == HEURE_OUVERTURE_SOIREE.hour else 0
+                creneaux.append((debut, premiere_seconde))
+            self._creneaux = {soiree: creneaux}
+        return self._creneaux[soiree]
+
+    def moment_consommation(self, soiree, limite=None):
+        """Instant tiré selon la fréquentation horaire d'une soirée (avant `limite` si fournie)"""
+        creneaux = self._creneaux_soiree(soiree)
+        ouverture = creneaux[0][0] + timedelta(seconds=creneaux[0][1])
+        if limite is not None and limite <= ouverture:
+            return None
+        debut, premiere_seconde = self.aleatoire.choices(creneaux, cum_weights=self._cumul_heures)[0]
+        moment = debut + timedelta(seconds=self.aleatoire.randrange(premiere_seconde, 3600))
+        if limite is not None and moment > limite:
+            # Soirée en cours : pas de consommation dans le futur
+            moment = ouverture + (limite - ouverture) * self.aleatoire.random()
+        return moment
+
+    def _consommations(self, etablissements, soirees, par_soiree):
+        maintenant = timezone.now()
+        soiree_courante = date_soiree_courante()
+        for soiree in soirees:
+            limite = maintenant if soiree == soiree_courante else None
+            for etablissement in etablissements:
+                if not etablissement['participants'] or not etablissement['boissons']:
+                    continue
+                service_id = etablissement['service'].pk
+                participants = self.aleatoire.choices(
+                    etablissement['participants'], cum_weights=etablissement['cumul_participants'], k=par_soiree
+                )
+                for participant_id in participants:
+                    moment = self.moment_consommation(soiree, limite)
+                    if moment is None:
+                        break
+                    boisson_id, prix = self.aleatoire.choice(etablissement['boissons'])
+                    quantite = self.aleatoire.choices(QUANTITES, cum_weights=self._cumul_quantites)[0]
+                    yield ConsommationParticipant(
+                        participant_id=participant_id, service_id=service_id, type_boisson_id=boisson_id,
+                        quantite=quantite, prix_unitaire=prix, montant_total=prix * quantite,
+                        date_consommation=moment, date_soiree=soiree,
+                        saisi_par_id=self.aleatoire.choice(etablissement['gestionnaires']),
+                    )
+
+    def _inserer_par_lots(self, modele, objets):
+        total = 0
+        lot = []
+        for objet in objets:
+            lot.append(objet)
+            if len(lot) >= self.taille_lot:
+                with transaction.atomic():
+                    modele.objects.bulk_create(lot)
+                total += len(lot)
+                lot = []
+        if lot:
+            with transaction.atomic():
+                modele.objects.bulk_create(lot)
+            total += len(lot)
+        return total
+
+    def creer_consommations(self, etablissements, soirees, par_soiree):
+        """Consommations de chaque établissement pour chaque soirée, insérées par lots"""
+        return self._inserer_par_lots(ConsommationParticipant, self._consommations(etablissements, soirees, par_soiree))
+
+    def creer_paris(self, etablissements, soirees, par_soiree):
+        """Paris de participants sur d'autres participants, répartis sur les soirées"""
+        participants = [participant_id for etablissement in etablissements for participant_id in etablissement['participants']]
+        parieurs = [user_id for etablissement in etablissements for user_id in etablissement['parieurs']]
+        if not participants:
+            return 0
+
+        def paris():
+            for soiree in soirees:
+                for _ in range(par_soiree):
+                    yield Pari(
+                        user_id=self.aleatoire.choice(parieurs), participant_id=self.aleatoire.choice(participants),
+                        montant=Decimal(self.aleatoire.choice([500, 1000, 2000, 5000])),
+                        evenement=self.aleatoire.choice(['GAIN', 'PERTE']), date_evenement=soiree,
+                    )
+        return self._inserer_par_lots(Pari, paris())
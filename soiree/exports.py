@@ -0,0 +1,147 @@
+"""
+Exports des consommations et des classements en flux continu
+
+Les lignes sont lues par lots avec un curseur côté serveur (iterator) et écrites
+au fur et à mesure : la mémoire utilisée ne dépend pas du nombre de lignes.
+"""
+import csv
+import tempfile
+
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import (
+    Service, TypeBoisson, ConsommationParticipant, ClassementQuotidien, ClassementEtablissement,
+)
+
+
+TAILLE_LOT_EXPORT = 2000
+
+COLONNES_CONSOMMATIONS = [
+    'Établissement', 'Participant', 'Type de boisson', 'Quantité', 'Prix unitaire',
+    'Montant total', 'Date consommation', 'Soirée', 'Saisi par',
+]
+
+
+def consommations_a_exporter(debut=None, fin=None, service_id=None):
+    """Consommations filtrées par soirée (bornes incluses) et par établissement"""
+    consommations = ConsommationParticipant.objects.order_by('pk')
+    if debut:
+        consommations = consommations.filter(date_soiree__gte=debut)
+    if fin:
+        consommations = consommations.filter(date_soiree__lte=fin)
+    if service_id:
+        consommations = consommations.filter(service_id=service_id)
+    return consommations.values_list(
+        'service__nom', 'participant__pseudo', 'type_boisson__categorie', 'quantite',
+        'prix_unitaire', 'montant_total', 'date_consommation', 'date_soiree', 'saisi_par__pseudo',
+    )
+
+
+def lignes_consommations(consommations):
+    """Génère les lignes de l'export, lot par lot"""
+    categories = dict(TypeBoisson.CATEGORIE_CHOICES)
+    for service, participant, categorie, quantite, prix, montant, date, soiree, saisi_par in (
+        consommations.iterator(chunk_size=TAILLE_LOT_EXPORT)
+    ):
+        yield [
+            service or 'N/A',
+            participant or 'N/A',
+            categories.get(categorie, 'N/A'),
+            quantite,
+            prix,
+            montant,
+            timezone.localtime(date).strftime('%d/%m/%Y %H:%M'),
+            soiree.strftime('%d/%m/%Y'),
+            saisi_par or 'N/A',
+        ]
+
+
+COLONNES_CLASSEMENTS_PARTICIPANTS = [
+    'Date', 'Type établissement', 'Participant', 'Établissement', 'Montant total', 'Position',
+]
+
+COLONNES_CLASSEMENTS_ETABLISSEMENTS = [
+    'Date', 'Type établissement', 'Établissement', 'Montant total', 'Position',
+]
+
+
+def _filtrer_classements(classements, debut, fin, type_etablissement):
+    if debut:
+        classements = classements.filter(date__gte=debut)
+    if fin:
+        classements = classements.filter(date__lte=fin)
+    if type_etablissement:
+        classements = classements.filter(type_etablissement=type_etablissement)
+    return classements
+
+
+def lignes_classements_participants(debut=None, fin=None, type_etablissement=None):
+    """Lignes des classements quotidiens des participants, lot par lot"""
+    types = dict(Service.TYPE_CHOICES)
+    classements = _filtrer_classements(
+        ClassementQuotidien.objects.order_by('date', 'type_etablissement', 'position'),
+        debut, fin, type_etablissement
+    ).values_list(
+        'date', 'type_etablissement', 'participant__pseudo', 'etablissement__nom', 'montant_total', 'position'
+    )
+    for date, type_etablissement, participant, etablissement, montant, position in (
+        classements.iterator(chunk_size=TAILLE_LOT_EXPORT)
+    ):
+        yield [
+            date.strftime('%d/%m/%Y'), types.get(type_etablissement, type_etablissement),
+            participant or 'N/A', etablissement or 'N/A', montant, position,
+        ]
+
+
+def lignes_classements_etablissements(debut=None, fin=None, type_etablissement=None):
+    """Lignes des classements quotidiens des établissements, lot par lot"""
+    types = dict(Service.TYPE_CHOICES)
+    classements = _filtrer_classements(
+        ClassementEtablissement.objects.order_by('date', 'type_etablissement', 'position'),
+        debut, fin, type_etablissement
+    ).values_list('date', 'type_etablissement', 'etablissement__nom', 'montant_total', 'position')
+    for date, type_etablissement, etablissement, montant, position in (
+        classements.iterator(chunk_size=TAILLE_LOT_EXPORT)
+    ):
+        yield [
+            date.strftime('%d/%m/%Y'), types.get(type_etablissement, type_etablissement),
+            etablissement or 'N/A', montant, position,
+        ]
+
+
+class _Tampon:
+    """Pseudo-fichier qui renvoie directement ce qu'on y écrit"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def flux_csv(lignes, colonnes):
+    """Génère le CSV ligne par ligne (séparateur « ; » et BOM pour Excel)"""
+    writer = csv.writer(_Tampon(), delimiter=';')
+    yield '\ufeff' + writer.writerow(colonnes)
+    for ligne in lignes:
+        yield writer.writerow(ligne)
+
+
+def fichier_xlsx(feuilles):
+    """
+    Écrit un classeur XLSX en mode write-only dans un fichier temporaire propre à la requête
+    openpyxl écrit les lignes sur disque au fur et à mesure au lieu de garder
+    les cellules en mémoire.
+    Args:
+        feuilles: liste de tuples (titre, colonnes, lignes)
+    Returns:
+        fichier temporaire positionné au début, à transmettre à FileResponse
+    """
+    classeur = Workbook(write_only=True)
+    for titre, colonnes, lignes in feuilles:
+        feuille = classeur.create_sheet(titre)
+        feuille.append(colonnes)
+        for ligne in lignes:
+            feuille.append(ligne)
+    fichier = tempfile.TemporaryFile()
+    classeur.save(fichier)
+    fichier.seek(0)
+    return fichier
@@ -1,3 +1,5 @@
+import uuid
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -5,6 +7,7 @@ from .models import (
     Service, TypeBoisson, Profile, Gestionnaire, Participant, 
     ConsommationParticipant, Trophee, Pari, DemandeAdhesion
 )
+from .saisie import QUANTITE_MAX_LIGNE
 
 
 class CustomUserRegistrationForm(UserCreationForm):
@@ -83,11 +86,11 @@ class CustomUserRegistrationForm(UserCreationForm):
 
 class DemandeAdhesionForm(forms.ModelForm):
     """Formulaire de demande d'adhésion depuis la page d'accueil"""
-    # Champ caché pour la vidéo enregistrée directement
-    recorded_video_data = forms.CharField(
+    # Champ caché : identifiant de la vidéo enregistrée directement, envoyée par blocs
+    televersement_video = forms.UUIDField(
         required=False,
         widget=forms.HiddenInput(),
-        help_text="Données de la vidéo enregistrée directement"
+        help_text="Vidéo enregistrée directement (voir soiree.televersement)"
     )
     
     class Meta:
@@ -257,6 +260,9 @@ class TypeBoissonForm(forms.ModelForm):
 
 class ConsommationParticipantForm(forms.ModelForm):
     """Formulaire pour enregistrer la consommation d'un participant"""
+    # Clé générée à l'affichage : un double envoi du même formulaire n'enregistre qu'une consommation
+    cle_idempotence = forms.UUIDField(required=False, widget=forms.HiddenInput, initial=uuid.uuid4)
+
     class Meta:
         model = ConsommationParticipant
         fields = ['participant', 'type_boisson', 'quantite', 'prix_unitaire']
@@ -394,3 +400,32 @@ class ServiceForm(forms.ModelForm):
 
 # Suppression des anciens formulaires qui ne sont plus nécessaires
 # class BilanForm, etc.
+
+
+class LigneConsommationForm(forms.Form):
+    """Ligne de la saisie par lot (les lignes sans quantité sont ignorées)"""
+    participant = forms.TypedChoiceField(coerce=int, required=False, widget=forms.Select(attrs={
+        'class': 'form-control'
+    }))
+    type_boisson = forms.TypedChoiceField(coerce=int, required=False, widget=forms.Select(attrs={
+        'class': 'form-control'
+    }))
+    quantite = forms.IntegerField(min_value=1, max_value=QUANTITE_MAX_LIGNE, required=False, widget=forms.NumberInput(attrs={
+        'class': 'form-control',
+        'min': '1',
+        'placeholder': 'Qté'
+    }))
+    prix_unitaire = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, widget=forms.NumberInput(attrs={
+        'class': 'form-control',
+        'step': '50',
+        'placeholder': 'Prix de la carte'
+    }))
+
+    def __init__(self, *args, participants=(), boissons=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        # Choix calculés une seule fois pour tout le formset
+        self.fields['participant'].choices = [('', '---------')] + list(participants)
+        self.fields['type_boisson'].choices = [('', '---------')] + list(boissons)
+
+
+LigneConsommationFormSet = forms.formset_factory(LigneConsommationForm, extra=10)
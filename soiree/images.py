@@ -0,0 +1,372 @@
+"""
+Variantes des images téléversées (vignette, carte, complète ; JPEG et WebP)
+
+Le fichier original est enregistré pendant la requête, débarrassé de ses
+métadonnées (EXIF, XMP, IPTC, commentaires) sans être réencodé : seuls les
+segments concernés sont retirés, l'orientation est conservée. Les variantes
+sont calculées après la validation de la transaction par un groupe de threads,
+puis enregistrées sur le modèle dans un champ JSON :
+
+    {'source': 'photos/participants/x.png',
+     'vignette': {'largeur': 128, 'hauteur': 128, 'jpeg': 'variantes/...jpg', 'webp': 'variantes/...webp'},
+     'carte': {...}, 'complete': {...}}
+
+Réglages :
+    IMAGES_TRAITEMENT_WORKERS : nombre de threads (2 par défaut, 0 pour
+        traiter immédiatement dans le thread appelant)
+    IMAGES_PIXELS_MAX : nombre de pixels au-delà duquel une image est refusée
+"""
+import io
+import logging
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import ExifTags, Image, ImageOps
+
+
+# Plus grand côté de chaque variante (la vignette est recadrée en carré)
+VARIANTES = {
+    'complete': 1080,
+    'carte': 400,
+    'vignette': 128,
+}
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+WORKERS_DEFAUT = 2
+# Modes que Image.reduce() sait traiter ; les autres (palette, 1 bit, 16 bits) sont convertis avant
+MODES_REDUCTION = ('L', 'LA', 'RGB', 'RGBA', 'RGBa', 'La', 'CMYK')
+# Au-delà, l'image est refusée sans être décodée (48 Mpx d'un téléphone récent : accepté)
+PIXELS_MAX_DEFAUT = 50_000_000
+# Orientation EXIF -> transposition qui remet l'image à l'endroit
+ROTATIONS_EXIF = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Segments JPEG de métadonnées : APP1 (EXIF, XMP), APP3 à APP13 (IPTC...), APP15, commentaire
+SEGMENTS_JPEG_RETIRES = {0xE1, *range(0xE3, 0xEE), 0xEF, 0xFE}
+# APP0 (JFIF), APP2 (profil ICC) et APP14 (Adobe) restent : ils règlent le rendu des couleurs
+CHUNKS_PNG_RETIRES = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+CHUNKS_WEBP_RETIRES = {b'EXIF', b'XMP '}
+
+logger = logging.getLogger(__name__)
+
+_executeur = None
+_verrou = threading.Lock()
+
+
+def _executeur_images():
+    global _executeur
+    with _verrou:
+        if _executeur is None:
+            _executeur = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGES_TRAITEMENT_WORKERS', WORKERS_DEFAUT),
+                thread_name_prefix='images'
+            )
+        return _executeur
+
+
+class ImageTropGrande(ValueError):
+    """Image dont le nombre de pixels dépasse IMAGES_PIXELS_MAX"""
+
+
+def verifier_dimensions(largeur, hauteur):
+    """Refuse une image trop grande d'après ses dimensions, avant tout décodage"""
+    limite = getattr(settings, 'IMAGES_PIXELS_MAX', PIXELS_MAX_DEFAUT)
+    if largeur * hauteur > limite:
+        raise ImageTropGrande(f"{largeur}×{hauteur} pixels : l'image dépasse {limite} pixels")
+
+
+def valider_dimensions_image(fichier):
+    """Validateur des champs image : les dimensions sont lues dans l'en-tête du fichier"""
+    largeur, hauteur = get_image_dimensions(fichier)
+    if largeur and hauteur:
+        try:
+            verifier_dimensions(largeur, hauteur)
+        except ImageTropGrande:
+            raise ValidationError(
+                "Image trop grande (%(largeur)s×%(hauteur)s pixels). Réduisez-la avant de l'envoyer.",
+                code='image_trop_grande', params={'largeur': largeur, 'hauteur': hauteur}
+            )
+
+
+class FormatNonReconnu(ValueError):
+    """Structure d'image inattendue : le contenu est réencodé par Pillow"""
+
+
+def _exif_orientation(orientation):
+    """Bloc EXIF minimal (en-tête Exif puis TIFF) ne portant que l'orientation"""
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    return exif.tobytes()
+
+
+def _jpeg_sans_metadonnees(contenu, orientation):
+    segments, position = [], 2
+    while True:
+        if contenu[position:position + 1] != b'\xff' or position + 2 > len(contenu):
+            raise FormatNonReconnu('marqueur JPEG attendu')
+        marqueur = contenu[position + 1]
+        if marqueur == 0xFF:
+            position += 1  # octet de remplissage
+            continue
+        if marqueur == 0xD9:
+            break  # fin d'image : ce qui suit (images secondaires MPF) est abandonné
+        longueur, = struct.unpack('>H', contenu[position + 2:position + 4])
+        fin = position + 2 + longueur
+        if fin > len(contenu):
+            raise FormatNonReconnu('segment JPEG tronqué')
+        if marqueur == 0xDA:
+            # Données compressées : jusqu'au prochain marqueur qui n'est ni 0xFF00 ni RSTn
+            while True:
+                fin = contenu.find(b'\xff', fin)
+                if fin < 0:
+                    raise FormatNonReconnu('fin de JPEG manquante')
+                if contenu[fin + 1] != 0 and not 0xD0 <= contenu[fin + 1] <= 0xD7:
+                    break
+                fin += 2
+        mpf = marqueur == 0xE2 and contenu[position + 4:position + 8] == b'MPF\x00'
+        if marqueur not in SEGMENTS_JPEG_RETIRES and not mpf:
+            segments.append(contenu[position:fin])
+        position = fin
+    if orientation in ROTATIONS_EXIF:
+        exif = _exif_orientation(orientation)
+        # Après l'APP0 JFIF, qui doit suivre immédiatement le début d'image
+        indice = 1 if segments and segments[0][1] == 0xE0 else 0
+        segments.insert(indice, b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif)
+    return b''.join([b'\xff\xd8', *segments, b'\xff\xd9'])
+
+
+def _png_sans_metadonnees(contenu, orientation):
+    chunks, position = [], 8
+    while True:
+        if position + 12 > len(contenu):
+            raise FormatNonReconnu('fin de PNG manquante')
+        longueur, = struct.unpack('>I', contenu[position:position + 4])
+        type_ = contenu[position + 4:position + 8]
+        fin = position + 12 + longueur
+        if type_ not in CHUNKS_PNG_RETIRES:
+            chunks.append(contenu[position:fin])
+        if type_ == b'IHDR' and orientation in ROTATIONS_EXIF:
+            exif = b'eXIf' + _exif_orientation(orientation)[6:]
+            chunks.append(struct.pack('>I', len(exif) - 4) + exif + struct.pack('>I', zlib.crc32(exif)))
+        if type_ == b'IEND':
+            break
+        position = fin
+    return b''.join([contenu[:8], *chunks])
+
+
+def _webp_sans_metadonnees(contenu, orientation):
+    chunks, position = [], 12
+    while position + 8 <= len(contenu):
+        type_ = contenu[position:position + 4]
+        longueur, = struct.unpack('<I', contenu[position + 4:position + 8])
+        fin = position + 8 + longueur + longueur % 2
+        if type_ == b'VP8X':
+            # Drapeaux EXIF (0x08) et XMP (0x04) du conteneur étendu
+            drapeaux = contenu[position + 8] & ~0x0C | (0x08 if orientation in ROTATIONS_EXIF else 0)
+            chunks.append(contenu[position:position + 8] + bytes([drapeaux]) + contenu[position + 9:fin])
+        elif type_ not in CHUNKS_WEBP_RETIRES:
+            chunks.append(contenu[position:fin])
+        position = fin
+    if any(chunk[:4] == b'VP8X' for chunk in chunks) and orientation in ROTATIONS_EXIF:
+        exif = _exif_orientation(orientation)[6:]
+        chunks.append(b'EXIF' + struct.pack('<I', len(exif)) + exif + b'\x00' * (len(exif) % 2))
+    corps = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(corps)) + corps
+
+
+RETRAITS_METADONNEES = {
+    'JPEG': _jpeg_sans_metadonnees,
+    'MPO': _jpeg_sans_metadonnees,
+    'PNG': _png_sans_metadonnees,
+    'WEBP': _webp_sans_metadonnees,
+}
+
+
+def retirer_metadonnees(contenu):
+    """
+    Contenu d'une image sans ses métadonnées
+    JPEG, PNG et WebP sont recopiés segment par segment sans les blocs de
+    métadonnées (pas de décodage) ; seule l'orientation EXIF est réécrite.
+    Les autres formats qui portent des métadonnées sont réencodés par Pillow.
+    Returns:
+        bytes: contenu nettoyé
+    """
+    with Image.open(io.BytesIO(contenu)) as image:
+        verifier_dimensions(*image.size)
+        format_ = image.format
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        if format_ in RETRAITS_METADONNEES:
+            try:
+                return RETRAITS_METADONNEES[format_](contenu, orientation)
+            except (FormatNonReconnu, struct.error, IndexError):
+                logger.info("Structure %s inattendue : image réencodée pour retirer ses métadonnées", format_)
+        elif not ({'exif', 'xmp', 'comment'} & set(image.info) or image.getexif()):
+            return contenu
+        options = {'save_all': True} if getattr(image, 'n_frames', 1) > 1 else {}
+        if orientation in ROTATIONS_EXIF:
+            image, options = image.transpose(ROTATIONS_EXIF[orientation]), {}
+        else:
+            image.load()
+        for cle in ('exif', 'xmp', 'comment'):
+            image.info.pop(cle, None)
+        image.getexif().clear()
+        if format_ in ('JPEG', 'MPO'):
+            format_, options = 'JPEG', {'quality': 90}
+        sortie = io.BytesIO()
+        image.save(sortie, format=format_, **options)
+        return sortie.getvalue()
+
+
+def ouvrir_image(fichier, cote=None):
+    """
+    Décode une image à l'échelle utile pour des variantes de `cote` pixels au plus
+    Les dimensions sont vérifiées sur l'en-tête, puis le JPEG est décodé
+    directement à 1/2, 1/4 ou 1/8 (draft) et les autres formats réduits d'un
+    facteur entier dès la lecture : l'image pleine résolution n'est jamais
+    convertie ni copiée. L'orientation EXIF est lue dans l'en-tête et appliquée
+    sur l'image réduite ; les métadonnées ne sont pas conservées.
+    Returns:
+        Image: image RVB orientée, dont le grand côté reste au moins égal à `cote`
+    """
+    cote = cote or max(VARIANTES.values())
+    with Image.open(fichier) as originale:
+        verifier_dimensions(*originale.size)
+        orientation = originale.getexif().get(ExifTags.Base.Orientation, 1)
+        # Taille cible : le grand côté à `cote`, le petit côté suffisant pour la vignette
+        echelle = max(originale.size) / cote
+        if echelle > 1:
+            originale.draft('RGB', tuple(max(1, int(dimension / echelle)) for dimension in originale.size))
+        facteur = max(1, min(
+            max(originale.size) // cote, min(originale.size) // VARIANTES['vignette']
+        ))
+        if facteur > 1 and originale.mode not in MODES_REDUCTION:
+            # GIF / PNG à palette, images 1 bit ou 16 bits : reduce() les refuse
+            originale = originale.convert('RGBA' if originale.has_transparency_data else 'RGB')
+        image = originale.reduce(facteur) if facteur > 1 else originale.copy()
+    if orientation in ROTATIONS_EXIF:
+        image = image.transpose(ROTATIONS_EXIF[orientation])
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.info = {}
+    return image
+
+
+def reduire_variantes(image):
+    """
+    Variantes successives d'une image décodée, de la plus grande à la plus petite
+    Chaque taille est réduite à partir de la précédente, ce qui évite de
+    rééchantillonner plusieurs fois l'original.
+    """
+    for taille, cote in VARIANTES.items():
+        if taille == 'vignette':
+            image = ImageOps.fit(image, (cote, cote), Image.Resampling.LANCZOS)
+        else:
+            image = image.copy()
+            image.thumbnail((cote, cote), Image.Resampling.LANCZOS)
+        yield taille, image
+
+
+def encoder(image, format_):
+    """Contenu encodé d'une variante (sans métadonnées)"""
+    _, options = FORMATS[format_]
+    sortie = io.BytesIO()
+    image.save(sortie, format=format_.upper(), **options)
+    return sortie.getvalue()
+
+
+def generer_variantes(fichier):
+    """
+    Calcule et enregistre les variantes d'une image
+    Returns:
+        dict: description des variantes (voir l'en-tête du module)
+    """
+    dossier, nom = os.path.split(fichier.name)
+    chemin_base = os.path.join('variantes', dossier, os.path.splitext(nom)[0])
+    variantes = {'source': fichier.name}
+
+    fichier.open('rb')
+    try:
+        image = ouvrir_image(fichier)
+    finally:
+        fichier.close()
+    for taille, reduite in reduire_variantes(image):
+        variantes[taille] = {'largeur': reduite.width, 'hauteur': reduite.height}
+        for format_, (extension, _) in FORMATS.items():
+            variantes[taille][format_] = default_storage.save(
+                f'{chemin_base}_{taille}.{extension}', ContentFile(encoder(reduite, format_))
+            )
+    return variantes
+
+
+def traiter_image(modele, pk, champ, champ_variantes):
+    """
+    Tâche du groupe de threads : calcule les variantes d'une image et les enregistre
+    Les variantes ne sont pas écrites si l'image a été remplacée entre-temps.
+    """
+    try:
+        modele = apps.get_model(modele)
+        instance = modele.objects.filter(pk=pk).first()
+        fichier = getattr(instance, champ, None)
+        if not fichier:
+            return None
+        try:
+            variantes = generer_variantes(fichier)
+        except (OSError, ImageTropGrande, Image.DecompressionBombError) as e:
+            logger.warning("Variantes impossibles pour %s : %s", fichier.name, e)
+            return None
+        modele.objects.filter(pk=pk, **{champ: fichier.name}).update(**{champ_variantes: variantes})
+        return variantes
+    except Exception:
+        # Erreur inattendue : journalisée ici, sinon perdue dans le Future (ou remontée
+        # jusqu'à la requête quand le traitement est immédiat)
+        logger.exception("Erreur pendant le calcul des variantes de %s #%s (%s)", modele, pk, champ)
+        return None
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def planifier_variantes(instance, champ, champ_variantes):
+    """Confie le calcul des variantes au groupe de threads, après validation de la transaction"""
+    arguments = (instance._meta.label, instance.pk, champ, champ_variantes)
+
+    def soumettre():
+        if getattr(settings, 'IMAGES_TRAITEMENT_WORKERS', WORKERS_DEFAUT) == 0:
+            traiter_image(*arguments)
+        else:
+            _executeur_images().submit(traiter_image, *arguments)
+
+    transaction.on_commit(soumettre)
+
+
+def url_variante(fichier, variantes, taille, format_='jpeg'):
+    """
+    URL de la variante demandée
+    Sans variante (pas encore calculée), l'original (sans métadonnées) pour le JPEG et rien pour
+    les autres formats : une source <picture> vide est ignorée par le navigateur.
+    """
+    chemin = (variantes or {}).get(taille, {}).get(format_)
+    if chemin and (variantes or {}).get('source') == getattr(fichier, 'name', None):
+        return default_storage.url(chemin)
+    if format_ == 'jpeg' and fichier:
+        return fichier.url
+    return ''
@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from soiree.attribution_trophees import SoireeNonTerminee, attribuer_trophees
+from soiree.classements import derniere_soiree_terminee
+
+
+class Command(BaseCommand):
+    help = 'Attribue les trophées des soirées terminées (rattrapage possible sur une période)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Soirée à traiter (AAAA-MM-JJ), par défaut la dernière soirée terminée')
+        parser.add_argument('--fin', help='Dernière soirée à traiter pour une période (AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        try:
+            debut = date.fromisoformat(options['date']) if options['date'] else derniere_soiree_terminee()
+            fin = date.fromisoformat(options['fin']) if options['fin'] else debut
+        except ValueError as e:
+            raise CommandError(f'Date invalide : {e}')
+        if fin < debut:
+            raise CommandError('La date de fin doit être postérieure à la date de début.')
+
+        try:
+            crees = attribuer_trophees(debut, fin)
+        except SoireeNonTerminee:
+            raise CommandError(f'La soirée du {fin} n\'est pas terminée.')
+
+        self.stdout.write(self.style.SUCCESS(f'🏆 {crees} trophée(s) attribué(s) du {debut} au {fin}'))
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from soiree.charge import BaseNonJetable, comparer, lancer_charge
+
+
+class Command(BaseCommand):
+    help = 'Banc de charge : utilisateurs virtuels concurrents et latences p50/p95/p99 par point d\'accès'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateurs', type=int, default=10, help='Nombre d\'utilisateurs virtuels simultanés')
+        parser.add_argument('--duree', type=float, default=30, help='Durée de la charge en secondes')
+        parser.add_argument('--url', help='Serveur local à solliciter (ex. http://127.0.0.1:8000), sinon en processus')
+        parser.add_argument('--graine', type=int, default=None, help='Graine aléatoire des parcours')
+        parser.add_argument('--prefixe', default='synth', help='Préfixe des comptes à utiliser (voir generer_donnees)')
+        parser.add_argument('--mot-de-passe', default='motdepasse', help='Mot de passe de ces comptes')
+        parser.add_argument(
+            '--base-jetable', action='store_true',
+            help='En processus : autorise l\'écriture dans la base configurée (les données créées sont supprimées à la fin)'
+        )
+        parser.add_argument('--enregistrer', help='Fichier JSON où enregistrer le résultat comme référence')
+        parser.add_argument('--reference', help='Fichier JSON de référence à comparer')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Hausse relative du p95 tolérée (0.25 = 25 %%)')
+
+    def handle(self, *args, **options):
+        if options['utilisateurs'] < 1 or options['duree'] <= 0:
+            raise CommandError('Le nombre d\'utilisateurs et la durée doivent être positifs.')
+        reference = None
+        if options['reference']:
+            try:
+                reference = json.loads(Path(options['reference']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Référence illisible : {e}')
+
+        cible = options['url'] or 'client de test en processus'
+        self.stdout.write(f'🚦 {options["utilisateurs"]} utilisateur(s) pendant {options["duree"]:.0f} s ({cible})...')
+        try:
+            resultat = lancer_charge(
+                options['utilisateurs'], options['duree'], url=options['url'],
+                graine=options['graine'], mot_de_passe=options['mot_de_passe'], prefixe=options['prefixe'],
+                base_jetable=options['base_jetable']
+            )
+        except BaseNonJetable as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'{"Point d’accès":<36} {"req.":>7} {"err.":>5} {"req/s":>7} {"p50":>8} {"p95":>8} {"p99":>8}')
+        for point, mesure in resultat['points'].items():
+            self.stdout.write(
+                f'{point:<36} {mesure["requetes"]:>7} {mesure["erreurs"]:>5} {mesure["debit"]:>7} '
+                f'{mesure["p50_ms"]:>8} {mesure["p95_ms"]:>8} {mesure["p99_ms"]:>8}'
+            )
+
+        if options['enregistrer']:
+            resultat['date'] = timezone.now().isoformat()
+            resultat['parametres'] = {cle: options[cle] for cle in ('utilisateurs', 'duree', 'url', 'graine', 'prefixe')}
+            Path(options['enregistrer']).write_text(json.dumps(resultat, indent=2, ensure_ascii=False))
+            self.stdout.write(f'💾 Référence enregistrée dans {options["enregistrer"]}')
+
+        if reference is not None:
+            regressions = comparer(resultat, reference, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(f'   - {regression}'))
+                raise CommandError(f'{len(regressions)} régression(s) par rapport à {options["reference"]}')
+            self.stdout.write(self.style.SUCCESS('✅ Aucune régression par rapport à la référence'))
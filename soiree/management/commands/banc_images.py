@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageOps
+
+from soiree.images import FORMATS, encoder, ouvrir_image, reduire_variantes
+
+
+def decodage_complet(chemin):
+    """Ancien traitement : l'original est décodé, orienté et converti en pleine résolution"""
+    with Image.open(chemin) as originale:
+        image = ImageOps.exif_transpose(originale)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return image
+
+
+def decodage_reduit(chemin):
+    return ouvrir_image(chemin)
+
+
+TRAITEMENTS = {
+    'complet': decodage_complet,
+    'reduit': decodage_reduit,
+}
+
+
+def _creer_image(chemin, largeur, hauteur, format_):
+    """Photo de test : dégradé bruité (le bruit empêche une compression irréaliste)"""
+    fond = Image.linear_gradient('L').resize((largeur, hauteur))
+    bruit = Image.effect_noise((largeur, hauteur), 40)
+    image = Image.merge('RGB', (fond, bruit, fond.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # photo de téléphone tenu verticalement
+    image.save(chemin, format=format_.upper(), exif=exif, **({'quality': 92} if format_ == 'jpeg' else {}))
+
+
+def _mesurer(traitement, chemin, resultats):
+    """Exécuté dans un processus neuf : pic de mémoire propre à ce traitement"""
+    avant = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    debut = time.perf_counter()
+    image = TRAITEMENTS[traitement](chemin)
+    for _, variante in reduire_variantes(image):
+        for format_ in FORMATS:
+            encoder(variante, format_)
+    duree = time.perf_counter() - debut
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - avant
+    resultats.put((duree, pic))
+
+
+class Command(BaseCommand):
+    help = "Compare mémoire et durée du calcul des variantes d'images : décodage complet ou réduit"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--largeur', type=int, default=8000)
+        parser.add_argument('--hauteur', type=int, default=6000)
+        parser.add_argument('--format', choices=['jpeg', 'png'], default='jpeg')
+        parser.add_argument('--repetitions', type=int, default=3)
+        parser.add_argument('--image', help='Image à traiter (par défaut, une photo générée)')
+
+    def handle(self, *args, **options):
+        contexte = multiprocessing.get_context('fork')
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = options['image']
+            if chemin is None:
+                chemin = os.path.join(dossier, f"photo.{options['format']}")
+                # Générée dans un processus à part : le banc démarre avec une mémoire propre
+                generation = contexte.Process(
+                    target=_creer_image,
+                    args=(chemin, options['largeur'], options['hauteur'], options['format'])
+                )
+                generation.start()
+                generation.join()
+            elif not os.path.exists(chemin):
+                raise CommandError(f'Image introuvable : {chemin}')
+
+            with Image.open(chemin) as image:
+                self.stdout.write(
+                    f'🖼️ {image.format} {image.width}×{image.height} '
+                    f'({os.path.getsize(chemin) / 1e6:.1f} Mo), {options["repetitions"]} répétition(s)'
+                )
+
+            for traitement in TRAITEMENTS:
+                durees, pics = [], []
+                for _ in range(options['repetitions']):
+                    resultats = contexte.Queue()
+                    processus = contexte.Process(target=_mesurer, args=(traitement, chemin, resultats))
+                    processus.start()
+                    duree, pic = resultats.get()
+                    processus.join()
+                    durees.append(duree)
+                    pics.append(pic)
+                self.stdout.write(
+                    f'  {traitement:8} durée médiane {sorted(durees)[len(durees) // 2] * 1000:8.1f} ms'
+                    f'   pic mémoire {max(pics) / 1024:8.1f} Mo'
+                )
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from soiree.stockage import DOSSIER_CONTENU
+from soiree.televersement import DOSSIER_PARTIELS
+
+
+class Command(BaseCommand):
+    help = "Range les médias existants dans le stockage adressé par contenu : les doublons deviennent des liens"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation', action='store_true', help="Affiche les doublons sans rien modifier")
+        parser.add_argument('--purger', action='store_true', help="Supprime aussi les contenus qui ne sont plus utilisés")
+
+    def fichiers_media(self):
+        ignores = {DOSSIER_CONTENU, DOSSIER_PARTIELS}
+        for dossier, sous_dossiers, fichiers in os.walk(default_storage.location):
+            relatif = os.path.relpath(dossier, default_storage.location).replace('\\', '/')
+            sous_dossiers[:] = [
+                nom for nom in sous_dossiers if os.path.normpath(f'{relatif}/{nom}').replace('\\', '/') not in ignores
+            ]
+            for nom in sorted(fichiers):
+                yield os.path.normpath(f'{relatif}/{nom}').replace('\\', '/')
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'indexer'):
+            raise CommandError("Le stockage par défaut n'est pas adressé par contenu (réglage STORAGES).")
+
+        nombre, liberes = 0, 0
+        empreintes = {}
+        for name in self.fichiers_media():
+            nombre += 1
+            if options['simulation']:
+                with default_storage.open(name, 'rb') as fichier:
+                    empreinte = hashlib.file_digest(fichier, 'sha256').hexdigest()
+                etat = os.stat(default_storage.path(name))
+                inodes = empreintes.setdefault(empreinte, set())
+                if inodes and etat.st_ino not in inodes:
+                    self.stdout.write(f'  doublon : {name}')
+                    liberes += etat.st_size
+                inodes.add(etat.st_ino)
+                continue
+            economise = default_storage.indexer(name)
+            if economise:
+                self.stdout.write(f'  🔗 {name}')
+                liberes += economise
+
+        verbe = 'libérables' if options['simulation'] else 'libérés'
+        self.stdout.write(f'📁 {nombre} fichier(s) examiné(s), {filesizeformat(liberes)} {verbe}')
+
+        if options['purger'] and not options['simulation']:
+            purges = 0
+            for chemin in list(default_storage.contenus_orphelins()):
+                os.remove(chemin)
+                purges += 1
+            self.stdout.write(f'🧹 {purges} contenu(s) inutilisé(s) supprimé(s)')
+
+        self.stdout.write(self.style.SUCCESS('✅ Médias dédupliqués' if not options['simulation'] else '✅ Simulation terminée'))
@@ -0,0 +1,76 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from soiree.attribution_trophees import attribuer_trophees
+from soiree.classements import derniere_soiree_terminee, reconstruire_ventes_soiree
+from soiree.donnees_synthetiques import GenerateurDonnees, TAILLE_LOT_DEFAUT
+from soiree.models import date_soiree_courante
+from soiree.reglement_paris import regler_paris
+from soiree.versions import PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS, incrementer_version
+
+
+class Command(BaseCommand):
+    help = 'Génère un jeu de données synthétique de taille connue (tests de charge et de volumétrie)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--etablissements', type=int, default=20, help='Nombre d\'établissements (moitié maquis, moitié boîtes)')
+        parser.add_argument('--boissons', type=int, default=6, help='Types de boissons par établissement (9 au maximum)')
+        parser.add_argument('--gestionnaires', type=int, default=2, help='Gestionnaires par établissement')
+        parser.add_argument('--participants', type=int, default=50, help='Participants par établissement')
+        parser.add_argument('--soirees', type=int, default=30, help='Nombre de soirées, jusqu\'à la soirée en cours')
+        parser.add_argument('--consommations', type=int, default=200, help='Consommations par établissement et par soirée')
+        parser.add_argument('--paris', type=int, default=50, help='Paris par soirée')
+        parser.add_argument('--prefixe', default='synth', help='Préfixe des comptes générés')
+        parser.add_argument('--graine', type=int, default=None, help='Graine aléatoire pour reproduire le même jeu')
+        parser.add_argument('--lot', type=int, default=TAILLE_LOT_DEFAUT, help='Lignes par insertion')
+        parser.add_argument('--mot-de-passe', default='motdepasse', help='Mot de passe de tous les comptes générés')
+
+    def handle(self, *args, **options):
+        if options['gestionnaires'] < 1:
+            raise CommandError('Il faut au moins un gestionnaire par établissement pour saisir les consommations.')
+        if not 1 <= options['boissons'] <= 9:
+            raise CommandError('Le nombre de types de boissons doit être compris entre 1 et 9.')
+        if options['soirees'] < 1 or options['lot'] < 1:
+            raise CommandError('Les nombres de soirées et de lignes par lot doivent être positifs.')
+        if User.objects.filter(username__startswith=f'{options["prefixe"]}_').exists():
+            raise CommandError(f'Des comptes « {options["prefixe"]}_… » existent déjà : choisissez un autre --prefixe.')
+
+        generateur = GenerateurDonnees(
+            prefixe=options['prefixe'], graine=options['graine'], taille_lot=options['lot'],
+            mot_de_passe=options['mot_de_passe']
+        )
+        fin = date_soiree_courante()
+        debut = fin - timedelta(days=options['soirees'] - 1)
+        soirees = [debut + timedelta(days=jour) for jour in range(options['soirees'])]
+        depart = time.perf_counter()
+
+        self.stdout.write('🏗️  Établissements, boissons et comptes...')
+        etablissements = generateur.creer_etablissements(
+            options['etablissements'], options['boissons'], options['gestionnaires'], options['participants']
+        )
+        self.stdout.write(f'🍺 Consommations du {debut} au {fin}...')
+        nombre_consommations = generateur.creer_consommations(etablissements, soirees, options['consommations'])
+        self.stdout.write(f'   - {nombre_consommations} consommation(s) ({time.perf_counter() - depart:.1f} s)')
+        nombre_paris = generateur.creer_paris(etablissements, soirees, options['paris'])
+
+        self.stdout.write('🔄 Cumuls de soirée...')
+        reconstruire_ventes_soiree(debut, fin)
+        nombre_trophees = 0
+        derniere_terminee = derniere_soiree_terminee()
+        if debut <= derniere_terminee:
+            self.stdout.write('🏆 Règlement des paris et trophées des soirées terminées...')
+            for soiree in soirees[:-1]:
+                regler_paris(soiree)
+            nombre_trophees = attribuer_trophees(debut, derniere_terminee)
+        incrementer_version(PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(etablissements)} établissement(s), '
+            f'{sum(len(e["participants"]) for e in etablissements)} participant(s), '
+            f'{nombre_consommations} consommation(s), {nombre_paris} pari(s), {nombre_trophees} trophée(s) '
+            f'en {time.perf_counter() - depart:.1f} s'
+        ))
+        self.stdout.write('ℹ️  Redémarrez le serveur pour recharger le tableau des classements en mémoire.')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from soiree.images import traiter_image
+from soiree.models import Gestionnaire, Participant, Profile, Trophee
+
+
+class Command(BaseCommand):
+    help = "Calcule les variantes (vignette, carte, complète) des images qui n'en ont pas encore"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--toutes', action='store_true', help='Recalcule aussi les variantes existantes')
+
+    def handle(self, *args, **options):
+        total = 0
+        for modele in (Profile, Gestionnaire, Participant, Trophee):
+            for champ, champ_variantes in modele.champs_variantes.items():
+                images = modele.objects.exclude(**{champ: ''}).exclude(**{f'{champ}__isnull': True})
+                for pk, nom, variantes in images.values_list('pk', champ, champ_variantes).iterator():
+                    if not options['toutes'] and (variantes or {}).get('source') == nom:
+                        continue
+                    if traiter_image(modele._meta.label, pk, champ, champ_variantes):
+                        total += 1
+            self.stdout.write(f'🖼️ {modele._meta.verbose_name_plural}: variantes à jour')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} image(s) traitée(s)'))
@@ -0,0 +1,33 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from soiree.classements import derniere_soiree_terminee, materialiser_classements
+
+
+class Command(BaseCommand):
+    help = 'Calcule les classements quotidiens des participants et des établissements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Soirée à classer (AAAA-MM-JJ), par défaut la dernière soirée terminée')
+        parser.add_argument('--fin', help='Dernière soirée à classer pour traiter une période (AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        try:
+            debut = date.fromisoformat(options['date']) if options['date'] else derniere_soiree_terminee()
+            fin = date.fromisoformat(options['fin']) if options['fin'] else debut
+        except ValueError as e:
+            raise CommandError(f'Date invalide : {e}')
+        if fin < debut:
+            raise CommandError('La date de fin doit être postérieure à la date de début.')
+
+        soiree = debut
+        while soiree <= fin:
+            nb_participants, nb_etablissements = materialiser_classements(soiree)
+            self.stdout.write(
+                f'🏆 {soiree}: {nb_participants} participant(s) et '
+                f'{nb_etablissements} établissement(s) classés'
+            )
+            soiree += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS('✅ Classements enregistrés'))
@@ -0,0 +1,64 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from soiree.nettoyage_media import (
+    TAILLE_LOT, demandes_rejetees, medias_orphelins, televersements_abandonnes, televersements_rejetes,
+)
+
+
+class Command(BaseCommand):
+    help = "Supprime (ou liste avec --simulation) les médias qui ne sont plus référencés par aucun modèle"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation', action='store_true', help='Liste les fichiers orphelins sans les supprimer')
+        parser.add_argument(
+            '--age', type=float, default=24,
+            help='Âge minimal des fichiers à supprimer et des rejets de demandes, en heures (24 par défaut)'
+        )
+        parser.add_argument('--lot', type=int, default=TAILLE_LOT, help='Lignes lues par requête')
+        parser.add_argument('--details', action='store_true', help='Affiche chaque fichier')
+
+    def handle(self, *args, **options):
+        if options['age'] < 0 or options['lot'] <= 0:
+            raise CommandError("L'âge doit être positif et la taille de lot strictement positive.")
+        age = timedelta(hours=options['age'])
+        simulation = options['simulation']
+
+        nombre, octets = 0, 0
+        for nom, taille in medias_orphelins(age, options['lot']):
+            nombre += 1
+            octets += taille
+            if options['details'] or simulation:
+                self.stdout.write(f'  {nom} ({filesizeformat(taille)})')
+            if not simulation:
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, nom))
+                except FileNotFoundError:
+                    pass
+
+        verbe = 'à supprimer' if simulation else 'supprimé(s)'
+        self.stdout.write(f'🗑️ {nombre} fichier(s) orphelin(s) {verbe}, {filesizeformat(octets)}')
+        if simulation:
+            self.stdout.write(self.style.SUCCESS('✅ Simulation terminée'))
+            return
+
+        # Lignes qui désignaient les fichiers supprimés
+        demandes_rejetees(age).exclude(video_etablissement='', miniature_video='').update(
+            video_etablissement='', miniature_video=''
+        )
+        abandonnes, _ = televersements_abandonnes(age).delete()
+        rejetes, _ = televersements_rejetes(age).delete()
+        if abandonnes or rejetes:
+            self.stdout.write(f'🎥 {abandonnes + rejetes} envoi(s) de vidéo abandonné(s) ou rejeté(s) oublié(s)')
+        if hasattr(default_storage, 'contenus_orphelins'):
+            purges = 0
+            for chemin in list(default_storage.contenus_orphelins()):
+                os.remove(chemin)
+                purges += 1
+            self.stdout.write(f'🧹 {purges} contenu(s) dédupliqué(s) libéré(s)')
+        self.stdout.write(self.style.SUCCESS('✅ Médias nettoyés'))
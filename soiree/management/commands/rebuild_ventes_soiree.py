@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from soiree.classements import reconstruire_ventes_soiree
+
+
+class Command(BaseCommand):
+    help = 'Reconstruit les cumuls de ventes par soirée à partir des consommations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', help='Première soirée à reconstruire (AAAA-MM-JJ)')
+        parser.add_argument('--fin', help='Dernière soirée à reconstruire (AAAA-MM-JJ)')
+        parser.add_argument(
+            '--verifier', action='store_true',
+            help='Signaler les écarts sans corriger les cumuls'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            debut = date.fromisoformat(options['debut']) if options['debut'] else None
+            fin = date.fromisoformat(options['fin']) if options['fin'] else None
+        except ValueError as e:
+            raise CommandError(f'Date invalide : {e}')
+
+        corriger = not options['verifier']
+        self.stdout.write('🔄 Réconciliation des cumuls de soirée...')
+        resultats = reconstruire_ventes_soiree(debut, fin, corriger=corriger)
+
+        total_ecarts = 0
+        for modele, ecarts in resultats.items():
+            total_ecarts += sum(ecarts.values())
+            self.stdout.write(
+                f'   - {modele}: {ecarts["manquants"]} manquant(s), '
+                f'{ecarts["incorrects"]} incorrect(s), {ecarts["orphelins"]} orphelin(s)'
+            )
+
+        if not total_ecarts:
+            self.stdout.write(self.style.SUCCESS('✅ Cumuls cohérents avec les consommations'))
+        elif corriger:
+            self.stdout.write(self.style.SUCCESS(f'🎉 {total_ecarts} écart(s) corrigé(s)'))
+        else:
+            self.stdout.write(self.style.WARNING(f'⚠ {total_ecarts} écart(s) détecté(s)'))
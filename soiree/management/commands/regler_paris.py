@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from soiree.classements import derniere_soiree_terminee
+from soiree.reglement_paris import SoireeNonTerminee, regler_paris
+
+
+class Command(BaseCommand):
+    help = 'Règle les paris ouverts à partir des consommations de la soirée'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Soirée à régler (AAAA-MM-JJ), par défaut la dernière soirée terminée')
+        parser.add_argument('--fin', help='Dernière soirée à régler pour traiter une période (AAAA-MM-JJ)')
+
+    def handle(self, *args, **options):
+        try:
+            debut = date.fromisoformat(options['date']) if options['date'] else derniere_soiree_terminee()
+            fin = date.fromisoformat(options['fin']) if options['fin'] else debut
+        except ValueError as e:
+            raise CommandError(f'Date invalide : {e}')
+        if fin < debut:
+            raise CommandError('La date de fin doit être postérieure à la date de début.')
+
+        soiree = debut
+        while soiree <= fin:
+            try:
+                resultat = regler_paris(soiree)
+            except SoireeNonTerminee:
+                raise CommandError(f'La soirée du {soiree} n\'est pas terminée.')
+            self.stdout.write(
+                f'🎲 {soiree}: {resultat["gagnes"]} pari(s) gagné(s), {resultat["perdus"]} perdu(s)'
+            )
+            soiree += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS('✅ Paris réglés'))
@@ -0,0 +1,165 @@
+"""
+Service des médias (MEDIA_URL) : plages d'octets, validation par ETag, envoi délégué
+
+La route n'est montée que si MEDIA_SERVIR est activé (par défaut en DEBUG) ;
+sinon le serveur frontal sert /media/. Les dossiers de DOSSIERS_NON_PUBLIES ne
+sont jamais servis.
+
+Les vidéos d'établissement doivent pouvoir être parcourues (avance rapide) :
+le navigateur demande des plages (Range: bytes=debut-fin) et revalide avec
+If-None-Match. Le corps n'est jamais recopié par Python :
+
+    MEDIA_ENVOI = 'django'            fichier confié au serveur WSGI (wsgi.file_wrapper :
+                                      os.sendfile sous gunicorn), limité à la plage demandée
+    MEDIA_ENVOI = 'x-accel-redirect'  nginx envoie le fichier (location interne
+                                      MEDIA_ENVOI_PREFIXE, alias de MEDIA_ROOT)
+    MEDIA_ENVOI = 'x-sendfile'        Apache / lighttpd (mod_xsendfile)
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+
+from .stockage import DOSSIER_CONTENU
+from .televersement import DOSSIER_PARTIELS
+
+
+DUREE_CACHE = 24 * 3600  # secondes
+PLAGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Envois de vidéo inachevés et fichiers bruts du stockage par contenu
+DOSSIERS_NON_PUBLIES = (DOSSIER_PARTIELS, DOSSIER_CONTENU)
+
+
+class PlageFichier:
+    """
+    Fichier lu de `debut` à `debut + longueur` seulement
+    fileno() reste disponible : le serveur WSGI peut envoyer la plage avec
+    os.sendfile, la longueur étant donnée par Content-Length.
+    """
+
+    def __init__(self, fichier, debut, longueur):
+        self.fichier = fichier
+        self.reste = longueur
+        fichier.seek(debut)
+
+    def read(self, taille=-1):
+        if self.reste <= 0:
+            return b''
+        if taille is None or taille < 0 or taille > self.reste:
+            taille = self.reste
+        morceau = self.fichier.read(taille)
+        self.reste -= len(morceau)
+        return morceau
+
+    def fileno(self):
+        return self.fichier.fileno()
+
+    def close(self):
+        self.fichier.close()
+
+
+def etag_fichier(etat):
+    """ETag dérivé de la taille et de la date de modification (sans lire le fichier)"""
+    return f'"{etat.st_size:x}-{etat.st_mtime_ns:x}"'
+
+
+def analyser_plage(entete, taille):
+    """
+    Plage demandée par l'en-tête Range
+    Returns:
+        tuple | None: (debut, fin incluse), None pour le fichier entier
+    Raises:
+        ValueError: plage hors du fichier (réponse 416)
+    """
+    correspondance = PLAGE.match(entete.replace(' ', '')) if entete else None
+    if not correspondance or correspondance.groups() == ('', ''):
+        # Absente, plages multiples ou syntaxe inconnue : le fichier entier
+        return None
+    debut, fin = correspondance.groups()
+    if not debut:
+        # Suffixe : les N derniers octets
+        longueur = int(fin)
+        if longueur == 0:
+            raise ValueError('Plage vide')
+        return max(0, taille - longueur), taille - 1
+    debut = int(debut)
+    fin = min(int(fin), taille - 1) if fin else taille - 1
+    if debut >= taille or fin < debut:
+        raise ValueError('Plage hors du fichier')
+    return debut, fin
+
+
+def chemin_media(chemin):
+    """Chemin absolu d'un média publiable (ni contenu brut, ni envoi inachevé)"""
+    relatif = os.path.normpath(chemin).replace('\\', '/')
+    if relatif.startswith(('.', '/')) or any(partie.startswith('.') for partie in relatif.split('/')):
+        raise Http404
+    if any(relatif.lower() == dossier.lower() or relatif.lower().startswith(dossier.lower() + '/')
+           for dossier in DOSSIERS_NON_PUBLIES):
+        # Comparaison sans casse : certains systèmes de fichiers ne la distinguent pas
+        raise Http404
+    try:
+        absolu = safe_join(settings.MEDIA_ROOT, relatif)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(absolu):
+        raise Http404
+    return relatif, absolu
+
+
+def reponse_media(request, chemin):
+    relatif, absolu = chemin_media(chemin)
+    etat = os.stat(absolu)
+    etag = etag_fichier(etat)
+    type_contenu, encodage = mimetypes.guess_type(absolu)
+
+    reponse = get_conditional_response(request, etag=etag, last_modified=int(etat.st_mtime))
+    if reponse is None:
+        plage = None
+        entete_plage = request.headers.get('Range')
+        si_plage = request.headers.get('If-Range')
+        # If-Range : la plage n'est valable que pour la version connue du client
+        if entete_plage and (not si_plage or etag in parse_etags(si_plage)):
+            try:
+                plage = analyser_plage(entete_plage, etat.st_size)
+            except ValueError:
+                reponse = HttpResponse(status=416)
+                reponse['Content-Range'] = f'bytes */{etat.st_size}'
+                return reponse
+        debut, fin = plage or (0, etat.st_size - 1)
+        longueur = fin - debut + 1 if etat.st_size else 0
+
+        envoi = getattr(settings, 'MEDIA_ENVOI', 'django')
+        if envoi == 'x-accel-redirect':
+            # nginx gère lui-même la plage à partir de l'en-tête Range transmis
+            reponse = HttpResponse()
+            prefixe = getattr(settings, 'MEDIA_ENVOI_PREFIXE', '/media-interne/')
+            reponse['X-Accel-Redirect'] = prefixe + quote(relatif)
+            del reponse['Content-Type']
+        elif envoi == 'x-sendfile':
+            reponse = HttpResponse()
+            reponse['X-Sendfile'] = absolu
+            del reponse['Content-Type']
+        else:
+            if request.method == 'HEAD':
+                reponse = HttpResponse(status=206 if plage else 200)
+            else:
+                reponse = FileResponse(PlageFichier(open(absolu, 'rb'), debut, longueur), status=206 if plage else 200)
+            reponse['Content-Length'] = longueur
+            if plage:
+                reponse['Content-Range'] = f'bytes {debut}-{fin}/{etat.st_size}'
+        reponse['Content-Type'] = type_contenu or 'application/octet-stream'
+        if encodage:
+            reponse['Content-Encoding'] = encodage
+
+    reponse['ETag'] = etag
+    reponse['Last-Modified'] = http_date(etat.st_mtime)
+    reponse['Accept-Ranges'] = 'bytes'
+    reponse['Cache-Control'] = f'public, max-age={DUREE_CACHE}'
+    return reponse
@@ -0,0 +1,172 @@
+"""
+Mesure des performances par requête
+
+Pour chaque requête échantillonnée : durée totale, nombre et durée des
+requêtes SQL, durée de rendu des gabarits et succès / échecs du cache.
+Les mesures sont écrites en une ligne JSON dans le logger
+« soiree.performance » et, si c'est réglé, renvoyées dans l'en-tête Server-Timing.
+
+Rien n'est remplacé dans les classes de Django : le rendu est chronométré par
+le moteur de gabarits GabaritsMesures (réglage TEMPLATES), les lectures du
+cache sont comptées par soiree.cache.CacheBaseDonnees et le chronomètre SQL
+est un execute_wrapper des connexions, inactif hors d'une requête mesurée.
+
+Réglages (settings) :
+- PERFORMANCE_ECHANTILLONNAGE : part des requêtes mesurées, de 0 à 1 (0 par défaut)
+- PERFORMANCE_SERVER_TIMING : ajoute l'en-tête Server-Timing (DEBUG par défaut :
+  il expose le nombre et la durée des requêtes SQL à tout client)
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template as GabaritDjango, reraise
+
+
+logger = logging.getLogger('soiree.performance')
+
+_mesure_courante = contextvars.ContextVar('mesure_performance', default=None)
+
+
+class Mesure:
+    """Compteurs d'une requête"""
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.requetes_sql = 0
+        self.duree_sql = 0.0
+        self.duree_gabarits = 0.0
+        self.profondeur_gabarit = 0
+        self.cache_succes = 0
+        self.cache_echecs = 0
+
+    def duree_totale(self):
+        return time.perf_counter() - self.debut
+
+
+def _chronometrer_sql(execute, sql, params, many, context):
+    mesure = _mesure_courante.get()
+    if mesure is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesure.requetes_sql += 1
+        mesure.duree_sql += time.perf_counter() - debut
+
+
+def _installer_sur_connexions():
+    # Les connexions sont propres à chaque thread : on vérifie à chaque requête mesurée
+    for connection in connections.all():
+        if _chronometrer_sql not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_chronometrer_sql)
+
+
+class GabaritMesure(GabaritDjango):
+    """Gabarit du moteur Django dont le rendu est chronométré pendant une requête mesurée"""
+
+    def render(self, context=None, request=None):
+        mesure = _mesure_courante.get()
+        if mesure is None:
+            return super().render(context, request)
+        # Seul le gabarit le plus externe compte : les inclusions sont déjà dans sa durée
+        mesure.profondeur_gabarit += 1
+        debut = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            mesure.profondeur_gabarit -= 1
+            if not mesure.profondeur_gabarit:
+                mesure.duree_gabarits += time.perf_counter() - debut
+
+
+class GabaritsMesures(DjangoTemplates):
+    """Moteur de gabarits Django (réglage TEMPLATES) qui renvoie des GabaritMesure"""
+
+    def from_string(self, template_code):
+        return GabaritMesure(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return GabaritMesure(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def compter_cache(succes, echecs):
+    """Compte des lectures du cache dans la mesure en cours (appelé par soiree.cache)"""
+    mesure = _mesure_courante.get()
+    if mesure is not None:
+        mesure.cache_succes += succes
+        mesure.cache_echecs += echecs
+
+
+class PerformanceMiddleware:
+    """Mesure un échantillon de requêtes et publie les résultats (log JSON et Server-Timing)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.echantillonnage = getattr(settings, 'PERFORMANCE_ECHANTILLONNAGE', 0.0)
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', settings.DEBUG)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _demarrer(self):
+        if self.echantillonnage <= 0 or random.random() >= self.echantillonnage:
+            return None, None
+        _installer_sur_connexions()
+        mesure = Mesure()
+        return mesure, _mesure_courante.set(mesure)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mesure, jeton = self._demarrer()
+        if mesure is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _mesure_courante.reset(jeton)
+        return self._publier(request, response, mesure)
+
+    async def __acall__(self, request):
+        mesure, jeton = self._demarrer()
+        if mesure is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _mesure_courante.reset(jeton)
+        return self._publier(request, response, mesure)
+
+    def _publier(self, request, response, mesure):
+        duree = mesure.duree_totale()
+        logger.info(json.dumps({
+            'methode': request.method,
+            'chemin': request.path,
+            'statut': response.status_code,
+            'duree_ms': round(duree * 1000, 2),
+            'requetes_sql': mesure.requetes_sql,
+            'duree_sql_ms': round(mesure.duree_sql * 1000, 2),
+            'duree_gabarits_ms': round(mesure.duree_gabarits * 1000, 2),
+            'cache_succes': mesure.cache_succes,
+            'cache_echecs': mesure.cache_echecs,
+        }))
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={duree * 1000:.2f}',
+                f'sql;dur={mesure.duree_sql * 1000:.2f};desc="{mesure.requetes_sql} requetes"',
+                f'gabarits;dur={mesure.duree_gabarits * 1000:.2f}',
+                f'cache;desc="{mesure.cache_succes} succes {mesure.cache_echecs} echecs"',
+            ])
+        return response
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:52
+
+from datetime import timedelta, time
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def remplir_cumuls(apps, schema_editor):
+    """Initialise les cumuls de soirée à partir des consommations existantes"""
+    ConsommationParticipant = apps.get_model('soiree', 'ConsommationParticipant')
+    VentesSoiree = apps.get_model('soiree', 'VentesSoiree')
+    DepensesSoiree = apps.get_model('soiree', 'DepensesSoiree')
+
+    consommations = ConsommationParticipant.objects.filter(
+        Q(date_consommation__time__gte=time(17, 30)) | Q(date_consommation__time__lt=time(11, 0))
+    ).annotate(
+        soiree=TruncDate(ExpressionWrapper(
+            F('date_consommation') - timedelta(hours=11),
+            output_field=models.DateTimeField()
+        ))
+    )
+    for modele, champ in ((VentesSoiree, 'service'), (DepensesSoiree, 'participant')):
+        modele.objects.bulk_create([
+            modele(**{
+                f'{champ}_id': ligne[champ],
+                'date_soiree': ligne['soiree'],
+                'montant_total': ligne['total'],
+                'nombre_consommations': ligne['nombre'],
+            })
+            for ligne in consommations.values(champ, 'soiree').annotate(
+                total=Sum('montant_total'), nombre=Count('id')
+            ).order_by()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0005_participant_photo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepensesSoiree',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_soiree', models.DateField()),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nombre_consommations', models.IntegerField(default=0)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='depenses_soiree', to='soiree.participant')),
+            ],
+            options={
+                'verbose_name': 'Dépenses de la soirée',
+                'verbose_name_plural': 'Dépenses des soirées',
+                'indexes': [models.Index(fields=['date_soiree', 'montant_total'], name='soiree_depe_date_so_58fc46_idx')],
+                'unique_together': {('participant', 'date_soiree')},
+            },
+        ),
+        migrations.CreateModel(
+            name='VentesSoiree',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_soiree', models.DateField()),
+                ('montant_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nombre_consommations', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventes_soiree', to='soiree.service')),
+            ],
+            options={
+                'verbose_name': 'Ventes de la soirée',
+                'verbose_name_plural': 'Ventes des soirées',
+                'indexes': [models.Index(fields=['date_soiree', 'montant_total'], name='soiree_vent_date_so_f22552_idx')],
+                'unique_together': {('service', 'date_soiree')},
+            },
+        ),
+        migrations.RunPython(remplir_cumuls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:56
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+from django.db.models.functions import TruncDate
+
+
+def remplir_date_soiree(apps, schema_editor):
+    """Calcule la date de soirée des consommations existantes en une seule requête"""
+    ConsommationParticipant = apps.get_model('soiree', 'ConsommationParticipant')
+    ConsommationParticipant.objects.update(
+        date_soiree=TruncDate(ExpressionWrapper(
+            F('date_consommation') - timedelta(hours=11),
+            output_field=models.DateTimeField()
+        ))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0006_ventes_soiree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consommationparticipant',
+            name='date_soiree',
+            field=models.DateField(db_index=True, editable=False, help_text='Soirée à laquelle appartient la consommation (avant 11h00 : soirée de la veille)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='consommationparticipant',
+            name='date_consommation',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(remplir_date_soiree, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='consommationparticipant',
+            name='date_soiree',
+            field=models.DateField(db_index=True, editable=False, help_text='Soirée à laquelle appartient la consommation (avant 11h00 : soirée de la veille)'),
+        ),
+        migrations.AddIndex(
+            model_name='consommationparticipant',
+            index=models.Index(fields=['service', 'date_soiree'], name='soiree_cons_service_5bcbc3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consommationparticipant',
+            index=models.Index(fields=['participant', 'date_soiree'], name='soiree_cons_partici_2346ac_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0007_consommation_date_soiree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consommationparticipant',
+            name='cle_idempotence',
+            field=models.UUIDField(blank=True, editable=False, help_text='Clé générée par le client pour ne jamais enregistrer deux fois la même saisie', null=True, unique=True),
+        ),
+    ]
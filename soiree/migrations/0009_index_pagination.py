@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0008_consommation_cle_idempotence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consommationparticipant',
+            index=models.Index(fields=['date_consommation', 'id'], name='soiree_cons_date_co_f814a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consommationparticipant',
+            index=models.Index(fields=['service', 'date_consommation', 'id'], name='soiree_cons_service_f1332b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pari',
+            index=models.Index(fields=['user', 'date_pari', 'id'], name='soiree_pari_user_id_4c2792_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normaliser_pseudo(pseudo):
+    decompose = unicodedata.normalize('NFKD', pseudo or '')
+    return ''.join(c for c in decompose if not unicodedata.combining(c)).casefold().strip()
+
+
+def remplir_registre(apps, schema_editor):
+    """Inscrit les pseudos existants ; en cas de doublon normalisé, le premier compte garde le pseudo"""
+    PseudoReserve = apps.get_model('soiree', 'PseudoReserve')
+    reserves = set()
+    lignes = []
+    # Gestionnaires d'abord : ils reprennent le pseudo de leur demande d'adhésion
+    for nom_modele, champ in (('Gestionnaire', 'gestionnaire'), ('Participant', 'participant'), ('DemandeAdhesion', 'demande')):
+        modele = apps.get_model('soiree', nom_modele)
+        for pk, pseudo in modele.objects.values_list('pk', 'pseudo').iterator():
+            normalise = normaliser_pseudo(pseudo)
+            if normalise and normalise not in reserves:
+                reserves.add(normalise)
+                lignes.append(PseudoReserve(normalise=normalise, pseudo=pseudo, **{f'{champ}_id': pk}))
+    PseudoReserve.objects.bulk_create(lignes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0009_index_pagination'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PseudoReserve',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalise', models.CharField(max_length=60, unique=True)),
+                ('pseudo', models.CharField(max_length=30)),
+                ('date_reservation', models.DateTimeField(auto_now_add=True)),
+                ('demande', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pseudo_reserve', to='soiree.demandeadhesion')),
+                ('gestionnaire', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pseudo_reserve', to='soiree.gestionnaire')),
+                ('participant', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pseudo_reserve', to='soiree.participant')),
+            ],
+            options={
+                'verbose_name': 'Pseudo réservé',
+                'verbose_name_plural': 'Pseudos réservés',
+            },
+        ),
+        migrations.RunPython(remplir_registre, migrations.RunPython.noop),
+    ]
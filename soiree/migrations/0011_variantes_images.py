@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0010_registre_pseudos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gestionnaire',
+            name='avatar_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='photo_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='trophee',
+            name='photo_gagnant_variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:43
+
+import soiree.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0011_variantes_images'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gestionnaire',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to='avatar', validators=[soiree.images.valider_dimensions_image], verbose_name='Photo ou avatar'),
+        ),
+        migrations.AlterField(
+            model_name='participant',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Photo du participant (recommandé: format carré, max 2MB)', null=True, upload_to='photos/participants/', validators=[soiree.images.valider_dimensions_image]),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to='avatar', validators=[soiree.images.valider_dimensions_image], verbose_name='Photo ou avatar'),
+        ),
+        migrations.AlterField(
+            model_name='trophee',
+            name='photo_gagnant',
+            field=models.ImageField(blank=True, null=True, upload_to='trophees', validators=[soiree.images.valider_dimensions_image]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:45
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0012_limite_pixels_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeleversementVideo',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('taille', models.PositiveBigIntegerField(help_text='Taille annoncée en octets')),
+                ('recu', models.PositiveBigIntegerField(default=0)),
+                ('type_contenu', models.CharField(max_length=100)),
+                ('chemin', models.CharField(help_text='Fichier relatif à MEDIA_ROOT', max_length=255)),
+                ('termine', models.BooleanField(default=False)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_mise_a_jour', models.DateTimeField(auto_now=True)),
+                ('demande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='soiree.demandeadhesion')),
+            ],
+            options={
+                'verbose_name': 'Téléversement vidéo',
+                'verbose_name_plural': 'Téléversements vidéo',
+            },
+        ),
+    ]
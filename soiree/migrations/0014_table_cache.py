@@ -0,0 +1,18 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def creer_table_cache(apps, schema_editor):
+    # Table du cache partagé (réglage CACHES) : sans elle, chaque accès au cache échoue
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0013_televersement_video'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_table_cache, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def dater_demandes_traitees(apps, schema_editor):
+    """
+    Demandes déjà approuvées ou rejetées : la date réelle du traitement est inconnue,
+    le délai de conservation de leurs médias repart de la migration
+    """
+    DemandeAdhesion = apps.get_model('soiree', 'DemandeAdhesion')
+    DemandeAdhesion.objects.exclude(statut='en_attente').update(date_traitement=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0014_table_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='demandeadhesion',
+            name='date_traitement',
+            field=models.DateTimeField(blank=True, editable=False, help_text="Date d'approbation ou de rejet", null=True),
+        ),
+        migrations.RunPython(dater_demandes_traitees, migrations.RunPython.noop),
+    ]
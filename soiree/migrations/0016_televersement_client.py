@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soiree', '0015_date_traitement_demande'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='televersementvideo',
+            name='adresse_ip',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='televersementvideo',
+            name='bloc_commence',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='televersementvideo',
+            name='cle_session',
+            field=models.CharField(blank=True, default='', help_text='Session du navigateur qui envoie la vidéo', max_length=40),
+        ),
+    ]
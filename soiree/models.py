@@ -1,13 +1,150 @@
-from datetime import timedelta
-from django.db import models
+from datetime import timedelta, time
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+import unicodedata
 import uuid
 
+from .images import planifier_variantes, retirer_metadonnees, valider_dimensions_image
+
+
+# Fenêtre de classement : de 17h30 à 11h00 le lendemain
+HEURE_OUVERTURE_SOIREE = time(17, 30)
+HEURE_FERMETURE_SOIREE = time(11, 0)
+
+
+def date_soiree(moment):
+    """Date de la soirée à laquelle appartient un instant (avant 11h00 : soirée de la veille)"""
+    moment = timezone.localtime(moment)
+    if moment.time() < HEURE_FERMETURE_SOIREE:
+        return moment.date() - timedelta(days=1)
+    return moment.date()
+
+
+def date_soiree_courante():
+    """Date de la soirée en cours (ou à venir) pour le classement"""
+    return date_soiree(timezone.now())
+
+
+def dans_fenetre_classement(moment):
+    """Vérifier si un instant tombe entre 17h30 et 11h00"""
+    heure = timezone.localtime(moment).time()
+    return heure >= HEURE_OUVERTURE_SOIREE or heure < HEURE_FERMETURE_SOIREE
+
+
+def normaliser_pseudo(pseudo):
+    """Forme canonique d'un pseudo : sans accents, casse ni espaces superflus"""
+    decompose = unicodedata.normalize('NFKD', pseudo or '')
+    return ''.join(c for c in decompose if not unicodedata.combining(c)).casefold().strip()
+
+
+class PseudoIndisponible(IntegrityError):
+    """Pseudo déjà réservé par un autre compte"""
+
+
+class PseudoReserveMixin:
+    """
+    Réserve le pseudo du compte dans le registre des pseudos
+    champ_registre : nom du champ de PseudoReserve qui pointe vers ce modèle.
+    save(reprise_pseudo=compte) : le pseudo réservé par `compte` est repris
+    (le gestionnaire reprend celui de la demande d'adhésion approuvée).
+    """
+    champ_registre = None
+
+    def validate_unique(self, exclude=None):
+        """Ajoute au contrôle d'unicité celui du registre (formulaires et admin : erreur sur le champ)"""
+        erreurs = {}
+        try:
+            super().validate_unique(exclude)
+        except ValidationError as e:
+            erreurs = e.update_error_dict(erreurs)
+        if 'pseudo' not in erreurs and 'pseudo' not in (exclude or ()):
+            reserves = PseudoReserve.objects.filter(normalise=normaliser_pseudo(self.pseudo))
+            if not self._state.adding:
+                reserves = reserves.exclude(**{self.champ_registre: self})
+            if reserves.exists():
+                erreurs['pseudo'] = [ValidationError('Ce pseudo est déjà utilisé.', code='pseudo_indisponible')]
+        if erreurs:
+            raise ValidationError(erreurs)
+
+    def save(self, *args, reprise_pseudo=None, **kwargs):
+        ancien = None
+        if not self._state.adding:
+            ancien = type(self).objects.filter(pk=self.pk).values_list('pseudo', flat=True).first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if ancien is None or normaliser_pseudo(ancien) != normaliser_pseudo(self.pseudo):
+                reserver_pseudo(self, reprise_pseudo)
+            elif ancien != self.pseudo:
+                PseudoReserve.objects.filter(**{self.champ_registre: self}).update(pseudo=self.pseudo)
+
+
+def reserver_pseudo(compte, reprise=None):
+    """
+    Inscrit le pseudo d'un compte dans le registre (insertion protégée par l'index unique)
+    reprise : compte dont la réservation passe à `compte` si le pseudo est le même
+    Raises:
+        PseudoIndisponible: si le pseudo normalisé appartient déjà à un autre compte
+    """
+    normalise = normaliser_pseudo(compte.pseudo)
+    champ = compte.champ_registre
+    PseudoReserve.objects.filter(**{champ: compte}).exclude(normalise=normalise).delete()
+    if reprise is not None:
+        repris = PseudoReserve.objects.filter(normalise=normalise, **{reprise.champ_registre: reprise}).update(
+            pseudo=compte.pseudo, **{champ: compte, reprise.champ_registre: None}
+        )
+        if repris:
+            return
+    if PseudoReserve.objects.filter(normalise=normalise, **{champ: compte}).exists():
+        return
+    try:
+        with transaction.atomic():
+            PseudoReserve.objects.create(normalise=normalise, pseudo=compte.pseudo, **{champ: compte})
+    except IntegrityError:
+        raise PseudoIndisponible(f'Le pseudo "{compte.pseudo}" est déjà utilisé.')
+
+
+def pseudo_disponible(pseudo):
+    """Vérifie en une requête qu'un pseudo n'est réservé par aucun compte"""
+    normalise = normaliser_pseudo(pseudo)
+    return bool(normalise) and not PseudoReserve.objects.filter(normalise=normalise).exists()
+
+
+class VariantesImagesMixin:
+    """
+    Retire les métadonnées des images envoyées et planifie le calcul de leurs
+    variantes (voir soiree.images) quand un fichier change
+    champs_variantes : {champ image: champ JSON des variantes}
+    """
+    champs_variantes = {}
 
-class DemandeAdhesion(models.Model):
+    def save(self, *args, **kwargs):
+        for champ in self.champs_variantes:
+            fichier = getattr(self, champ)
+            if fichier and not fichier._committed:
+                # Nouveau fichier : l'original publié sous /media/ ne garde ni GPS ni appareil
+                fichier.open('rb')
+                try:
+                    contenu = retirer_metadonnees(fichier.read())
+                finally:
+                    fichier.close()
+                setattr(self, champ, ContentFile(contenu, name=fichier.name))
+        super().save(*args, **kwargs)
+        for champ, champ_variantes in self.champs_variantes.items():
+            fichier = getattr(self, champ)
+            variantes = getattr(self, champ_variantes) or {}
+            if fichier and variantes.get('source') != fichier.name:
+                planifier_variantes(self, champ, champ_variantes)
+            elif not fichier and variantes:
+                setattr(self, champ_variantes, {})
+                type(self).objects.filter(pk=self.pk).update(**{champ_variantes: {}})
+
+
+class DemandeAdhesion(PseudoReserveMixin, models.Model):
     """Demande d'adhésion depuis la page d'accueil"""
     TYPE_CHOICES = (
         ('maquis', 'Maquis'),
@@ -47,15 +184,56 @@ class DemandeAdhesion(models.Model):
         ('approuvee', 'Approuvée'),
         ('rejetee', 'Rejetée')
     ], default='en_attente')
+    date_traitement = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="Date d'approbation ou de rejet"
+    )
     
+    champ_registre = 'demande'
+
     def __str__(self):
         return f"{self.pseudo} - {self.nom_etablissement}"
+
+    def save(self, *args, **kwargs):
+        # Horodatage du traitement : le nettoyage des médias compte l'âge d'un rejet à partir de là
+        if self.statut == 'en_attente':
+            self.date_traitement = None
+        elif self.date_traitement is None:
+            self.date_traitement = timezone.now()
+        super().save(*args, **kwargs)
     
     class Meta:
         verbose_name = "Demande d'adhésion"
         verbose_name_plural = "Demandes d'adhésion"
 
 
+class TeleversementVideo(models.Model):
+    """
+    Vidéo envoyée par blocs (voir soiree.televersement)
+    Les blocs sont écrits à la suite dans `chemin` ; `recu` est la reprise
+    à communiquer au client après une coupure. `bloc_commence` marque un bloc
+    en cours d'écriture : un seul envoi à la fois écrit dans le fichier.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    taille = models.PositiveBigIntegerField(help_text="Taille annoncée en octets")
+    recu = models.PositiveBigIntegerField(default=0)
+    type_contenu = models.CharField(max_length=100)
+    chemin = models.CharField(max_length=255, help_text="Fichier relatif à MEDIA_ROOT")
+    termine = models.BooleanField(default=False)
+    cle_session = models.CharField(max_length=40, blank=True, default='', help_text="Session du navigateur qui envoie la vidéo")
+    adresse_ip = models.GenericIPAddressField(null=True, blank=True)
+    bloc_commence = models.DateTimeField(null=True, blank=True, editable=False)
+    demande = models.ForeignKey(DemandeAdhesion, on_delete=models.SET_NULL, null=True, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_mise_a_jour = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.chemin} ({self.recu}/{self.taille})"
+
+    class Meta:
+        verbose_name = "Téléversement vidéo"
+        verbose_name_plural = "Téléversements vidéo"
+
+
 class Service(models.Model):
     TYPE_CHOICES = (
         ('maquis', 'Maquis'),
@@ -105,25 +283,18 @@ class Service(models.Model):
         )['total'] or 0
 
     def total_ventes_aujourd_hui(self):
-        aujourd_hui = timezone.now().date()
-        return self.total_ventes_periode(aujourd_hui, aujourd_hui)
+        return self.consommationparticipant_set.filter(
+            date_soiree=date_soiree_courante()
+        ).aggregate(
+            total=models.Sum('montant_total')
+        )['total'] or 0
 
     def total_ventes_periode_classement(self):
         """Ventes entre 17h30 de la veille et 11h00 d'aujourd'hui pour le classement"""
-        maintenant = timezone.now()
-        hier_17h30 = (maintenant - timedelta(days=1)).replace(hour=17, minute=30, second=0, microsecond=0)
-        aujourd_hui_11h = maintenant.replace(hour=11, minute=0, second=0, microsecond=0)
-        
-        if maintenant.hour < 11:
-            # Si on est avant 11h, on prend la période d'hier 17h30 à aujourd'hui 11h
-            debut = hier_17h30
-            fin = aujourd_hui_11h
-        else:
-            # Sinon, on prend la période d'aujourd'hui 17h30 à demain 11h
-            debut = maintenant.replace(hour=17, minute=30, second=0, microsecond=0)
-            fin = (maintenant + timedelta(days=1)).replace(hour=11, minute=0, second=0, microsecond=0)
-        
-        return self.total_ventes_periode(debut, fin)
+        # Lecture du cumul de la soirée au lieu d'agréger les consommations
+        return self.ventes_soiree.filter(
+            date_soiree=date_soiree_courante()
+        ).values_list('montant_total', flat=True).first() or 0
 
     class Meta:
         verbose_name = "Établissement"
@@ -150,6 +321,19 @@ class TypeBoisson(models.Model):
     actif = models.BooleanField(default=True)
     date_creation = models.DateTimeField(auto_now_add=True)
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalider_tarifs()
+
+    def delete(self, *args, **kwargs):
+        self._invalider_tarifs()
+        return super().delete(*args, **kwargs)
+
+    def _invalider_tarifs(self):
+        from .saisie import invalider_tarifs
+        service_id = self.service_id
+        transaction.on_commit(lambda: invalider_tarifs(service_id))
+
     def __str__(self):
         return f"{self.service.nom} - {self.get_categorie_display()} ({self.prix_vente} FCFA)"
     
@@ -159,19 +343,25 @@ class TypeBoisson(models.Model):
         verbose_name_plural = "Types de boissons"
 
 
-class Profile(models.Model):
+class Profile(VariantesImagesMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     pseudo = models.CharField(max_length=30, blank=False, unique=True)
     nom = models.CharField(max_length=20, blank=True)
     prenom = models.CharField(max_length=50, blank=True)
-    avatar = models.ImageField(upload_to="avatar", verbose_name="Photo ou avatar", blank=True, null=True)
+    avatar = models.ImageField(
+        upload_to="avatar", verbose_name="Photo ou avatar", blank=True, null=True,
+        validators=[valider_dimensions_image]
+    )
+    avatar_variantes = models.JSONField(default=dict, blank=True, editable=False)
     tel = models.CharField(max_length=20, unique=True, blank=True, null=True, verbose_name="Numéro téléphone")
 
+    champs_variantes = {'avatar': 'avatar_variantes'}
+
     def __str__(self):
         return self.pseudo
 
 
-class Gestionnaire(models.Model):
+class Gestionnaire(PseudoReserveMixin, VariantesImagesMixin, models.Model):
     FONCTION = (
         ('gerant', 'GERANT'),
         ('dg', 'DIRIGEANT'),
@@ -181,12 +371,19 @@ class Gestionnaire(models.Model):
     pseudo = models.CharField(max_length=30, blank=False, unique=True)
     nom = models.CharField(max_length=20, blank=True)
     prenom = models.CharField(max_length=50, blank=True)
-    avatar = models.ImageField(upload_to="avatar", verbose_name="Photo ou avatar", blank=True, null=True)
+    avatar = models.ImageField(
+        upload_to="avatar", verbose_name="Photo ou avatar", blank=True, null=True,
+        validators=[valider_dimensions_image]
+    )
+    avatar_variantes = models.JSONField(default=dict, blank=True, editable=False)
     tel = models.CharField(max_length=20, unique=False, blank=False, verbose_name="Numéro téléphone")
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     fonction = models.CharField(max_length=20, choices=FONCTION)
     mot_de_passe_reinitialise = models.BooleanField(default=False)
 
+    champ_registre = 'gestionnaire'
+    champs_variantes = {'avatar': 'avatar_variantes'}
+
     def __str__(self):
         return self.pseudo
     
@@ -198,7 +395,7 @@ class Gestionnaire(models.Model):
         pass
 
 
-class Participant(models.Model):
+class Participant(PseudoReserveMixin, VariantesImagesMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     pseudo = models.CharField(max_length=30, unique=True)
     nom = models.CharField(max_length=50, blank=True)
@@ -212,19 +409,24 @@ class Participant(models.Model):
         upload_to='photos/participants/',
         blank=True,
         null=True,
+        validators=[valider_dimensions_image],
         help_text="Photo du participant (recommandé: format carré, max 2MB)"
     )
+    photo_variantes = models.JSONField(default=dict, blank=True, editable=False)
+
+    champ_registre = 'participant'
+    champs_variantes = {'photo': 'photo_variantes'}
 
     def __str__(self):
         return f"{self.pseudo} - {self.service.nom}"
 
     def total_depenses_jour(self, date=None):
-        """Total des dépenses d'un participant pour une journée donnée"""
+        """Total des dépenses d'un participant pour une soirée donnée"""
         if date is None:
-            date = timezone.now().date()
+            date = date_soiree_courante()
         
         return self.consommationparticipant_set.filter(
-            date_consommation__date=date
+            date_soiree=date
         ).aggregate(
             total=models.Sum('montant_total')
         )['total'] or 0
@@ -234,6 +436,30 @@ class Participant(models.Model):
         verbose_name_plural = "Participants"
 
 
+class PseudoReserve(models.Model):
+    """
+    Registre des pseudos de la plateforme, tous types de comptes confondus
+    L'index unique sur la forme normalisée empêche deux comptes d'obtenir
+    « Kévin » et « kevin », y compris entre deux inscriptions simultanées.
+    """
+    normalise = models.CharField(max_length=60, unique=True)
+    pseudo = models.CharField(max_length=30)
+    demande = models.OneToOneField(DemandeAdhesion, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='pseudo_reserve')
+    gestionnaire = models.OneToOneField(Gestionnaire, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='pseudo_reserve')
+    participant = models.OneToOneField(Participant, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='pseudo_reserve')
+    date_reservation = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.pseudo
+
+    class Meta:
+        verbose_name = "Pseudo réservé"
+        verbose_name_plural = "Pseudos réservés"
+
+
 class ConsommationParticipant(models.Model):
     """Consommation d'un participant dans un établissement"""
     participant = models.ForeignKey(Participant, on_delete=models.CASCADE)
@@ -242,14 +468,50 @@ class ConsommationParticipant(models.Model):
     quantite = models.PositiveIntegerField()
     prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
     montant_total = models.DecimalField(max_digits=12, decimal_places=2)
-    date_consommation = models.DateTimeField(auto_now_add=True)
+    date_consommation = models.DateTimeField(default=timezone.now, editable=False)
+    date_soiree = models.DateField(db_index=True, editable=False,
+        help_text="Soirée à laquelle appartient la consommation (avant 11h00 : soirée de la veille)")
     date_saisie = models.DateTimeField(auto_now_add=True)
     saisi_par = models.ForeignKey(Gestionnaire, on_delete=models.CASCADE)
+    cle_idempotence = models.UUIDField(unique=True, null=True, blank=True, editable=False,
+        help_text="Clé générée par le client pour ne jamais enregistrer deux fois la même saisie")
     
     def save(self, *args, **kwargs):
         if not self.montant_total:
             self.montant_total = self.quantite * self.prix_unitaire
-        super().save(*args, **kwargs)
+        self.date_soiree = date_soiree(self.date_consommation)
+        
+        with transaction.atomic():
+            ancienne = None
+            if self.pk:
+                ancienne = ConsommationParticipant.objects.filter(pk=self.pk).values(
+                    'service_id', 'participant_id', 'montant_total', 'date_consommation'
+                ).first()
+            super().save(*args, **kwargs)
+            
+            # Maintenir les totaux de soirée de façon incrémentale
+            if ancienne:
+                enregistrer_vente_soiree(
+                    ancienne['service_id'], ancienne['participant_id'],
+                    ancienne['date_consommation'], -ancienne['montant_total'], -1
+                )
+            enregistrer_vente_soiree(
+                self.service_id, self.participant_id,
+                self.date_consommation, self.montant_total, 1
+            )
+            
+            services = {self.service_id} | ({ancienne['service_id']} if ancienne else set())
+            transaction.on_commit(lambda: notifier_saisie(services))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            enregistrer_vente_soiree(
+                self.service_id, self.participant_id,
+                self.date_consommation, -self.montant_total, -1
+            )
+            services = {self.service_id}
+            transaction.on_commit(lambda: notifier_saisie(services))
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.participant.pseudo} - {self.type_boisson.categorie} ({self.quantite}) - {self.montant_total} FCFA"
@@ -258,9 +520,142 @@ class ConsommationParticipant(models.Model):
         verbose_name = "Consommation participant"
         verbose_name_plural = "Consommations participants"
         ordering = ['-date_consommation']
+        indexes = [
+            models.Index(fields=['service', 'date_soiree']),
+            models.Index(fields=['participant', 'date_soiree']),
+            # Pagination par curseur des consommations récentes
+            models.Index(fields=['date_consommation', 'id']),
+            models.Index(fields=['service', 'date_consommation', 'id']),
+        ]
+
+
+class VentesSoiree(models.Model):
+    """Total des ventes d'un établissement pour une soirée (17h30 - 11h00)"""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='ventes_soiree')
+    date_soiree = models.DateField()
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nombre_consommations = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.service.nom} - {self.date_soiree} ({self.montant_total} FCFA)"
+
+    class Meta:
+        verbose_name = "Ventes de la soirée"
+        verbose_name_plural = "Ventes des soirées"
+        unique_together = ['service', 'date_soiree']
+        indexes = [
+            models.Index(fields=['date_soiree', 'montant_total']),
+        ]
+
+
+class DepensesSoiree(models.Model):
+    """Total des dépenses d'un participant pour une soirée (17h30 - 11h00)"""
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='depenses_soiree')
+    date_soiree = models.DateField()
+    montant_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nombre_consommations = models.IntegerField(default=0)
 
+    def __str__(self):
+        return f"{self.participant.pseudo} - {self.date_soiree} ({self.montant_total} FCFA)"
 
-class Trophee(models.Model):
+    class Meta:
+        verbose_name = "Dépenses de la soirée"
+        verbose_name_plural = "Dépenses des soirées"
+        unique_together = ['participant', 'date_soiree']
+        indexes = [
+            models.Index(fields=['date_soiree', 'montant_total']),
+        ]
+
+
+def _incrementer_total(modele, montant, nombre, **cle):
+    """Ajoute un montant à une ligne de cumul, en la créant si nécessaire"""
+    if not modele.objects.filter(**cle).update(
+        montant_total=models.F('montant_total') + montant,
+        nombre_consommations=models.F('nombre_consommations') + nombre,
+    ):
+        try:
+            with transaction.atomic():
+                modele.objects.create(montant_total=montant, nombre_consommations=nombre, **cle)
+        except IntegrityError:
+            # Ligne créée entre-temps par une autre requête
+            modele.objects.filter(**cle).update(
+                montant_total=models.F('montant_total') + montant,
+                nombre_consommations=models.F('nombre_consommations') + nombre,
+            )
+
+
+def notifier_saisie(service_ids):
+    """Actions à mener une fois des consommations validées : caches, versions et classement en direct"""
+    from .statistiques import invalider_statistiques
+    from .diffusion import signaler_consommation
+    from .versions import incrementer_version, PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS
+    incrementer_version(PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS)
+    for service_id in service_ids:
+        invalider_statistiques(service_id)
+        signaler_consommation(service_id)
+
+
+def enregistrer_vente_soiree(service_id, participant_id, moment, montant, nombre=1):
+    """Répercute une consommation (ou son annulation) sur les cumuls de la soirée"""
+    if moment is None or not dans_fenetre_classement(moment):
+        return
+    soiree = date_soiree(moment)
+    _incrementer_total(VentesSoiree, montant, nombre, service_id=service_id, date_soiree=soiree)
+    _incrementer_total(DepensesSoiree, montant, nombre, participant_id=participant_id, date_soiree=soiree)
+    
+    from .tableau_classements import tableau_classements
+    transaction.on_commit(
+        lambda: tableau_classements.enregistrer(service_id, participant_id, moment, montant)
+    )
+
+
+def enregistrer_consommations(consommations):
+    """
+    Enregistre un lot de consommations en une seule insertion
+    Les cumuls de soirée sont mis à jour une fois par établissement et par
+    participant du lot, et non une fois par ligne.
+    Returns:
+        list: les consommations créées
+    """
+    if not consommations:
+        return []
+    ventes, depenses, tableau = {}, {}, {}
+    for consommation in consommations:
+        if not consommation.montant_total:
+            consommation.montant_total = consommation.quantite * consommation.prix_unitaire
+        consommation.date_soiree = date_soiree(consommation.date_consommation)
+        if not dans_fenetre_classement(consommation.date_consommation):
+            continue
+        for cumuls, cle in (
+            (ventes, (consommation.service_id, consommation.date_soiree)),
+            (depenses, (consommation.participant_id, consommation.date_soiree)),
+        ):
+            montant, nombre = cumuls.get(cle, (0, 0))
+            cumuls[cle] = (montant + consommation.montant_total, nombre + 1)
+        cle = (consommation.service_id, consommation.participant_id, consommation.date_soiree)
+        moment, montant = tableau.get(cle, (consommation.date_consommation, 0))
+        tableau[cle] = (moment, montant + consommation.montant_total)
+
+    with transaction.atomic():
+        creees = ConsommationParticipant.objects.bulk_create(consommations)
+        for (service_id, soiree), (montant, nombre) in ventes.items():
+            _incrementer_total(VentesSoiree, montant, nombre, service_id=service_id, date_soiree=soiree)
+        for (participant_id, soiree), (montant, nombre) in depenses.items():
+            _incrementer_total(DepensesSoiree, montant, nombre, participant_id=participant_id, date_soiree=soiree)
+
+        from .tableau_classements import tableau_classements
+        services = {consommation.service_id for consommation in consommations}
+
+        def apres_validation():
+            for (service_id, participant_id, _), (moment, montant) in tableau.items():
+                tableau_classements.enregistrer(service_id, participant_id, moment, montant)
+            notifier_saisie(services)
+
+        transaction.on_commit(apres_validation)
+    return creees
+
+
+class Trophee(VariantesImagesMixin, models.Model):
     TYPE_TROPHEE_CHOICES = [
         ('sultan_maquis', 'Sultan du Maquis'),
         ('bouquet_or', 'Bouquet d\'Or'),
@@ -274,7 +669,10 @@ class Trophee(models.Model):
     date_attribution = models.DateField()
     montant_total = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
-    photo_gagnant = models.ImageField(upload_to="trophees", blank=True, null=True)
+    photo_gagnant = models.ImageField(upload_to="trophees", blank=True, null=True, validators=[valider_dimensions_image])
+    photo_gagnant_variantes = models.JSONField(default=dict, blank=True, editable=False)
+
+    champs_variantes = {'photo_gagnant': 'photo_gagnant_variantes'}
 
     def __str__(self):
         return f"{self.get_type_trophee_display()} - {self.gagnant.pseudo} ({self.date_attribution})"
@@ -324,6 +722,9 @@ class Pari(models.Model):
         verbose_name = "Pari"
         verbose_name_plural = "Paris"
         ordering = ['-date_pari']
+        indexes = [
+            models.Index(fields=['user', 'date_pari', 'id']),
+        ]
 
 
 class ClassementQuotidien(models.Model):
@@ -0,0 +1,107 @@
+"""
+Recherche des médias orphelins
+
+Un fichier de MEDIA_ROOT est utilisé s'il est référencé par un FileField ou un
+ImageField d'un modèle, par une variante d'image (champs JSON *_variantes) ou
+par un envoi de vidéo en cours. Les références sont chargées par lots
+(values_list + iterator) dans un ensemble, puis l'arborescence est parcourue
+avec os.scandir : seuls les fichiers non référencés sont examinés (stat),
+ce qui permet de traiter des millions de fichiers.
+
+Les fichiers récents sont ignorés (`age`) : un fichier peut être écrit sur
+disque juste avant la validation de la ligne qui le référence. Les vidéos et
+miniatures des demandes d'adhésion rejetées depuis au moins `age` (date de
+traitement) ne comptent pas comme références, ni les envois de vidéo qui leur
+sont rattachés.
+"""
+import os
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import DemandeAdhesion, TeleversementVideo, VariantesImagesMixin
+from .stockage import DOSSIER_CONTENU
+
+
+TAILLE_LOT = 5000
+AGE_MIN_DEFAUT = timedelta(hours=24)
+
+
+def _valeurs(queryset, champs, taille_lot):
+    return queryset.values_list(*champs).iterator(chunk_size=taille_lot)
+
+
+def televersements_abandonnes(age=AGE_MIN_DEFAUT):
+    """Envois de vidéo jamais rattachés à une demande et inactifs depuis `age`"""
+    return TeleversementVideo.objects.filter(demande__isnull=True, date_mise_a_jour__lt=timezone.now() - age)
+
+
+def demandes_rejetees(age=AGE_MIN_DEFAUT):
+    """Demandes rejetées depuis au moins `age` : leurs fichiers ne sont plus conservés"""
+    return DemandeAdhesion.objects.filter(statut='rejetee', date_traitement__lt=timezone.now() - age)
+
+
+def televersements_rejetes(age=AGE_MIN_DEFAUT):
+    """Envois de vidéo rattachés à une demande rejetée depuis au moins `age`"""
+    return TeleversementVideo.objects.filter(demande__in=demandes_rejetees(age))
+
+
+def chemins_references(age=AGE_MIN_DEFAUT, taille_lot=TAILLE_LOT):
+    """Ensemble des chemins (relatifs à MEDIA_ROOT) référencés en base"""
+    references = set()
+    for modele in apps.get_models():
+        champs = [champ.attname for champ in modele._meta.concrete_fields if isinstance(champ, models.FileField)]
+        if champs:
+            lignes = modele._default_manager.all()
+            if modele is DemandeAdhesion:
+                lignes = lignes.exclude(pk__in=demandes_rejetees(age))
+            for valeurs in _valeurs(lignes, champs, taille_lot):
+                references.update(valeur for valeur in valeurs if valeur)
+        if issubclass(modele, VariantesImagesMixin):
+            champs_variantes = list(modele.champs_variantes.values())
+            for valeurs in _valeurs(modele._default_manager.all(), champs_variantes, taille_lot):
+                for variantes in valeurs:
+                    for description in (variantes or {}).values():
+                        if isinstance(description, dict):
+                            references.update(chemin for chemin in description.values() if isinstance(chemin, str))
+
+    televersements = TeleversementVideo.objects.exclude(pk__in=televersements_abandonnes(age)).exclude(
+        pk__in=televersements_rejetes(age)
+    )
+    references.update(chemin for (chemin,) in _valeurs(televersements, ['chemin'], taille_lot))
+    return references
+
+
+def fichiers_media(racine):
+    """Fichiers de l'arborescence (chemin relatif, DirEntry), sans le contenu dédupliqué"""
+    a_parcourir = ['']
+    while a_parcourir:
+        relatif = a_parcourir.pop()
+        with os.scandir(os.path.join(racine, relatif)) as entrees:
+            for entree in entrees:
+                nom = f'{relatif}/{entree.name}' if relatif else entree.name
+                if entree.is_dir(follow_symlinks=False):
+                    if nom != DOSSIER_CONTENU:
+                        a_parcourir.append(nom)
+                elif entree.is_file(follow_symlinks=False):
+                    yield nom, entree
+
+
+def medias_orphelins(age=AGE_MIN_DEFAUT, taille_lot=TAILLE_LOT, racine=None):
+    """
+    Fichiers non référencés et plus anciens que `age`
+    Yields:
+        tuple: (chemin relatif, taille en octets)
+    """
+    racine = racine or settings.MEDIA_ROOT
+    references = chemins_references(age, taille_lot)
+    limite = (timezone.now() - age).timestamp()
+    for nom, entree in fichiers_media(racine):
+        if nom in references:
+            continue
+        etat = entree.stat(follow_symlinks=False)
+        if etat.st_mtime < limite:
+            yield nom, etat.st_size
@@ -0,0 +1,74 @@
+"""
+Pagination par curseur (keyset) sur (date, id)
+
+Au lieu d'un OFFSET, chaque page reprend après le dernier élément de la page
+précédente : la requête descend l'index composite directement au bon endroit,
+la page 500 coûte autant que la première.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+TAILLE_PAGE_DEFAUT = 50
+TAILLE_PAGE_MAX = 200
+
+
+class CurseurInvalide(ValueError):
+    """Curseur illisible ou altéré"""
+
+
+def encoder_curseur(moment, pk):
+    """Curseur opaque pointant après l'élément (moment, pk)"""
+    brut = json.dumps([moment.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+
+def decoder_curseur(curseur):
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        moment, pk = json.loads(brut)
+        moment = parse_datetime(moment)
+    except (ValueError, TypeError):
+        raise CurseurInvalide(curseur)
+    if moment is None or not isinstance(pk, int):
+        raise CurseurInvalide(curseur)
+    return moment, pk
+
+
+def taille_page(valeur, defaut=TAILLE_PAGE_DEFAUT):
+    """Taille de page demandée, bornée à TAILLE_PAGE_MAX"""
+    try:
+        taille = int(valeur)
+    except (TypeError, ValueError):
+        return defaut
+    return max(1, min(taille, TAILLE_PAGE_MAX))
+
+
+def paginer(queryset, champ_date, curseur=None, taille=TAILLE_PAGE_DEFAUT):
+    """
+    Page d'éléments triés du plus récent au plus ancien
+    Args:
+        champ_date: champ horodaté du tri (départagé par l'id)
+        curseur: valeur « suivant » de la page précédente, None pour la première page
+    Returns:
+        tuple: (liste des éléments, curseur de la page suivante ou None)
+    Raises:
+        CurseurInvalide: si le curseur ne peut pas être décodé
+    """
+    queryset = queryset.order_by(f'-{champ_date}', '-pk')
+    if curseur:
+        moment, pk = decoder_curseur(curseur)
+        # Borne large d'abord pour que l'index sur le champ date serve de plage
+        queryset = queryset.filter(**{f'{champ_date}__lte': moment}).filter(
+            Q(**{f'{champ_date}__lt': moment}) | Q(pk__lt=pk)
+        )
+
+    elements = list(queryset[:taille + 1])
+    if len(elements) <= taille:
+        return elements, None
+    elements = elements[:taille]
+    dernier = elements[-1]
+    return elements, encoder_curseur(getattr(dernier, champ_date), dernier.pk)
@@ -0,0 +1,60 @@
+"""
+Règlement des paris d'une soirée
+
+Un participant « gagne » sa soirée s'il termine premier de son type
+d'établissement (mêmes règles de départage que les classements quotidiens).
+Un pari GAIN est gagné si le participant gagne sa soirée, un pari PERTE s'il
+ne la gagne pas. Tous les paris ouverts d'une soirée sont réglés par des
+UPDATE ensemblistes, sans charger les paris en mémoire.
+"""
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .classements import SoireeNonTerminee
+from .models import DepensesSoiree, Pari, date_soiree_courante
+
+
+def gagnants_soiree(soiree):
+    """Identifiants des participants premiers de leur type d'établissement (une requête)"""
+    return list(DepensesSoiree.objects.filter(
+        date_soiree=soiree,
+        montant_total__gt=0
+    ).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('participant__service__type')],
+            order_by=[F('montant_total').desc(), F('participant__pseudo').asc()]
+        )
+    ).filter(position=1).values_list('participant_id', flat=True))
+
+
+def regler_paris(soiree, paris=None):
+    """
+    Règle les paris ouverts d'une soirée terminée
+    Args:
+        soiree: date de l'événement
+        paris: queryset pour limiter le règlement (action d'administration), tous par défaut
+    Returns:
+        dict: nombre de paris gagnés et perdus
+    Raises:
+        SoireeNonTerminee: si la fenêtre de la soirée n'est pas close
+    """
+    if soiree >= date_soiree_courante():
+        raise SoireeNonTerminee(soiree)
+
+    gagnants = gagnants_soiree(soiree)
+    ouverts = (paris if paris is not None else Pari.objects.all()).filter(
+        date_evenement=soiree, gagne__isnull=True
+    )
+    pari_gagne = Q(evenement='GAIN', participant_id__in=gagnants) | (
+        Q(evenement='PERTE') & ~Q(participant_id__in=gagnants)
+    )
+
+    with transaction.atomic():
+        gagnes = ouverts.filter(pari_gagne).update(
+            gagne=True, montant_gains=F('montant') * F('cote'), resultat_disponible=True
+        )
+        perdus = ouverts.update(gagne=False, montant_gains=None, resultat_disponible=True)
+
+    return {'gagnes': gagnes, 'perdus': perdus}
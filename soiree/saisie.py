@@ -0,0 +1,240 @@
+"""
+Saisie des consommations par lot
+
+Un gestionnaire peut envoyer plusieurs lignes (participant, boisson, quantité)
+en une requête. Les lignes sont validées contre la carte des prix de
+l'établissement, gardée en cache, puis enregistrées en une seule insertion.
+
+Les tablettes hors ligne rejouent leur file de saisies avec une clé
+d'idempotence par saisie : une saisie envoyée deux fois n'est enregistrée
+qu'une fois.
+"""
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django import forms
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Participant, TypeBoisson, ConsommationParticipant, enregistrer_consommations
+
+
+DUREE_CACHE_TARIFS = 3600  # secondes
+TAILLE_MAX_LOT = 500
+TAILLE_MAX_REJEU = 2000
+DELAI_MAX_REJEU = timedelta(hours=48)
+DECALAGE_HORLOGE_TOLERE = timedelta(minutes=5)
+QUANTITE_MAX_LIGNE = 1000
+MONTANT_MAX_LIGNE = 10 ** 10  # montant_total : 12 chiffres dont 2 décimales
+
+
+class LotInvalide(Exception):
+    """Lot refusé : aucune ligne n'est enregistrée"""
+
+    def __init__(self, erreurs):
+        super().__init__(f"{len(erreurs)} ligne(s) invalide(s)")
+        self.erreurs = erreurs
+
+
+def _cle_tarifs(service_id):
+    return f'tarifs_etablissement:{service_id}'
+
+
+def invalider_tarifs(service_id):
+    """Supprime la carte des prix en cache après une modification des boissons"""
+    cache.delete(_cle_tarifs(service_id))
+
+
+def tarifs_etablissement(service_id):
+    """Carte des prix des boissons actives : {type_boisson_id: prix de vente}"""
+    tarifs = cache.get(_cle_tarifs(service_id))
+    if tarifs is None:
+        tarifs = dict(TypeBoisson.objects.filter(
+            service_id=service_id, actif=True
+        ).values_list('id', 'prix_vente'))
+        cache.set(_cle_tarifs(service_id), tarifs, DUREE_CACHE_TARIFS)
+    return tarifs
+
+
+class ChampsLigne(forms.Form):
+    """
+    Bornes des champs saisis d'une ligne, calquées sur ConsommationParticipant
+    Les valeurs non finies, trop longues pour la colonne ou les quantités non
+    entières sont refusées ici plutôt qu'à l'insertion (ou à la relecture).
+    """
+    quantite = forms.IntegerField(min_value=1, max_value=QUANTITE_MAX_LIGNE)
+    prix_unitaire = forms.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+
+
+def _champs_ligne(ligne):
+    """Quantité et prix validés d'une ligne : (quantite, prix_unitaire ou None, message d'erreur)"""
+    formulaire = ChampsLigne({
+        champ: '' if ligne.get(champ) is None else str(ligne.get(champ))
+        for champ in ('quantite', 'prix_unitaire')
+    })
+    if not formulaire.is_valid():
+        if 'quantite' in formulaire.errors:
+            return None, None, f'La quantité doit être un entier entre 1 et {QUANTITE_MAX_LIGNE}.'
+        return None, None, 'Prix unitaire invalide.'
+    return formulaire.cleaned_data['quantite'], formulaire.cleaned_data['prix_unitaire'], None
+
+
+def _entier_positif(valeur):
+    try:
+        valeur = int(valeur)
+    except (TypeError, ValueError):
+        return None
+    return valeur if valeur > 0 else None
+
+
+def _participants_actifs(service_id, lignes):
+    """Identifiants des participants actifs de l'établissement cités dans les lignes"""
+    ids_participants = {_entier_positif(ligne.get('participant')) for ligne in lignes} - {None}
+    return set(Participant.objects.filter(
+        service_id=service_id, actif=True, pk__in=ids_participants
+    ).values_list('pk', flat=True))
+
+
+def _construire_consommation(gestionnaire, ligne, tarifs, participants, moment):
+    """
+    Valide une ligne et construit la consommation correspondante
+    Returns:
+        tuple: (consommation, None) ou (None, message d'erreur)
+    """
+    participant_id = _entier_positif(ligne.get('participant'))
+    type_boisson_id = _entier_positif(ligne.get('type_boisson'))
+
+    if participant_id not in participants:
+        return None, 'Participant inconnu dans cet établissement.'
+    if type_boisson_id not in tarifs:
+        return None, 'Boisson inconnue ou inactive dans cet établissement.'
+    quantite, prix_unitaire, erreur = _champs_ligne(ligne)
+    if erreur:
+        return None, erreur
+    if prix_unitaire is None:
+        prix_unitaire = tarifs[type_boisson_id]
+    if quantite * prix_unitaire >= MONTANT_MAX_LIGNE:
+        return None, 'Montant de la ligne trop élevé.'
+
+    return ConsommationParticipant(
+        participant_id=participant_id, service_id=gestionnaire.service_id, type_boisson_id=type_boisson_id,
+        quantite=quantite, prix_unitaire=prix_unitaire, saisi_par=gestionnaire,
+        date_consommation=moment,
+    ), None
+
+
+def preparer_lot(gestionnaire, lignes):
+    """
+    Valide les lignes d'un lot et construit les consommations (sans les enregistrer)
+    Args:
+        lignes: liste de dicts {'participant', 'type_boisson', 'quantite', 'prix_unitaire' (optionnel)}
+    Raises:
+        LotInvalide: si une ligne est invalide, avec la liste des erreurs par ligne
+    """
+    if not lignes:
+        raise LotInvalide([{'ligne': None, 'erreur': 'Aucune consommation à enregistrer.'}])
+    if len(lignes) > TAILLE_MAX_LOT:
+        raise LotInvalide([{'ligne': None, 'erreur': f'Un lot est limité à {TAILLE_MAX_LOT} lignes.'}])
+
+    tarifs = tarifs_etablissement(gestionnaire.service_id)
+    participants = _participants_actifs(gestionnaire.service_id, lignes)
+    maintenant = timezone.now()
+    consommations, erreurs = [], []
+    for numero, ligne in enumerate(lignes, start=1):
+        consommation, erreur = _construire_consommation(gestionnaire, ligne, tarifs, participants, maintenant)
+        if erreur:
+            erreurs.append({'ligne': numero, 'erreur': erreur})
+        else:
+            consommations.append(consommation)
+
+    if erreurs:
+        raise LotInvalide(erreurs)
+    return consommations
+
+
+def enregistrer_lot(gestionnaire, lignes):
+    """Valide puis enregistre un lot de consommations en une transaction"""
+    return enregistrer_consommations(preparer_lot(gestionnaire, lignes))
+
+
+def _cle_valide(valeur):
+    try:
+        return uuid.UUID(str(valeur))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _moment_saisie(valeur, maintenant):
+    """Horodatage d'origine d'une saisie hors ligne, None s'il est invalide ou hors délai"""
+    moment = parse_datetime(valeur) if isinstance(valeur, str) else None
+    if moment is None:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    if not maintenant - DELAI_MAX_REJEU <= moment <= maintenant + DECALAGE_HORLOGE_TOLERE:
+        return None
+    return moment
+
+
+def rejouer_saisies(gestionnaire, saisies):
+    """
+    Applique une file de saisies enregistrées hors ligne par une tablette
+    Chaque saisie porte une clé d'idempotence générée par le client et son
+    horodatage d'origine. Les clés déjà connues sont écartées en une requête,
+    les saisies valides sont insérées en une fois et les invalides rejetées
+    individuellement, pour que la tablette puisse vider sa file.
+    Args:
+        saisies: liste de dicts {'cle', 'date_consommation', 'participant', 'type_boisson', 'quantite', ...}
+    Returns:
+        dict: {clé: 'enregistree' | 'doublon' | message d'erreur}
+    """
+    maintenant = timezone.now()
+    resultats, a_traiter = {}, {}
+    for saisie in saisies:
+        cle = _cle_valide(saisie.get('cle'))
+        if cle is None:
+            resultats[str(saisie.get('cle'))] = "Clé d'idempotence invalide."
+            continue
+        if str(cle) in resultats or cle in a_traiter:
+            resultats.setdefault(str(cle), 'doublon')
+            continue
+        moment = _moment_saisie(saisie.get('date_consommation'), maintenant)
+        if moment is None:
+            resultats[str(cle)] = 'Horodatage absent, invalide ou hors délai.'
+            continue
+        a_traiter[cle] = (saisie, moment)
+
+    tarifs = tarifs_etablissement(gestionnaire.service_id)
+    participants = _participants_actifs(gestionnaire.service_id, [saisie for saisie, _ in a_traiter.values()])
+
+    for tentative in range(2):
+        # Déduplication ensembliste contre les saisies déjà enregistrées
+        deja_connues = set(ConsommationParticipant.objects.filter(
+            cle_idempotence__in=list(a_traiter)
+        ).order_by().values_list('cle_idempotence', flat=True))
+        consommations = []
+        for cle, (saisie, moment) in a_traiter.items():
+            if cle in deja_connues:
+                resultats[str(cle)] = 'doublon'
+                continue
+            consommation, erreur = _construire_consommation(gestionnaire, saisie, tarifs, participants, moment)
+            if erreur:
+                resultats[str(cle)] = erreur
+                continue
+            consommation.cle_idempotence = cle
+            consommations.append(consommation)
+        try:
+            enregistrer_consommations(consommations)
+        except IntegrityError:
+            # Même file rejouée en parallèle : on recommence la déduplication
+            if tentative:
+                raise
+            continue
+        break
+
+    for consommation in consommations:
+        resultats[str(consommation.cle_idempotence)] = 'enregistree'
+    return resultats
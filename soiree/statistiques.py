@@ -0,0 +1,114 @@
+"""
+Statistiques du dashboard : totaux par période et meilleurs participants
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .models import ConsommationParticipant, Participant, date_soiree_courante
+
+
+DUREE_CACHE_STATISTIQUES = 300  # secondes
+NOMBRE_TOP_PARTICIPANTS = 5
+
+
+def _cle_cache(service_id):
+    return f'statistiques_etablissement:{service_id}'
+
+
+def invalider_statistiques(service_id):
+    """Supprime les statistiques en cache d'un établissement après une saisie"""
+    cache.delete(_cle_cache(service_id))
+
+
+def bornes_periodes(soiree=None):
+    """Premières soirées de la journée, de la semaine et du mois en cours"""
+    if soiree is None:
+        soiree = date_soiree_courante()
+    return soiree, soiree - timedelta(days=soiree.weekday()), soiree.replace(day=1)
+
+
+def _calculer_totaux(service_ids, aujourd_hui, debut_semaine, debut_mois):
+    """Totaux jour / semaine / mois de plusieurs établissements en une seule requête"""
+    lignes = ConsommationParticipant.objects.filter(
+        service_id__in=service_ids,
+        date_soiree__gte=min(debut_semaine, debut_mois)
+    ).values('service_id').annotate(
+        jour=Sum('montant_total', filter=Q(date_soiree=aujourd_hui)),
+        semaine=Sum('montant_total', filter=Q(date_soiree__gte=debut_semaine)),
+        mois=Sum('montant_total', filter=Q(date_soiree__gte=debut_mois)),
+    ).order_by()
+    return {ligne['service_id']: ligne for ligne in lignes}
+
+
+def _calculer_top_participants(service_ids, debut_mois, nombre):
+    """Meilleurs participants du mois de plusieurs établissements en une seule requête"""
+    participants = Participant.objects.filter(
+        consommationparticipant__service_id__in=service_ids,
+        consommationparticipant__date_soiree__gte=debut_mois
+    ).annotate(
+        service_consommation=F('consommationparticipant__service_id'),
+        total_depenses=Sum('consommationparticipant__montant_total'),
+    ).annotate(
+        rang=Window(
+            RowNumber(), partition_by=F('service_consommation'),
+            order_by=[F('total_depenses').desc(), F('pseudo').asc()]
+        )
+    ).filter(rang__lte=nombre).select_related('service', 'user__profile').order_by('-total_depenses', 'pseudo')
+
+    tops = {service_id: [] for service_id in service_ids}
+    for participant in participants:
+        tops[participant.service_consommation].append(participant)
+    return tops
+
+
+def statistiques_etablissements(etablissements, nombre_top=NOMBRE_TOP_PARTICIPANTS):
+    """
+    Statistiques de consommation d'un ensemble d'établissements
+    Les résultats sont mis en cache par établissement et invalidés à chaque saisie.
+    Returns:
+        dict: consommations du jour, de la semaine, du mois et top participants du mois
+    """
+    aujourd_hui, debut_semaine, debut_mois = bornes_periodes()
+    service_ids = [etablissement.pk for etablissement in etablissements]
+
+    en_cache = cache.get_many([_cle_cache(service_id) for service_id in service_ids])
+    statistiques = {}
+    manquants = []
+    for service_id in service_ids:
+        valeur = en_cache.get(_cle_cache(service_id))
+        if valeur and valeur['soiree'] == aujourd_hui and valeur['nombre_top'] >= nombre_top:
+            statistiques[service_id] = valeur
+        else:
+            manquants.append(service_id)
+
+    if manquants:
+        totaux = _calculer_totaux(manquants, aujourd_hui, debut_semaine, debut_mois)
+        tops = _calculer_top_participants(manquants, debut_mois, nombre_top)
+        nouvelles = {}
+        for service_id in manquants:
+            ligne = totaux.get(service_id, {})
+            statistiques[service_id] = nouvelles[_cle_cache(service_id)] = {
+                'soiree': aujourd_hui,
+                'nombre_top': nombre_top,
+                'jour': ligne.get('jour') or 0,
+                'semaine': ligne.get('semaine') or 0,
+                'mois': ligne.get('mois') or 0,
+                'top_participants': tops[service_id],
+            }
+        cache.set_many(nouvelles, DUREE_CACHE_STATISTIQUES)
+
+    valeurs = statistiques.values()
+    top_participants = sorted(
+        (participant for valeur in valeurs for participant in valeur['top_participants']),
+        key=lambda participant: participant.total_depenses,
+        reverse=True
+    )[:nombre_top]
+    return {
+        'consommations_aujourd_hui': sum(valeur['jour'] for valeur in valeurs),
+        'consommations_semaine': sum(valeur['semaine'] for valeur in valeurs),
+        'consommations_mois': sum(valeur['mois'] for valeur in valeurs),
+        'top_participants': top_participants,
+    }
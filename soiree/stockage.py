@@ -0,0 +1,134 @@
+"""
+Stockage des médias adressé par contenu
+
+Chaque fichier est rangé une seule fois sous MEDIA_ROOT/.contenu/<empreinte>,
+l'empreinte étant le SHA-256 de ses octets. Les noms utilisés par les modèles
+(videos/demandes/x.webm, photos/participants/y.jpg, ...) sont des liens physiques
+vers ce contenu : les URL et FieldFile.path ne changent pas, deux fichiers
+identiques n'occupent la place qu'une fois, et « copier » un fichier (vidéo
+d'une demande vers son établissement) revient à créer un lien.
+
+Les fichiers ne sont jamais modifiés sur place (Django enregistre toujours un
+nouveau nom), ce qui rend le partage d'un même inode sans danger. Un contenu
+qui n'a plus que son lien sous .contenu n'est plus utilisé : voir contenus_orphelins().
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+
+DOSSIER_CONTENU = '.contenu'
+AGE_MIN_TEMPORAIRE = 3600  # secondes : un .tmp plus récent peut être en cours d'écriture
+
+
+class StockageContenu(FileSystemStorage):
+    """FileSystemStorage dont les fichiers sont des liens vers un contenu dédupliqué"""
+
+    @property
+    def racine_contenu(self):
+        return os.path.join(self.location, DOSSIER_CONTENU)
+
+    def chemin_contenu(self, empreinte):
+        return os.path.join(self.racine_contenu, empreinte[:2], empreinte)
+
+    def _ranger(self, temporaire, empreinte):
+        """Range un fichier temporaire sous son empreinte (supprimé si le contenu existe déjà)"""
+        contenu = self.chemin_contenu(empreinte)
+        if os.path.exists(contenu):
+            os.remove(temporaire)
+        else:
+            os.makedirs(os.path.dirname(contenu), exist_ok=True)
+            os.chmod(temporaire, self.file_permissions_mode or 0o644)
+            os.replace(temporaire, contenu)
+        return contenu
+
+    def _lier(self, contenu, name):
+        """Crée le nom `name` vers le contenu ; renvoie le nom réellement utilisé"""
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        while True:
+            try:
+                os.link(contenu, self.path(name))
+            except FileExistsError:
+                name = self.get_available_name(name)
+            except OSError:
+                # Liens physiques impossibles (système de fichiers) : copie classique
+                if os.path.exists(self.path(name)):
+                    name = self.get_available_name(name)
+                    continue
+                shutil.copy2(contenu, self.path(name))
+                return name
+            else:
+                # Date de modification rafraîchie : un contenu déjà connu compte comme récent
+                # (le nettoyage des médias épargne les fichiers récents)
+                os.utime(self.path(name))
+                return name
+
+    def _save(self, name, content):
+        os.makedirs(self.racine_contenu, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            # Gros envoi déjà sur disque : empreinte puis déplacement, sans recopie
+            with open(content.temporary_file_path(), 'rb') as fichier:
+                empreinte = hashlib.file_digest(fichier, 'sha256').hexdigest()
+            descripteur, temporaire = tempfile.mkstemp(dir=self.racine_contenu, suffix='.tmp')
+            os.close(descripteur)
+            file_move_safe(content.temporary_file_path(), temporaire, allow_overwrite=True)
+        else:
+            calcul = hashlib.sha256()
+            descripteur, temporaire = tempfile.mkstemp(dir=self.racine_contenu, suffix='.tmp')
+            with os.fdopen(descripteur, 'wb') as fichier:
+                for morceau in content.chunks():
+                    calcul.update(morceau)
+                    fichier.write(morceau)
+            empreinte = calcul.hexdigest()
+        return self._lier(self._ranger(temporaire, empreinte), name).replace('\\', '/')
+
+    def dupliquer(self, source, name):
+        """« Copie » du fichier `source` sous le nom `name` : un lien vers le même contenu"""
+        return self._lier(self.path(source), name).replace('\\', '/')
+
+    def indexer(self, name):
+        """
+        Rattache un fichier existant (écrit hors du stockage) au contenu dédupliqué
+        Returns:
+            int: octets libérés (le contenu existait déjà sous un autre inode)
+        """
+        chemin = self.path(name)
+        with open(chemin, 'rb') as fichier:
+            empreinte = hashlib.file_digest(fichier, 'sha256').hexdigest()
+        contenu = self.chemin_contenu(empreinte)
+        if not os.path.exists(contenu):
+            os.makedirs(os.path.dirname(contenu), exist_ok=True)
+            try:
+                os.link(chemin, contenu)
+            except OSError:
+                pass  # pas de lien possible : le fichier reste tel quel
+            return 0
+        if os.path.samefile(chemin, contenu):
+            return 0
+        # Doublon : le nom est remplacé atomiquement par un lien vers le contenu existant
+        temporaire = f'{chemin}.{os.getpid()}.lien'
+        try:
+            os.link(contenu, temporaire)
+        except OSError:
+            return 0
+        etat = os.stat(chemin)
+        os.replace(temporaire, chemin)
+        return etat.st_size if etat.st_nlink == 1 else 0
+
+    def contenus_orphelins(self):
+        """Contenus qui ne sont plus liés à aucun nom (seul lien restant : .contenu)"""
+        limite = time.time() - AGE_MIN_TEMPORAIRE
+        for dossier, _, fichiers in os.walk(self.racine_contenu):
+            for nom in fichiers:
+                chemin = os.path.join(dossier, nom)
+                etat = os.stat(chemin)
+                if nom.endswith('.tmp'):
+                    if etat.st_mtime < limite:
+                        yield chemin
+                elif etat.st_nlink == 1:
+                    yield chemin
@@ -0,0 +1,314 @@
+"""
+Tableau des classements de la soirée en mémoire
+
+Les totaux des établissements et des participants de la soirée en cours sont
+gardés triés par type d'établissement. Chaque saisie validée met à jour le
+tableau directement, et les pages de classement lisent le top N ou le rang
+d'un établissement sans agréger en base.
+
+Chaque processus a son propre tableau : il est rechargé depuis les cumuls de
+soirée au démarrage, au changement de soirée, dès que la version partagée des
+classements (versions.py) diffère de celle du dernier chargement, et au plus
+tard toutes les DUREE_SYNCHRONISATION secondes. Les saisies faites par les
+autres processus sont ainsi visibles à la première lecture qui suit, et une
+réponse ne porte jamais un ETag plus récent que les données qu'elle contient.
+Les requêtes (rechargement, recherche d'un participant inconnu) sont faites
+hors du verrou, qui ne protège que la lecture et le remplacement des données
+en mémoire. La comparaison aux totaux SQL (verifier_coherence) n'est faite au
+rechargement qu'en DEBUG : avec plusieurs processus, les saisies des autres
+produisent des écarts attendus.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q, Sum
+
+from .versions import PORTEE_CLASSEMENTS, version_donnees
+from .models import (
+    Service, Participant, ConsommationParticipant, VentesSoiree, DepensesSoiree,
+    HEURE_OUVERTURE_SOIREE, HEURE_FERMETURE_SOIREE,
+    dans_fenetre_classement, date_soiree, date_soiree_courante,
+)
+
+
+logger = logging.getLogger(__name__)
+
+DUREE_SYNCHRONISATION = 60  # secondes
+
+
+class Classement:
+    """
+    Totaux triés par montant décroissant, avec recherche du rang par dichotomie
+    Le rang se lit en O(log n). Une mise à jour retire et réinsère l'élément
+    dans une liste Python : O(n), mais le décalage est une copie mémoire faite
+    en C, plus rapide qu'un arbre équilibré écrit en Python jusqu'au-delà de
+    100 000 éléments par type (quelques centaines en pratique).
+    """
+
+    def __init__(self, totaux=None):
+        self._totaux = dict(totaux or {})
+        self._ordre = sorted((-total, identifiant) for identifiant, total in self._totaux.items())
+
+    def __len__(self):
+        return len(self._ordre)
+
+    def __contains__(self, identifiant):
+        return identifiant in self._totaux
+
+    def total(self, identifiant):
+        return self._totaux.get(identifiant)
+
+    def ajouter(self, identifiant, montant):
+        """Ajoute un montant (éventuellement négatif) au total d'un élément"""
+        ancien = self._totaux.get(identifiant)
+        if ancien is not None:
+            del self._ordre[bisect_left(self._ordre, (-ancien, identifiant))]
+        nouveau = (ancien or Decimal('0')) + montant
+        self._totaux[identifiant] = nouveau
+        insort(self._ordre, (-nouveau, identifiant))
+
+    def rang(self, identifiant):
+        """Position (à partir de 1) d'un élément, None s'il n'est pas classé"""
+        total = self._totaux.get(identifiant)
+        if total is None:
+            return None
+        return bisect_left(self._ordre, (-total, identifiant)) + 1
+
+    def top(self, nombre=None):
+        """Liste (identifiant, total) des premiers éléments"""
+        ordre = self._ordre if nombre is None else self._ordre[:nombre]
+        return [(identifiant, -total) for total, identifiant in ordre]
+
+    def totaux(self):
+        return dict(self._totaux)
+
+
+class TableauClassements:
+    """Classements de la soirée en cours, par type d'établissement"""
+
+    def __init__(self):
+        self._verrou = threading.RLock()
+        self._soiree = None
+        self._synchronise_a = 0
+        self._version = None  # version des classements lue avant le dernier chargement
+        self._etablissements = {}  # type -> Classement des services
+        self._participants = {}  # type -> Classement des participants
+        self._noms = {}  # service_id -> nom
+        self._types_services = {}  # service_id -> type
+        self._types_participants = {}  # participant_id -> type
+
+    def invalider(self):
+        """Force un rechargement depuis la base à la prochaine lecture"""
+        with self._verrou:
+            self._soiree = None
+
+    def _a_jour(self, version):
+        return (
+            self._soiree == date_soiree_courante()
+            and self._version == version
+            and time.monotonic() - self._synchronise_a < DUREE_SYNCHRONISATION
+        )
+
+    def _charger(self, soiree):
+        """Lit les établissements visibles et les cumuls de la soirée"""
+        services = list(Service.objects.filter(
+            actif=True, types_boissons_enregistres=True
+        ).values_list('id', 'nom', 'type'))
+        ventes = dict(VentesSoiree.objects.filter(
+            date_soiree=soiree, service__actif=True, service__types_boissons_enregistres=True
+        ).values_list('service_id', 'montant_total'))
+        depenses = DepensesSoiree.objects.filter(
+            date_soiree=soiree, participant__service__actif=True,
+            participant__service__types_boissons_enregistres=True
+        ).values_list('participant_id', 'participant__service__type', 'montant_total')
+
+        etablissements = {type_etablissement: {} for type_etablissement, _ in Service.TYPE_CHOICES}
+        participants = {type_etablissement: {} for type_etablissement, _ in Service.TYPE_CHOICES}
+        noms, types_services, types_participants = {}, {}, {}
+        for service_id, nom, type_etablissement in services:
+            etablissements[type_etablissement][service_id] = ventes.get(service_id, Decimal('0'))
+            noms[service_id] = nom
+            types_services[service_id] = type_etablissement
+        for participant_id, type_etablissement, montant in depenses:
+            participants[type_etablissement][participant_id] = montant
+            types_participants[participant_id] = type_etablissement
+
+        return {
+            'etablissements': {t: Classement(totaux) for t, totaux in etablissements.items()},
+            'participants': {t: Classement(totaux) for t, totaux in participants.items()},
+            'noms': noms,
+            'types_services': types_services,
+            'types_participants': types_participants,
+        }
+
+    def synchroniser(self, version=None):
+        """Recharge le tableau depuis la base (requêtes hors du verrou)"""
+        if version is None:
+            # Lue avant les cumuls : les données chargées sont au moins aussi récentes
+            version = version_donnees(PORTEE_CLASSEMENTS)
+        soiree = date_soiree_courante()
+        if settings.DEBUG and self._soiree == soiree:
+            ecarts = self.verifier_coherence()
+            if ecarts:
+                logger.warning("Tableau des classements incohérent, rechargement : %s", ecarts)
+        donnees = self._charger(soiree)
+        with self._verrou:
+            self._soiree = soiree
+            self._synchronise_a = time.monotonic()
+            self._version = version
+            self._etablissements = donnees['etablissements']
+            self._participants = donnees['participants']
+            self._noms = donnees['noms']
+            self._types_services = donnees['types_services']
+            self._types_participants = donnees['types_participants']
+
+    prechauffer = synchroniser
+
+    def _lecture(self, version=None):
+        """
+        À appeler avant de prendre le verrou : le rechargement interroge la base
+        Une vue qui a déjà lu la version des classements la passe pour éviter
+        une nouvelle lecture du cache.
+        """
+        if version is None:
+            version = version_donnees(PORTEE_CLASSEMENTS)
+        if not self._a_jour(version):
+            self.synchroniser(version)
+
+    def enregistrer(self, service_id, participant_id, moment, montant):
+        """Répercute une consommation validée (montant négatif pour une annulation)"""
+        if moment is None or not dans_fenetre_classement(moment):
+            return
+        type_participant = self._types_participants.get(participant_id)
+        if type_participant is None:
+            # Participant inconnu (inscrit depuis le dernier chargement) : lu avant de verrouiller
+            type_participant = Participant.objects.filter(
+                pk=participant_id
+            ).values_list('service__type', flat=True).first()
+        with self._verrou:
+            if self._soiree is None or date_soiree(moment) != self._soiree:
+                # Autre soirée : la soirée courante sera rechargée à la prochaine lecture
+                if self._soiree is not None and date_soiree(moment) > self._soiree:
+                    self._soiree = None
+                return
+            type_service = self._types_services.get(service_id)
+            if type_service is None:
+                # Établissement inconnu (nouveau ou masqué) : rechargement différé
+                self._soiree = None
+                return
+            self._etablissements[type_service].ajouter(service_id, montant)
+            if type_participant is None:
+                return
+            self._types_participants[participant_id] = type_participant
+            self._participants[type_participant].ajouter(participant_id, montant)
+
+    def top_etablissements(self, type_etablissement, nombre=None, version=None):
+        """Liste de dicts {'id', 'nom', 'total_ventes', 'position'}"""
+        self._lecture(version)
+        with self._verrou:
+            return [
+                {'id': service_id, 'nom': self._noms[service_id], 'total_ventes': total, 'position': position}
+                for position, (service_id, total)
+                in enumerate(self._etablissements[type_etablissement].top(nombre), start=1)
+            ]
+
+    def top_participants(self, type_etablissement, nombre=None, version=None):
+        """Liste de tuples (participant_id, total des dépenses)"""
+        self._lecture(version)
+        with self._verrou:
+            return self._participants[type_etablissement].top(nombre)
+
+    def rang_etablissement(self, service_id, version=None):
+        self._lecture(version)
+        with self._verrou:
+            type_etablissement = self._types_services.get(service_id)
+            if type_etablissement is None:
+                return None
+            return self._etablissements[type_etablissement].rang(service_id)
+
+    def rang_participant(self, participant_id, version=None):
+        self._lecture(version)
+        with self._verrou:
+            type_etablissement = self._types_participants.get(participant_id)
+            if type_etablissement is None:
+                return None
+            return self._participants[type_etablissement].rang(participant_id)
+
+    def verifier_coherence(self):
+        """
+        Compare les totaux en mémoire aux totaux calculés en SQL sur les consommations
+        Les totaux sont copiés sous le verrou, l'agrégation SQL de la soirée est faite après.
+        Returns:
+            list: écarts (type d'élément, identifiant, total en mémoire, total SQL)
+        """
+        with self._verrou:
+            soiree = self._soiree
+            en_memoire = {'etablissement': {}, 'participant': {}}
+            for element, classements in (
+                ('etablissement', self._etablissements), ('participant', self._participants),
+            ):
+                for classement in classements.values():
+                    en_memoire[element].update(classement.totaux())
+        if soiree is None:
+            return []
+        consommations = ConsommationParticipant.objects.filter(
+            Q(date_consommation__time__gte=HEURE_OUVERTURE_SOIREE) |
+            Q(date_consommation__time__lt=HEURE_FERMETURE_SOIREE),
+            date_soiree=soiree
+        )
+        ecarts = []
+        for element, champ in (('etablissement', 'service_id'), ('participant', 'participant_id')):
+            en_base = dict(
+                consommations.values_list(champ).annotate(total=Sum('montant_total')).order_by()
+            )
+            for identifiant, total in en_memoire[element].items():
+                attendu = en_base.get(identifiant) or Decimal('0')
+                if total != attendu:
+                    ecarts.append((element, identifiant, total, attendu))
+        return ecarts
+
+
+tableau_classements = TableauClassements()
+
+
+def prechauffer_tableau():
+    """Charge le tableau au démarrage du serveur (sans bloquer si la base n'est pas prête)"""
+    try:
+        tableau_classements.prechauffer()
+    except DatabaseError as e:
+        logger.warning("Préchargement du tableau des classements impossible : %s", e)
+
+
+def etablissements_du_tableau(type_etablissement, nombre=None, avec_ventes=False, version=None):
+    """Établissements classés, annotés de total_ventes, dans l'ordre du tableau"""
+    lignes = tableau_classements.top_etablissements(type_etablissement, nombre, version=version)
+    if avec_ventes:
+        lignes = [ligne for ligne in lignes if ligne['total_ventes'] > 0]
+    services = Service.objects.in_bulk([ligne['id'] for ligne in lignes])
+    classes = []
+    for ligne in lignes:
+        service = services.get(ligne['id'])
+        if service is not None:
+            service.total_ventes = ligne['total_ventes']
+            classes.append(service)
+    return classes
+
+
+def participants_du_tableau(type_etablissement, nombre=None, version=None):
+    """Participants classés, annotés de total_depenses, dans l'ordre du tableau"""
+    lignes = tableau_classements.top_participants(type_etablissement, nombre, version=version)
+    participants = Participant.objects.select_related('service', 'user__profile').in_bulk(
+        [participant_id for participant_id, _ in lignes]
+    )
+    classes = []
+    for participant_id, total in lignes:
+        participant = participants.get(participant_id)
+        if participant is not None:
+            participant.total_depenses = total
+            classes.append(participant)
+    return classes
@@ -0,0 +1,231 @@
+"""
+Envoi des vidéos d'établissement par blocs, avec reprise
+
+Le navigateur annonce la taille de la vidéo, envoie ensuite les octets bloc par
+bloc (chaque bloc indique sa position : en-tête Upload-Offset) puis demande la
+finalisation. Les blocs sont écrits directement à la suite du fichier partiel,
+lus par morceaux de TAILLE_LECTURE : la mémoire utilisée ne dépend pas de la
+longueur de la vidéo. Après une coupure, le client relit la position reçue
+(`recu`) et reprend à partir de là.
+
+Chaque envoi appartient à la session du navigateur qui l'a ouvert ; une même
+session ne peut avoir que TELEVERSEMENTS_OUVERTS_MAX envois en cours, une même
+adresse IP TELEVERSEMENTS_OUVERTS_MAX_ADRESSE (voir adresse_client : derrière
+un proxy, l'adresse vient de l'en-tête réglé dans ADRESSE_CLIENT_META). Un
+envoi inactif depuis DUREE_INACTIVITE_MAX est expiré (le fichier
+partiel est supprimé par nettoyer_media). Avant d'écrire un bloc, la position
+est réservée par une mise à jour conditionnelle : deux envois simultanés à la
+même position ne peuvent pas écrire tous les deux dans le fichier.
+
+    POST  /api/videos/televersements/                      {"taille": n, "type": "video/webm"}
+    PATCH /api/videos/televersements/<id>/                 octets, Upload-Offset: position
+    GET   /api/videos/televersements/<id>/                 position de reprise
+    POST  /api/videos/televersements/<id>/terminer/        fichier final dans videos/demandes
+"""
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.validators import validate_ipv46_address
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TeleversementVideo
+
+
+DOSSIER_VIDEOS = 'videos/demandes'
+DOSSIER_PARTIELS = 'videos/demandes/partiels'
+TAILLE_BLOC = 1024 * 1024  # taille conseillée au client
+TAILLE_BLOC_MAX = 8 * 1024 * 1024
+TAILLE_LECTURE = 64 * 1024
+TAILLE_VIDEO_MAX_DEFAUT = 100 * 1024 * 1024
+TELEVERSEMENTS_OUVERTS_MAX = 3  # par session
+TELEVERSEMENTS_OUVERTS_MAX_ADRESSE = 10  # par adresse IP (plusieurs clients derrière un même NAT)
+DUREE_INACTIVITE_MAX = timedelta(hours=2)
+DUREE_BLOC_MAX = timedelta(minutes=10)  # au-delà, un bloc réservé est considéré abandonné
+EXTENSIONS = {
+    'video/webm': 'webm',
+    'video/mp4': 'mp4',
+    'video/quicktime': 'mov',
+    'video/x-msvideo': 'avi',
+}
+
+
+class TeleversementInvalide(Exception):
+    """Demande refusée ; `recu` indique la position de reprise quand elle est connue"""
+
+    def __init__(self, message, recu=None):
+        super().__init__(message)
+        self.recu = recu
+
+
+class PositionIncorrecte(TeleversementInvalide):
+    """Bloc envoyé à une autre position que celle attendue par le serveur"""
+
+
+class TropDeTeleversements(TeleversementInvalide):
+    """La session ou l'adresse IP a déjà le nombre maximum d'envois en cours"""
+
+
+def adresse_client(meta):
+    """
+    Adresse IP du client d'après request.META, ou None
+    ADRESSE_CLIENT_META désigne la clé à lire : REMOTE_ADDR par défaut,
+    l'en-tête posé par le proxy de confiance derrière nginx (HTTP_X_REAL_IP,
+    HTTP_X_FORWARDED_FOR : dernière adresse ajoutée), None pour ne pas limiter
+    les envois par adresse.
+    """
+    cle = getattr(settings, 'ADRESSE_CLIENT_META', 'REMOTE_ADDR')
+    adresse = (meta.get(cle) or '').split(',')[-1].strip() if cle else ''
+    try:
+        validate_ipv46_address(adresse)
+    except ValidationError:
+        return None
+    return adresse
+
+
+def _chemin_absolu(chemin):
+    return os.path.join(settings.MEDIA_ROOT, chemin)
+
+
+def televersements_ouverts():
+    """Envois non terminés et actifs depuis moins de DUREE_INACTIVITE_MAX"""
+    return TeleversementVideo.objects.filter(
+        termine=False, date_mise_a_jour__gte=timezone.now() - DUREE_INACTIVITE_MAX
+    )
+
+
+def televersement_du_client(identifiant, cle_session):
+    """Envoi ouvert par cette session, ou None"""
+    if not cle_session:
+        return None
+    return TeleversementVideo.objects.filter(pk=identifiant, cle_session=cle_session).first()
+
+
+def creer_televersement(taille, type_contenu, cle_session, adresse_ip=None):
+    """Ouvre un téléversement pour une session et crée le fichier partiel vide"""
+    taille_max = getattr(settings, 'VIDEO_TAILLE_MAX', TAILLE_VIDEO_MAX_DEFAUT)
+    if not isinstance(taille, int) or isinstance(taille, bool) or taille <= 0:
+        raise TeleversementInvalide('La taille doit être un entier positif.')
+    if taille > taille_max:
+        raise TeleversementInvalide(f'Vidéo trop volumineuse (maximum {taille_max // (1024 * 1024)} Mo).')
+    type_contenu = (type_contenu or '').split(';')[0].strip().lower()
+    if type_contenu not in EXTENSIONS:
+        raise TeleversementInvalide('Format vidéo non pris en charge.')
+    ouverts = televersements_ouverts()
+    if ouverts.filter(cle_session=cle_session).count() >= TELEVERSEMENTS_OUVERTS_MAX or (
+        adresse_ip and ouverts.filter(adresse_ip=adresse_ip).count() >= TELEVERSEMENTS_OUVERTS_MAX_ADRESSE
+    ):
+        raise TropDeTeleversements('Trop d\'envois de vidéo en cours : terminez-en un avant d\'en commencer un autre.')
+
+    identifiant = uuid.uuid4()
+    chemin = f'{DOSSIER_PARTIELS}/{identifiant}.part'
+    os.makedirs(_chemin_absolu(DOSSIER_PARTIELS), exist_ok=True)
+    open(_chemin_absolu(chemin), 'wb').close()
+    return TeleversementVideo.objects.create(
+        id=identifiant, taille=taille, type_contenu=type_contenu, chemin=chemin,
+        cle_session=cle_session, adresse_ip=adresse_ip
+    )
+
+
+def ajouter_bloc(televersement, position, flux, longueur):
+    """
+    Écrit un bloc lu depuis `flux` à la position `position` du fichier partiel
+    La position est d'abord réservée en base (bloc_commence) : un envoi
+    simultané à la même position est refusé sans toucher au fichier. Les
+    octets déjà écrits au-delà de la position enregistrée (bloc interrompu)
+    sont écrasés. Si la connexion tombe au milieu du bloc, la partie reçue est
+    conservée et la nouvelle position renvoyée au client par l'exception.
+    Returns:
+        int: nouvelle position de reprise
+    """
+    if televersement.termine:
+        raise TeleversementInvalide('Téléversement déjà terminé.', televersement.recu)
+    if position != televersement.recu:
+        raise PositionIncorrecte('Position inattendue.', televersement.recu)
+    if longueur is None or longueur <= 0 or longueur > TAILLE_BLOC_MAX:
+        raise TeleversementInvalide(f'Bloc de 1 à {TAILLE_BLOC_MAX} octets attendu.', televersement.recu)
+    if position + longueur > televersement.taille:
+        raise TeleversementInvalide('Le bloc dépasse la taille annoncée.', televersement.recu)
+    if televersement.date_mise_a_jour < timezone.now() - DUREE_INACTIVITE_MAX:
+        raise TeleversementInvalide('Téléversement expiré : recommencer l\'envoi.')
+
+    # Réservation de la position avant toute écriture : une seule requête l'obtient
+    reservation = timezone.now()
+    if not TeleversementVideo.objects.filter(
+        Q(bloc_commence__isnull=True) | Q(bloc_commence__lt=reservation - DUREE_BLOC_MAX),
+        pk=televersement.pk, recu=position, termine=False,
+    ).update(bloc_commence=reservation):
+        televersement.refresh_from_db()
+        raise PositionIncorrecte('Bloc déjà reçu ou en cours d\'envoi.', televersement.recu)
+
+    ecrits = 0
+    interrompu = False
+    try:
+        with open(_chemin_absolu(televersement.chemin), 'r+b') as fichier:
+            fichier.seek(position)
+            fichier.truncate()
+            while ecrits < longueur:
+                try:
+                    morceau = flux.read(min(TAILLE_LECTURE, longueur - ecrits))
+                except OSError:
+                    morceau = b''
+                if not morceau:
+                    interrompu = True
+                    break
+                fichier.write(morceau)
+                ecrits += len(morceau)
+    finally:
+        recu = position + ecrits
+        liberee = TeleversementVideo.objects.filter(pk=televersement.pk, bloc_commence=reservation).update(
+            recu=recu, bloc_commence=None, date_mise_a_jour=timezone.now()
+        )
+    if not liberee:
+        # Réservation reprise par un autre envoi après DUREE_BLOC_MAX
+        televersement.refresh_from_db()
+        raise PositionIncorrecte('Bloc abandonné.', televersement.recu)
+    televersement.recu = recu
+    if interrompu:
+        raise TeleversementInvalide('Bloc incomplet : reprendre à la position indiquée.', recu)
+    return recu
+
+
+def terminer_televersement(televersement):
+    """Déplace le fichier complet dans videos/demandes (sans effet s'il l'est déjà)"""
+    if televersement.termine:
+        return televersement
+    if televersement.recu != televersement.taille:
+        raise TeleversementInvalide('Vidéo incomplète.', televersement.recu)
+
+    extension = EXTENSIONS[televersement.type_contenu]
+    chemin = default_storage.get_available_name(
+        f'{DOSSIER_VIDEOS}/video_enregistree_{televersement.pk.hex[:8]}.{extension}'
+    )
+    try:
+        os.replace(_chemin_absolu(televersement.chemin), _chemin_absolu(chemin))
+    except FileNotFoundError:
+        # Finalisation simultanée : l'autre requête a déjà déplacé le fichier
+        televersement.refresh_from_db()
+        if televersement.termine:
+            return televersement
+        raise TeleversementInvalide('Fichier partiel introuvable.', 0)
+    if hasattr(default_storage, 'indexer'):
+        default_storage.indexer(chemin)
+    TeleversementVideo.objects.filter(pk=televersement.pk).update(
+        chemin=chemin, termine=True, date_mise_a_jour=timezone.now()
+    )
+    televersement.chemin = chemin
+    televersement.termine = True
+    return televersement
+
+
+def video_terminee(identifiant, cle_session):
+    """Téléversement terminé par cette session et pas encore rattaché à une demande, ou None"""
+    if not identifiant or not cle_session:
+        return None
+    return TeleversementVideo.objects.filter(
+        pk=identifiant, cle_session=cle_session, termine=True, demande__isnull=True
+    ).first()
@@ -0,0 +1,12 @@
+from django import template
+
+from soiree.images import url_variante as _url_variante
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def url_variante(fichier, variantes, taille, format_='jpeg'):
+    """{% url_variante participant.photo participant.photo_variantes 'vignette' 'webp' %}"""
+    return _url_variante(fichier, variantes, taille, format_)
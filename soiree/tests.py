@@ -1,3 +1,1719 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import ExifTags, Image
+
+from conf import urls as urls_projet
+
+from .models import (
+    Service, TypeBoisson, Gestionnaire, Participant, ConsommationParticipant,
+    VentesSoiree, DepensesSoiree, ClassementQuotidien, ClassementEtablissement, Pari, Trophee,
+    DemandeAdhesion, Profile, PseudoReserve, PseudoIndisponible, TeleversementVideo,
+    date_soiree, enregistrer_consommations, date_soiree_courante, normaliser_pseudo, pseudo_disponible,
+)
+from .classements import reconstruire_ventes_soiree, materialiser_classements
+from .statistiques import statistiques_etablissements
+from .versions import PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS, incrementer_version, version_donnees
+from .diffusion import DiffuseurClassements, diffuseur_classements, flux_evenements
+from .tableau_classements import Classement, TableauClassements, tableau_classements
+from .saisie import tarifs_etablissement
+from .pagination import paginer
+from .reglement_paris import SoireeNonTerminee, regler_paris
+from .attribution_trophees import attribuer_trophees
+from .televersement import (
+    adresse_client, ajouter_bloc, TeleversementInvalide, TELEVERSEMENTS_OUVERTS_MAX, TELEVERSEMENTS_OUVERTS_MAX_ADRESSE,
+)
+from .images import ImageTropGrande, ouvrir_image, retirer_metadonnees, url_variante
+from .charge import (
+    PARCOURS, ClientProcessus, Mesures, UtilisateurVirtuel, charger_comptes, comparer, instantane_base,
+    nettoyer_charge, percentile, rapport,
+)
+
+
+def moment(annee, mois, jour, heure, minute=0):
+    """Datetime « aware » dans le fuseau du projet"""
+    return timezone.make_aware(datetime(annee, mois, jour, heure, minute))
+
+
+def requetes_hors_cache(requetes):
+    """
+    Requêtes SQL capturées, sans les accès au cache partagé (table du DatabaseCache)
+    ni les points de sauvegarde dont le cache entoure ses écritures.
+    """
+    table = settings.CACHES['default']['LOCATION']
+    return [
+        requete['sql'] for requete in requetes.captured_queries
+        if f'"{table}"' not in requete['sql'] and not requete['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+    ]
+
+
+class DonneesSoireeMixin:
+    """Jeu de données minimal : un maquis, une boîte, leurs gestionnaires et participants"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'motdepasse')
+        cls.maquis = cls.creer_service('Maquis Test', 'maquis')
+        cls.boite = cls.creer_service('Boîte Test', 'boite')
+        cls.biere = TypeBoisson.objects.create(service=cls.maquis, categorie='brakina', prix_vente=Decimal('700'))
+        cls.champagne = TypeBoisson.objects.create(service=cls.boite, categorie='champagne', prix_vente=Decimal('50000'))
+        cls.gerant_maquis = cls.creer_gestionnaire('gerant_maquis', cls.maquis)
+        cls.gerant_boite = cls.creer_gestionnaire('gerant_boite', cls.boite)
+        cls.alice = cls.creer_participant('alice', cls.maquis)
+        cls.bob = cls.creer_participant('bob', cls.maquis)
+        cls.chloe = cls.creer_participant('chloe', cls.boite)
+
+    def setUp(self):
+        super().setUp()
+        tableau_classements.invalider()
+
+    @contextmanager
+    def assertNumQueriesHorsCache(self, nombre):
+        """assertNumQueries sans compter les lectures / écritures du cache partagé"""
+        with CaptureQueriesContext(connection) as requetes:
+            yield
+        sql = requetes_hors_cache(requetes)
+        self.assertEqual(len(sql), nombre, '\n'.join(sql))
+
+    @classmethod
+    def creer_service(cls, nom, type_etablissement):
+        return Service.objects.create(
+            nom=nom, type=type_etablissement, localisation='Zone 1', adresse='Zone 1, Ouagadougou',
+            proprietaire=cls.admin, types_boissons_enregistres=True
+        )
+
+    @classmethod
+    def creer_gestionnaire(cls, pseudo, service):
+        user = User.objects.create_user(pseudo, f'{pseudo}@example.com', 'motdepasse')
+        return Gestionnaire.objects.create(
+            user=user, pseudo=pseudo, tel='70000000', service=service, fonction='gerant'
+        )
+
+    @classmethod
+    def creer_participant(cls, pseudo, service):
+        user = User.objects.create_user(pseudo, f'{pseudo}@example.com', 'motdepasse')
+        return Participant.objects.create(user=user, pseudo=pseudo, service=service)
+
+    def consommer(self, participant, quantite, quand):
+        """Enregistre une consommation à un instant donné"""
+        service = participant.service
+        boisson = self.biere if service == self.maquis else self.champagne
+        gerant = self.gerant_maquis if service == self.maquis else self.gerant_boite
+        return ConsommationParticipant.objects.create(
+            participant=participant, service=service, type_boisson=boisson,
+            quantite=quantite, prix_unitaire=boisson.prix_vente, saisi_par=gerant,
+            date_consommation=quand
+        )
+
+    def consommer_et_valider(self, participant, quantite, quand):
+        """Enregistre une consommation et exécute les traitements d'après commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.consommer(participant, quantite, quand)
+
+
+class VentesSoireeTests(DonneesSoireeMixin, TestCase):
+    """Cumuls de ventes par soirée (17h30 - 11h00)"""
+
+    def test_date_soiree(self):
+        self.assertEqual(date_soiree(moment(2025, 8, 15, 23)), date(2025, 8, 15))
+        self.assertEqual(date_soiree(moment(2025, 8, 16, 3)), date(2025, 8, 15))
+        self.assertEqual(date_soiree(moment(2025, 8, 16, 12)), date(2025, 8, 16))
+
+    def test_cumul_incremental(self):
+        self.consommer(self.alice, 2, moment(2025, 8, 15, 22))
+        self.consommer(self.bob, 1, moment(2025, 8, 16, 2))
+        self.consommer(self.alice, 5, moment(2025, 8, 16, 14))  # hors fenêtre de classement
+
+        ventes = VentesSoiree.objects.get(service=self.maquis, date_soiree=date(2025, 8, 15))
+        self.assertEqual(ventes.montant_total, Decimal('2100'))
+        self.assertEqual(ventes.nombre_consommations, 2)
+        self.assertEqual(
+            DepensesSoiree.objects.get(participant=self.alice, date_soiree=date(2025, 8, 15)).montant_total,
+            Decimal('1400')
+        )
+        self.assertFalse(VentesSoiree.objects.filter(date_soiree=date(2025, 8, 16)).exists())
+
+    def test_date_soiree_enregistree(self):
+        consommation = self.consommer(self.alice, 1, moment(2025, 8, 16, 3))
+        self.assertEqual(consommation.date_soiree, date(2025, 8, 15))
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 4)):
+            self.assertEqual(self.alice.total_depenses_jour(), Decimal('700'))
+            self.assertEqual(self.maquis.total_ventes_aujourd_hui(), Decimal('700'))
+
+    def test_modification_et_suppression(self):
+        consommation = self.consommer(self.alice, 2, moment(2025, 8, 15, 22))
+        consommation.quantite = 3
+        consommation.montant_total = Decimal('2100')
+        consommation.save()
+        self.assertEqual(VentesSoiree.objects.get(service=self.maquis).montant_total, Decimal('2100'))
+
+        consommation.delete()
+        ventes = VentesSoiree.objects.get(service=self.maquis)
+        self.assertEqual(ventes.montant_total, Decimal('0'))
+        self.assertEqual(ventes.nombre_consommations, 0)
+
+    def test_reconstruction(self):
+        self.consommer(self.alice, 2, moment(2025, 8, 15, 22))
+        self.consommer(self.chloe, 1, moment(2025, 8, 16, 1))
+        VentesSoiree.objects.filter(service=self.maquis).update(montant_total=Decimal('1'))
+        DepensesSoiree.objects.filter(participant=self.chloe).delete()
+
+        ecarts = reconstruire_ventes_soiree(corriger=False)
+        self.assertEqual(ecarts['ventessoiree']['incorrects'], 1)
+        self.assertEqual(ecarts['depensessoiree']['manquants'], 1)
+
+        call_command('rebuild_ventes_soiree', stdout=mock.MagicMock())
+        self.assertEqual(VentesSoiree.objects.get(service=self.maquis).montant_total, Decimal('1400'))
+        self.assertEqual(DepensesSoiree.objects.get(participant=self.chloe).montant_total, Decimal('50000'))
+        self.assertEqual(
+            reconstruire_ventes_soiree(corriger=False)['ventessoiree'],
+            {'manquants': 0, 'incorrects': 0, 'orphelins': 0}
+        )
+
+    def test_api_classements_soiree_courante(self):
+        self.consommer(self.alice, 2, moment(2025, 8, 15, 22))
+        self.consommer(self.chloe, 1, moment(2025, 8, 14, 22))  # soirée précédente
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 1)):
+            reponse = self.client.get('/api/classements/')
+        donnees = reponse.json()
+        self.assertEqual(donnees['maquis'][0]['nom'], 'Maquis Test')
+        self.assertEqual(Decimal(donnees['maquis'][0]['total_ventes']), Decimal('1400'))
+        self.assertEqual(Decimal(donnees['boites'][0]['total_ventes']), Decimal('0'))
+
+
+class MaterialisationClassementsTests(DonneesSoireeMixin, TestCase):
+    """Calcul des classements quotidiens"""
+
+    def test_positions_par_type(self):
+        self.consommer(self.alice, 1, moment(2025, 8, 15, 22))
+        self.consommer(self.bob, 3, moment(2025, 8, 15, 23))
+        self.consommer(self.chloe, 1, moment(2025, 8, 16, 2))
+
+        self.assertEqual(materialiser_classements(date(2025, 8, 15)), (3, 2))
+        positions = list(ClassementQuotidien.objects.filter(
+            date=date(2025, 8, 15), type_etablissement='maquis'
+        ).values_list('participant__pseudo', 'position', 'etablissement'))
+        self.assertEqual(positions, [('bob', 1, self.maquis.pk), ('alice', 2, self.maquis.pk)])
+        self.assertEqual(
+            ClassementEtablissement.objects.get(type_etablissement='boite').montant_total,
+            Decimal('50000')
+        )
+
+    def test_remplacement_instantane(self):
+        self.consommer(self.alice, 1, moment(2025, 8, 15, 22))
+        materialiser_classements(date(2025, 8, 15))
+        self.consommer(self.bob, 3, moment(2025, 8, 15, 23))
+        call_command('materialiser_classements', date='2025-08-15', stdout=mock.MagicMock())
+
+        self.assertEqual(ClassementQuotidien.objects.filter(date=date(2025, 8, 15)).count(), 2)
+        self.assertEqual(ClassementQuotidien.objects.get(position=1).participant, self.bob)
+
+
+class StatistiquesDashboardTests(DonneesSoireeMixin, TestCase):
+    """Statistiques du dashboard : nombre de requêtes constant et cache par établissement"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def ajouter_historique(self, nombre, depuis):
+        """Insère des consommations anciennes (hors du mois en cours) en masse"""
+        ConsommationParticipant.objects.bulk_create([
+            ConsommationParticipant(
+                participant=self.alice, service=self.maquis, type_boisson=self.biere,
+                quantite=1, prix_unitaire=Decimal('700'), montant_total=Decimal('700'),
+                saisi_par=self.gerant_maquis, date_consommation=moment(2025, 1, 1, 22),
+                date_soiree=depuis - timedelta(days=i % 300 + 40)
+            )
+            for i in range(nombre)
+        ])
+
+    def mesurer_dashboard(self):
+        """Nombre de requêtes et durée d'un affichage du dashboard sans cache"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as requetes:
+            debut = time.perf_counter()
+            reponse = self.client.get('/dashboard/')
+            duree = time.perf_counter() - debut
+        self.assertEqual(reponse.status_code, 200)
+        return len(requetes_hors_cache(requetes)), duree
+
+    def test_totaux_par_periode(self):
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 1)):
+            self.consommer(self.alice, 1, moment(2025, 8, 15, 22))  # soirée en cours
+            self.consommer(self.bob, 2, moment(2025, 8, 11, 22))  # lundi de la même semaine
+            self.consommer(self.alice, 4, moment(2025, 8, 2, 22))  # début du mois
+
+            with self.assertNumQueriesHorsCache(2):
+                statistiques = statistiques_etablissements([self.maquis])
+            self.assertEqual(statistiques['consommations_aujourd_hui'], Decimal('700'))
+            self.assertEqual(statistiques['consommations_semaine'], Decimal('2100'))
+            self.assertEqual(statistiques['consommations_mois'], Decimal('4900'))
+            self.assertEqual([p.pseudo for p in statistiques['top_participants']], ['alice', 'bob'])
+
+            with self.assertNumQueriesHorsCache(0):
+                statistiques_etablissements([self.maquis])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.consommer(self.bob, 10, moment(2025, 8, 15, 23))
+            statistiques = statistiques_etablissements([self.maquis])
+            self.assertEqual(statistiques['consommations_aujourd_hui'], Decimal('7700'))
+
+    def test_benchmark_historique(self):
+        """Le dashboard coûte autant de requêtes avec 100 ou 5000 consommations d'historique"""
+        self.client.force_login(self.gerant_maquis.user)
+        aujourd_hui = date_soiree_courante()
+        self.consommer(self.alice, 1, timezone.now())
+
+        self.ajouter_historique(100, aujourd_hui)
+        requetes_petit, duree_petit = self.mesurer_dashboard()
+        self.ajouter_historique(4900, aujourd_hui)
+        requetes_grand, duree_grand = self.mesurer_dashboard()
+
+        self.assertEqual(requetes_petit, requetes_grand)
+        # Marge large pour absorber le bruit de mesure, l'historique ancien n'est jamais parcouru
+        self.assertLess(duree_grand, duree_petit * 5 + 0.05)
+
+
+class TableauClassementsTests(DonneesSoireeMixin, TestCase):
+    """Classements de la soirée en mémoire, mis à jour à chaque saisie"""
+
+    def test_classement_trie(self):
+        classement = Classement({1: Decimal('500'), 2: Decimal('900'), 3: Decimal('500')})
+        self.assertEqual(classement.top(), [(2, Decimal('900')), (1, Decimal('500')), (3, Decimal('500'))])
+        classement.ajouter(3, Decimal('1000'))
+        self.assertEqual(classement.rang(3), 1)
+        self.assertEqual(classement.rang(2), 2)
+        classement.ajouter(4, Decimal('100'))
+        self.assertEqual(classement.top(1), [(3, Decimal('1500'))])
+        self.assertEqual(classement.rang(4), 4)
+        self.assertIsNone(classement.rang(5))
+
+    def test_mise_a_jour_a_la_saisie(self):
+        maintenant = moment(2025, 8, 15, 23)
+        autre_maquis = self.creer_service('Autre Maquis', 'maquis')
+        biere_autre = TypeBoisson.objects.create(service=autre_maquis, categorie='brakina', prix_vente=Decimal('700'))
+        denis = self.creer_participant('denis', autre_maquis)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            tableau_classements.prechauffer()
+            self.consommer_et_valider(self.alice, 1, maintenant)
+            self.consommer_et_valider(self.bob, 1, maintenant)
+            # Hors fenêtre de classement : ignorée
+            self.consommer_et_valider(self.bob, 5, moment(2025, 8, 16, 15))
+            with self.captureOnCommitCallbacks(execute=True):
+                ConsommationParticipant.objects.create(
+                    participant=denis, service=autre_maquis, type_boisson=biere_autre,
+                    quantite=3, prix_unitaire=Decimal('700'), saisi_par=self.gerant_maquis,
+                    date_consommation=maintenant
+                )
+
+            # Lecture à la version déjà chargée : les saisies validées ici sont appliquées en mémoire
+            with self.assertNumQueries(0):
+                top = tableau_classements.top_etablissements('maquis', version=tableau_classements._version)
+                rang_maquis = tableau_classements.rang_etablissement(self.maquis.pk, version=tableau_classements._version)
+                rang_bob = tableau_classements.rang_participant(self.bob.pk, version=tableau_classements._version)
+            self.assertEqual(
+                [(ligne['id'], ligne['total_ventes']) for ligne in top],
+                [(autre_maquis.pk, Decimal('2100')), (self.maquis.pk, Decimal('1400'))]
+            )
+            self.assertEqual(rang_maquis, 2)
+            self.assertEqual(rang_bob, 3)
+            self.assertEqual(tableau_classements.verifier_coherence(), [])
+
+    def test_saisie_d_un_autre_processus(self):
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            tableau_classements.prechauffer()
+            reponse = self.client.get('/api/classements/')
+            self.assertEqual(reponse.json()['maquis'][0]['total_ventes'], '0')
+
+            # Saisie validée dans un autre processus : les cumuls et la version
+            # partagée changent, mais pas le tableau de ce processus
+            self.consommer(self.alice, 2, maintenant)
+            incrementer_version(PORTEE_CLASSEMENTS)
+
+            reponse = self.client.get('/api/classements/', HTTP_IF_NONE_MATCH=reponse['ETag'])
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()['maquis'][0]['total_ventes'], '1400.00')
+
+    def test_api_classements_sans_requete(self):
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.consommer(self.chloe, 1, maintenant)
+            tableau_classements.prechauffer()
+            # Seule la version des classements est lue dans le cache partagé
+            with self.assertNumQueries(1):
+                reponse = self.client.get('/api/classements/', {'etablissement': self.boite.pk})
+        donnees = reponse.json()
+        self.assertEqual(donnees['boites'][0], {'nom': 'Boîte Test', 'total_ventes': '50000.00'})
+        self.assertEqual(donnees['rang_etablissement'], 1)
+
+    def test_ecart_detecte(self):
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.consommer(self.alice, 1, maintenant)
+            tableau_classements.prechauffer()
+            # Consommation saisie par un autre processus : le tableau local ne la voit pas
+            ConsommationParticipant.objects.filter(participant=self.alice).update(montant_total=Decimal('1400'))
+            self.assertIn(
+                ('etablissement', self.maquis.pk, Decimal('700'), Decimal('1400')),
+                tableau_classements.verifier_coherence()
+            )
+
+
+    def test_requetes_hors_verrou(self):
+        maintenant = moment(2025, 8, 15, 23)
+
+        def hors_verrou(execute, sql, params, many, context):
+            self.assertFalse(tableau_classements._verrou._is_owned(), sql)
+            return execute(sql, params, many, context)
+
+        with mock.patch('django.utils.timezone.now', return_value=maintenant), \
+                connection.execute_wrapper(hors_verrou), override_settings(DEBUG=True):
+            self.consommer(self.alice, 1, maintenant)
+            tableau_classements.prechauffer()
+            denis = self.creer_participant('denis', self.maquis)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.consommer(denis, 2, maintenant)
+            self.assertEqual(tableau_classements.rang_participant(denis.pk), 1)
+            tableau_classements.synchroniser()
+            self.assertEqual(tableau_classements.verifier_coherence(), [])
+
+    def test_controle_au_rechargement_en_debug_seulement(self):
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 15, 23)):
+            tableau_classements.prechauffer()
+            with mock.patch.object(TableauClassements, 'verifier_coherence', return_value=[]) as verification:
+                tableau_classements.synchroniser()
+                verification.assert_not_called()
+                with override_settings(DEBUG=True):
+                    tableau_classements.synchroniser()
+                verification.assert_called_once()
+
+
+class ExportConsommationsTests(DonneesSoireeMixin, TestCase):
+    """Export des consommations en flux, filtré par soirée et établissement"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+        self.consommer(self.alice, 2, moment(2025, 8, 15, 23))
+        self.consommer(self.bob, 1, moment(2025, 8, 16, 2))
+        self.consommer(self.chloe, 1, moment(2025, 8, 16, 22))
+
+    def test_export_csv_filtre(self):
+        reponse = self.client.get('/export/consommations/excel/', {
+            'format': 'csv', 'debut': '2025-08-15', 'fin': '2025-08-15', 'etablissement': self.maquis.pk,
+        })
+        self.assertTrue(reponse.streaming)
+        lignes = b''.join(reponse.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lignes[0].split(';')[0], 'Établissement')
+        self.assertEqual(len(lignes), 3)
+        self.assertEqual(lignes[1].split(';')[:2], ['Maquis Test', 'alice'])
+        self.assertEqual(lignes[2].split(';')[5:8], ['700.00', '16/08/2025 02:00', '15/08/2025'])
+
+    def test_export_xlsx(self):
+        reponse = self.client.get('/export/consommations/excel/', {'debut': '2025-08-16'})
+        classeur = load_workbook(io.BytesIO(b''.join(reponse.streaming_content)), read_only=True)
+        lignes = list(classeur.active.iter_rows(values_only=True))
+        self.assertEqual(len(lignes), 2)
+        self.assertEqual(lignes[1][:2], ('Boîte Test', 'chloe'))
+
+
+class ExportClassementsTests(DonneesSoireeMixin, TestCase):
+    """Export des classements dans un fichier propre à chaque requête"""
+
+    def test_export_filtre_par_type_et_date(self):
+        self.consommer(self.alice, 2, moment(2025, 8, 15, 23))
+        self.consommer(self.chloe, 1, moment(2025, 8, 15, 23))
+        self.consommer(self.bob, 1, moment(2025, 8, 16, 23))
+        materialiser_classements(date(2025, 8, 15))
+        materialiser_classements(date(2025, 8, 16))
+        self.client.force_login(self.admin)
+
+        reponse = self.client.get('/export/classements/excel/', {
+            'type': 'maquis', 'debut': '2025-08-15', 'fin': '2025-08-15',
+        })
+        classeur = load_workbook(io.BytesIO(b''.join(reponse.streaming_content)), read_only=True)
+        participants = list(classeur['Classements_Participants'].iter_rows(values_only=True))
+        etablissements = list(classeur['Classements_Etablissements'].iter_rows(values_only=True))
+        self.assertEqual(participants[1:], [('15/08/2025', 'Maquis', 'alice', 'Maquis Test', 1400, 1)])
+        self.assertEqual(etablissements[1:], [('15/08/2025', 'Maquis', 'Maquis Test', 1400, 1)])
+        self.assertFalse(os.path.exists('classements_soiree_clash.xlsx'))
+
+
+class SaisieParLotTests(DonneesSoireeMixin, TestCase):
+    """Saisie de plusieurs consommations en une requête"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.gerant_maquis.user)
+
+    def poster_lot(self, lignes):
+        return self.client.post(
+            '/api/consommations/lot/', json.dumps({'lignes': lignes}), content_type='application/json'
+        )
+
+    def test_lot_enregistre_et_cumuls_mis_a_jour(self):
+        maintenant = moment(2025, 8, 15, 23)
+        lignes = [
+            {'participant': self.alice.pk, 'type_boisson': self.biere.pk, 'quantite': 2},
+            {'participant': self.bob.pk, 'type_boisson': self.biere.pk, 'quantite': 1, 'prix_unitaire': '600'},
+            {'participant': self.alice.pk, 'type_boisson': self.biere.pk, 'quantite': 1},
+        ]
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            tarifs_etablissement(self.maquis.pk)
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as requetes:
+                    reponse = self.poster_lot(lignes)
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.json(), {'enregistrees': 3, 'montant_total': '2700.00'})
+        self.assertEqual(
+            len([r for r in requetes.captured_queries if r['sql'].startswith('INSERT INTO "soiree_consommationparticipant"')]),
+            1
+        )
+
+        ventes = VentesSoiree.objects.get(service=self.maquis, date_soiree=date(2025, 8, 15))
+        self.assertEqual((ventes.montant_total, ventes.nombre_consommations), (Decimal('2700'), 3))
+        self.assertEqual(DepensesSoiree.objects.get(participant=self.alice).montant_total, Decimal('2100'))
+        self.assertEqual(reconstruire_ventes_soiree(corriger=False)['ventessoiree']['incorrects'], 0)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.assertEqual(tableau_classements.rang_participant(self.alice.pk), 1)
+
+    def test_lot_refuse_en_entier(self):
+        reponse = self.poster_lot([
+            {'participant': self.alice.pk, 'type_boisson': self.biere.pk, 'quantite': 2},
+            {'participant': self.chloe.pk, 'type_boisson': self.biere.pk, 'quantite': 1},
+            {'participant': self.bob.pk, 'type_boisson': self.champagne.pk, 'quantite': 1},
+            {'participant': self.bob.pk, 'type_boisson': self.biere.pk, 'quantite': 0},
+        ])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([erreur['ligne'] for erreur in reponse.json()['erreurs']], [2, 3, 4])
+        self.assertFalse(ConsommationParticipant.objects.exists())
+
+    def test_valeurs_hors_bornes_refusees(self):
+        biere = {'participant': self.alice.pk, 'type_boisson': self.biere.pk}
+        reponse = self.poster_lot([
+            {**biere, 'quantite': 1, 'prix_unitaire': 'NaN'},
+            {**biere, 'quantite': 1, 'prix_unitaire': '1e30'},
+            {**biere, 'quantite': 1, 'prix_unitaire': '12.345'},
+            {**biere, 'quantite': 1.9},
+            {**biere, 'quantite': 10 ** 20},
+            {**biere, 'quantite': True},
+            {**biere, 'quantite': 1000, 'prix_unitaire': '99999999.99'},
+            {**biere, 'quantite': 1, 'prix_unitaire': '750.50'},
+        ])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([erreur['ligne'] for erreur in reponse.json()['erreurs']], [1, 2, 3, 4, 5, 6, 7])
+        self.assertFalse(ConsommationParticipant.objects.exists())
+        self.assertEqual(self.client.get('/api/classements/').status_code, 200)
+
+    def test_tarifs_invalides_apres_modification(self):
+        self.assertEqual(tarifs_etablissement(self.maquis.pk), {self.biere.pk: Decimal('700')})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.biere.actif = False
+            self.biere.save()
+        self.assertEqual(tarifs_etablissement(self.maquis.pk), {})
+
+    def test_formulaire_par_lot(self):
+        donnees = {
+            'mode': 'lot', 'lot-TOTAL_FORMS': '3', 'lot-INITIAL_FORMS': '0',
+            'lot-0-participant': self.alice.pk, 'lot-0-type_boisson': self.biere.pk, 'lot-0-quantite': '2',
+            'lot-1-participant': self.bob.pk, 'lot-1-type_boisson': self.biere.pk, 'lot-1-quantite': '1',
+            'lot-2-participant': '', 'lot-2-type_boisson': '', 'lot-2-quantite': '',
+        }
+        reponse = self.client.post('/gestion-consommations/', donnees)
+        self.assertRedirects(reponse, '/gestion-consommations/')
+        self.assertEqual(ConsommationParticipant.objects.count(), 2)
+        self.assertContains(self.client.get('/gestion-consommations/', {'taille': 1}), 'Consommations plus anciennes')
+
+
+class RejeuSaisiesTests(DonneesSoireeMixin, TestCase):
+    """Saisies idempotentes et rejeu de la file d'une tablette hors ligne"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.gerant_maquis.user)
+
+    def rejouer(self, saisies):
+        return self.client.post(
+            '/api/consommations/rejouer/', json.dumps({'saisies': saisies}), content_type='application/json'
+        )
+
+    def saisie(self, participant, quantite, quand):
+        return {
+            'cle': str(uuid.uuid4()), 'date_consommation': quand.isoformat(),
+            'participant': participant.pk, 'type_boisson': self.biere.pk, 'quantite': quantite,
+        }
+
+    def test_rejeu_deduplique(self):
+        maintenant = moment(2025, 8, 16, 3)
+        premiere = self.saisie(self.alice, 2, moment(2025, 8, 15, 22))
+        seconde = self.saisie(self.bob, 1, moment(2025, 8, 16, 1))
+        invalide = self.saisie(self.chloe, 1, moment(2025, 8, 16, 1))
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.assertEqual(self.rejouer([premiere]).json()['enregistrees'], 1)
+            # La connexion revient : la tablette renvoie toute sa file, doublon compris
+            with CaptureQueriesContext(connection) as requetes:
+                reponse = self.rejouer([premiere, seconde, seconde, invalide])
+        sql = [requete['sql'] for requete in requetes.captured_queries]
+        self.assertEqual(len([r for r in sql if 'cle_idempotence" IN' in r]), 1)
+        self.assertEqual(len([r for r in sql if r.startswith('INSERT INTO "soiree_consommationparticipant"')]), 1)
+
+        resultats = reponse.json()['resultats']
+        self.assertEqual(resultats[premiere['cle']], 'doublon')
+        self.assertEqual(resultats[seconde['cle']], 'enregistree')
+        self.assertEqual(resultats[invalide['cle']], 'Participant inconnu dans cet établissement.')
+        self.assertEqual(ConsommationParticipant.objects.count(), 2)
+        # Horodatage d'origine conservé
+        self.assertEqual(
+            ConsommationParticipant.objects.get(cle_idempotence=seconde['cle']).date_consommation,
+            moment(2025, 8, 16, 1)
+        )
+        ventes = VentesSoiree.objects.get(service=self.maquis, date_soiree=date(2025, 8, 15))
+        self.assertEqual(ventes.montant_total, Decimal('2100'))
+
+    def test_double_envoi_formulaire(self):
+        cle = str(uuid.uuid4())
+        donnees = {
+            'participant': self.alice.pk, 'type_boisson': self.biere.pk, 'quantite': '1',
+            'prix_unitaire': '700', 'cle_idempotence': cle,
+        }
+        self.client.post('/gestion-consommations/', donnees)
+        self.client.post('/gestion-consommations/', donnees)
+        self.assertEqual(ConsommationParticipant.objects.filter(cle_idempotence=cle).count(), 1)
+
+
+class PaginationCurseurTests(DonneesSoireeMixin, TestCase):
+    """Pagination par curseur sur (date_consommation, id)"""
+
+    def test_parcours_complet_sans_doublon(self):
+        # Plusieurs consommations au même instant : l'id départage
+        for i in range(7):
+            self.consommer(self.alice, 1, moment(2025, 8, 15, 22, i // 3))
+        attendues = list(ConsommationParticipant.objects.order_by('-date_consommation', '-pk').values_list('pk', flat=True))
+
+        vues, curseur = [], None
+        for _ in range(4):
+            page, curseur = paginer(ConsommationParticipant.objects.all(), 'date_consommation', curseur, 3)
+            vues += [consommation.pk for consommation in page]
+            if curseur is None:
+                break
+        self.assertEqual(vues, attendues)
+
+    def test_page_profonde_meme_cout(self):
+        for i in range(30):
+            self.consommer(self.alice, 1, moment(2025, 8, 15, 22, i))
+        _, curseur = paginer(ConsommationParticipant.objects.all(), 'date_consommation', None, 25)
+        with CaptureQueriesContext(connection) as requetes:
+            page, suivant = paginer(ConsommationParticipant.objects.all(), 'date_consommation', curseur, 25)
+        self.assertEqual((len(page), suivant), (5, None))
+        self.assertNotIn('OFFSET', requetes.captured_queries[0]['sql'])
+
+    def test_api_detail(self):
+        maintenant = moment(2025, 8, 15, 23)
+        for i in range(3):
+            self.consommer(self.alice, 1, maintenant)
+        self.consommer(self.chloe, 1, maintenant)
+        self.client.force_login(self.gerant_maquis.user)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            premiere = self.client.get('/api/consommations/', {'detail': 1, 'taille': 2}).json()
+            seconde = self.client.get('/api/consommations/', {'detail': 1, 'curseur': premiere['suivant']}).json()
+            invalide = self.client.get('/api/consommations/', {'detail': 1, 'curseur': 'xyz'})
+        self.assertEqual(len(premiere['consommations']), 2)
+        self.assertEqual(len(seconde['consommations']), 1)
+        self.assertIsNone(seconde['suivant'])
+        self.assertEqual(invalide.status_code, 400)
+
+
+class RequetesConditionnellesTests(DonneesSoireeMixin, TestCase):
+    """ETag / Last-Modified des API interrogées en continu"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_304_sans_requete_puis_200_apres_saisie(self):
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            for url in ('/api/classements/', '/api/consommations/?periode=semaine'):
+                premiere = self.client.get(url)
+                self.assertEqual(premiere.status_code, 200)
+                # Une seule lecture de la version dans le cache partagé, rien d'autre
+                with self.assertNumQueries(1):
+                    inchangee = self.client.get(url, HTTP_IF_NONE_MATCH=premiere['ETag'])
+                self.assertEqual(inchangee.status_code, 304)
+                with self.assertNumQueries(1):
+                    inchangee = self.client.get(url, HTTP_IF_MODIFIED_SINCE=premiere['Last-Modified'])
+                self.assertEqual(inchangee.status_code, 304)
+
+            etag_classements = self.client.get('/api/classements/')['ETag']
+            self.consommer_et_valider(self.alice, 1, maintenant)
+            self.assertEqual(self.client.get('/api/classements/', HTTP_IF_NONE_MATCH=etag_classements).status_code, 200)
+
+    def test_etag_depend_des_parametres(self):
+        jour = self.client.get('/api/consommations/?periode=jour')
+        mois = self.client.get('/api/consommations/?periode=mois', HTTP_IF_NONE_MATCH=jour['ETag'])
+        self.assertEqual(mois.status_code, 200)
+        self.assertNotEqual(jour['ETag'], mois['ETag'])
+
+
+class CachePartageTests(DonneesSoireeMixin, TestCase):
+    """Versions et statistiques en cache vues par tous les processus (workers)"""
+
+    def processus(self):
+        """Cache tel que le voit un autre processus : une instance distincte du backend configuré"""
+        return DatabaseCache(settings.CACHES['default']['LOCATION'], {})
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_version_incrementee_par_un_autre_processus(self):
+        premier, second = self.processus(), self.processus()
+        with mock.patch('soiree.versions.cache', premier):
+            avant = version_donnees(PORTEE_CLASSEMENTS)
+        with mock.patch('soiree.versions.cache', second):
+            self.assertEqual(version_donnees(PORTEE_CLASSEMENTS), avant)
+            incrementer_version(PORTEE_CLASSEMENTS)
+        with mock.patch('soiree.versions.cache', premier):
+            self.assertGreater(version_donnees(PORTEE_CLASSEMENTS), avant)
+
+    def test_ecriture_groupee(self):
+        cache.set('statistiques_etablissement:1', {'jour': 1})
+        with self.assertNumQueries(5):  # comptage, point de sauvegarde, suppression, insertion, libération
+            cache.set_many({f'statistiques_etablissement:{numero}': {'jour': numero} for numero in range(1, 11)}, 300)
+        self.assertEqual(cache.get('statistiques_etablissement:1'), {'jour': 1})
+        self.assertEqual(len(cache.get_many([f'statistiques_etablissement:{numero}' for numero in range(1, 11)])), 10)
+
+    def test_statistiques_invalidees_par_un_autre_processus(self):
+        premier, second = self.processus(), self.processus()
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 1)):
+            self.consommer(self.alice, 1, moment(2025, 8, 15, 22))
+            with mock.patch('soiree.statistiques.cache', premier):
+                self.assertEqual(statistiques_etablissements([self.maquis])['consommations_aujourd_hui'], Decimal('700'))
+            with mock.patch('soiree.statistiques.cache', second), self.captureOnCommitCallbacks(execute=True):
+                self.consommer(self.bob, 2, moment(2025, 8, 15, 23))
+            with mock.patch('soiree.statistiques.cache', premier):
+                self.assertEqual(statistiques_etablissements([self.maquis])['consommations_aujourd_hui'], Decimal('2100'))
+
+
+class ReglementParisTests(DonneesSoireeMixin, TestCase):
+    """Règlement des paris d'une soirée en quelques requêtes"""
+
+    def parier(self, participant, evenement, montant='1000', soiree=date(2025, 8, 15)):
+        return Pari.objects.create(
+            user=self.admin, participant=participant, evenement=evenement,
+            montant=Decimal(montant), date_evenement=soiree
+        )
+
+    def test_reglement(self):
+        self.consommer(self.alice, 3, moment(2025, 8, 15, 23))
+        self.consommer(self.bob, 1, moment(2025, 8, 15, 23))
+        self.consommer(self.chloe, 1, moment(2025, 8, 15, 23))
+        alice_gagne = self.parier(self.alice, 'GAIN')
+        bob_gagne = self.parier(self.bob, 'GAIN')
+        bob_perd = self.parier(self.bob, 'PERTE', '500')
+        chloe_perd = self.parier(self.chloe, 'PERTE')
+        autre_soiree = self.parier(self.bob, 'GAIN', soiree=date(2025, 8, 16))
+
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 17, 12)):
+            with self.assertNumQueries(5):
+                resultat = regler_paris(date(2025, 8, 15))
+        self.assertEqual(resultat, {'gagnes': 2, 'perdus': 2})
+
+        for pari in (alice_gagne, bob_gagne, bob_perd, chloe_perd, autre_soiree):
+            pari.refresh_from_db()
+        self.assertEqual((alice_gagne.gagne, alice_gagne.montant_gains), (True, Decimal('2000')))
+        self.assertEqual((bob_perd.gagne, bob_perd.montant_gains), (True, Decimal('1000')))
+        self.assertEqual((bob_gagne.gagne, bob_gagne.montant_gains), (False, None))
+        self.assertFalse(chloe_perd.gagne)
+        self.assertTrue(chloe_perd.resultat_disponible)
+        self.assertIsNone(autre_soiree.gagne)
+
+    def test_soiree_en_cours_refusee(self):
+        self.parier(self.alice, 'GAIN')
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 2)):
+            with self.assertRaises(SoireeNonTerminee):
+                regler_paris(date(2025, 8, 15))
+
+    def test_action_admin(self):
+        self.consommer(self.alice, 1, moment(2025, 8, 15, 23))
+        pari = self.parier(self.alice, 'GAIN')
+        self.client.force_login(self.admin)
+        self.client.post('/admin/soiree/pari/', {
+            'action': 'calculer_resultats', '_selected_action': [pari.pk],
+        })
+        pari.refresh_from_db()
+        self.assertTrue(pari.gagne)
+
+
+class AttributionTropheesTests(DonneesSoireeMixin, TestCase):
+    """Attribution des quatre trophées par établissement et par soirée"""
+
+    def test_attribution_et_rattrapage(self):
+        whisky = TypeBoisson.objects.create(service=self.boite, categorie='whisky', prix_vente=Decimal('80000'))
+        dina = self.creer_participant('dina', self.boite)
+        # Maquis : alice dépense le plus, bob boit le plus de bières moins chères
+        self.consommer(self.alice, 3, moment(2025, 8, 15, 23))
+        ConsommationParticipant.objects.create(
+            participant=self.bob, service=self.maquis, type_boisson=self.biere, quantite=5,
+            prix_unitaire=Decimal('300'), saisi_par=self.gerant_maquis, date_consommation=moment(2025, 8, 16, 1)
+        )
+        # Boîte : dina dépense le plus en whisky, chloe en champagne
+        self.consommer(self.chloe, 1, moment(2025, 8, 15, 23))
+        ConsommationParticipant.objects.create(
+            participant=dina, service=self.boite, type_boisson=whisky, quantite=1,
+            prix_unitaire=whisky.prix_vente, saisi_par=self.gerant_boite, date_consommation=moment(2025, 8, 15, 23)
+        )
+        self.consommer(self.alice, 1, moment(2025, 8, 16, 22))
+
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 18, 12)):
+            with self.assertNumQueries(4):
+                self.assertEqual(attribuer_trophees(date(2025, 8, 15)), 4)
+            # Rattrapage sur une période englobant la soirée déjà traitée
+            self.assertEqual(attribuer_trophees(date(2025, 8, 14), date(2025, 8, 17)), 2)
+            self.assertEqual(attribuer_trophees(date(2025, 8, 14), date(2025, 8, 17)), 0)
+
+        gagnants = dict(Trophee.objects.filter(date_attribution=date(2025, 8, 15)).values_list(
+            'type_trophee', 'gagnant__pseudo'
+        ))
+        self.assertEqual(gagnants, {
+            'sultan_maquis': 'alice', 'roi_ventes_maquis': 'bob',
+            'empereur_boite': 'dina', 'bouquet_or': 'chloe',
+        })
+        self.assertEqual(
+            Trophee.objects.get(type_trophee='bouquet_or').montant_total, Decimal('50000')
+        )
+
+    def test_soiree_en_cours_refusee(self):
+        with mock.patch('django.utils.timezone.now', return_value=moment(2025, 8, 16, 2)):
+            with self.assertRaises(SoireeNonTerminee):
+                attribuer_trophees(date(2025, 8, 15))
+
+
+class RegistrePseudosTests(DonneesSoireeMixin, TestCase):
+    """Registre unique des pseudos normalisés"""
+
+    def test_pseudo_normalise_reserve_pour_tous_les_comptes(self):
+        self.assertEqual(normaliser_pseudo('  KÉvïn '), 'kevin')
+        self.assertFalse(pseudo_disponible('Alice'))
+        self.assertFalse(pseudo_disponible('GERANT_MAQUIS'))
+        self.assertTrue(pseudo_disponible('kevin'))
+        with self.assertNumQueries(1):
+            pseudo_disponible('Kévin')
+
+        with self.assertRaises(PseudoIndisponible):
+            self.creer_participant('Âlice', self.boite)
+        self.assertFalse(Participant.objects.filter(pseudo='Âlice').exists())
+
+    def test_changement_et_suppression(self):
+        self.alice.pseudo = 'Alicia'
+        self.alice.save()
+        self.assertTrue(pseudo_disponible('alice'))
+        self.assertFalse(pseudo_disponible('alicia'))
+        self.bob.user.delete()
+        self.assertTrue(pseudo_disponible('bob'))
+
+    def test_gestionnaire_reprend_le_pseudo_de_sa_demande(self):
+        demande = DemandeAdhesion.objects.create(
+            pseudo='Nouveau', nom_etablissement='Nouveau Maquis', type_etablissement='maquis',
+            quartier='Zone 2', nom_gestionnaire='N', prenom_gestionnaire='G',
+            telephone_gestionnaire='70000001', email_gestionnaire='nouveau@example.com'
+        )
+        self.assertFalse(pseudo_disponible('nouveau'))
+        # Un autre compte ne prend pas le pseudo d'une demande en attente
+        with self.assertRaises(PseudoIndisponible):
+            self.creer_gestionnaire('Nouveau', self.maquis)
+
+        user = User.objects.create_user('nouveau_gerant', 'nouveau@example.com', 'motdepasse')
+        gestionnaire = Gestionnaire(user=user, pseudo='Nouveau', service=self.maquis, tel='70000001', fonction='gerant')
+        gestionnaire.save(reprise_pseudo=demande)
+        self.assertEqual(PseudoReserve.objects.get(normalise='nouveau').gestionnaire, gestionnaire)
+        demande.delete()
+        self.assertFalse(pseudo_disponible('nouveau'))
+
+    def test_erreur_de_formulaire_dans_l_admin(self):
+        self.client.force_login(self.admin)
+        user = User.objects.create_user('homonyme', 'homonyme@example.com', 'motdepasse')
+        reponse = self.client.post('/admin/soiree/participant/add/', {
+            'user': user.pk, 'pseudo': 'ALICE', 'service': self.maquis.pk, 'actif': 'on',
+        })
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('pseudo', reponse.context['adminform'].form.errors)
+        self.assertFalse(Participant.objects.filter(user=user).exists())
+
+        self.alice.pseudo = 'Alîce'
+        self.alice.full_clean()  # son propre pseudo, autrement accentué
+
+    def test_api_disponibilite(self):
+        self.assertEqual(self.client.get('/api/pseudo-disponible/', {'pseudo': 'Bób'}).json()['disponible'], False)
+        self.assertEqual(self.client.get('/api/pseudo-disponible/', {'pseudo': 'zoe'}).json()['disponible'], True)
+        self.assertEqual(self.client.get('/api/pseudo-disponible/', {'pseudo': ' '}).status_code, 400)
+        self.assertContains(self.client.get('/inscription-participant/'), 'pseudo-disponibilite')
+
+
+@override_settings(PERFORMANCE_ECHANTILLONNAGE=1.0, PERFORMANCE_SERVER_TIMING=True)
+class MesurePerformanceTests(DonneesSoireeMixin, TestCase):
+    """Mesures par requête : log JSON et en-tête Server-Timing"""
+
+    def test_mesures_publiees(self):
+        with self.assertLogs('soiree.performance', 'INFO') as logs:
+            reponse = self.client.get('/api/consommations/')
+        mesures = json.loads(logs.records[0].getMessage())
+        self.assertEqual(mesures['chemin'], '/api/consommations/')
+        self.assertEqual(mesures['statut'], 200)
+        self.assertGreater(mesures['requetes_sql'], 0)
+        self.assertGreater(mesures['cache_succes'] + mesures['cache_echecs'], 0)
+        self.assertIn(f'desc="{mesures["requetes_sql"]} requetes"', reponse['Server-Timing'])
+        self.assertTrue(reponse['Server-Timing'].startswith('total;dur='))
+
+    def test_rendu_des_gabarits_mesure(self):
+        with self.assertLogs('soiree.performance', 'INFO') as logs:
+            self.client.get('/inscription-participant/')
+        self.assertGreater(json.loads(logs.records[0].getMessage())['duree_gabarits_ms'], 0)
+
+    def test_rien_n_est_mesure_hors_requete(self):
+        from django.template.base import Template
+        self.assertFalse(hasattr(Template.render, '_mesure_performance'))
+        with self.assertNoLogs('soiree.performance', 'INFO'):
+            self.assertEqual(cache.get('absente'), None)
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=False)
+    def test_server_timing_desactive(self):
+        with self.assertLogs('soiree.performance', 'INFO'):
+            reponse = self.client.get('/api/classements/')
+        self.assertNotIn('Server-Timing', reponse)
+        # Les lignes JSON vont aux handlers habituels, pas à un handler qui les jette
+        self.assertTrue(logging.getLogger('soiree.performance').propagate)
+
+    @override_settings(PERFORMANCE_ECHANTILLONNAGE=0)
+    def test_requete_non_echantillonnee(self):
+        with self.assertNoLogs('soiree.performance', 'INFO'):
+            reponse = self.client.get('/api/classements/')
+        self.assertNotIn('Server-Timing', reponse)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BudgetRequetesTests(DonneesSoireeMixin, TestCase):
+    """
+    Budget de requêtes SQL et de durée par page, sur un jeu de données réaliste
+    Le nombre de requêtes ne doit pas dépendre du volume : une boucle qui
+    interroge la base par établissement ou par ligne fait échouer ces tests.
+    Les budgets comptent toutes les requêtes, y compris celles du cache partagé
+    (table du DatabaseCache), à heure fixe pendant la soirée.
+    """
+    MAINTENANT = moment(2025, 8, 15, 23)
+    NOMBRE_ETABLISSEMENTS = 8
+    PARTICIPANTS_PAR_ETABLISSEMENT = 12
+    DUREE_MAX = 2.0  # secondes, large pour les machines d'intégration lentes
+
+    # (url, compte connecté, requêtes SQL maximum)
+    BUDGETS = [
+        ('/', None, 6),
+        ('/inscription-participant/', None, 3),
+        ('/dashboard/', 'admin', 13),
+        ('/dashboard/', 'gerant_maquis', 13),
+        ('/classements/', 'alice', 8),
+        ('/trophees/', 'alice', 6),
+        ('/paris/', 'alice', 6),
+        ('/etablissements/', 'admin', 5),
+        ('/participants/', 'admin', 6),
+        ('/participants/', 'gerant_maquis', 6),
+        ('/gestion-boissons/', 'gerant_maquis', 5),
+        ('/gestion-consommations/', 'gerant_maquis', 14),
+        ('/admin-demandes-adhesion/', 'admin', 11),
+        ('/export/consommations/excel/', 'admin', 3),
+        ('/export/consommations/excel/?format=csv', 'admin', 3),
+        ('/export/classements/excel/', 'admin', 4),
+        ('/api/classements/', None, 1),
+        ('/api/consommations/', None, 2),
+        ('/api/consommations/?detail=1', 'gerant_maquis', 6),
+        ('/test-boissons/', None, 5),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        maintenant = cls.MAINTENANT
+        categories = ['brakina', 'sobbra', 'castel']
+        for numero in range(cls.NOMBRE_ETABLISSEMENTS):
+            type_etablissement = 'maquis' if numero % 2 else 'boite'
+            service = cls.creer_service(f'Etablissement {numero}', type_etablissement)
+            boissons = [
+                TypeBoisson.objects.create(service=service, categorie=categorie, prix_vente=Decimal('1000'))
+                for categorie in categories
+            ]
+            gerant = cls.creer_gestionnaire(f'gerant_{numero}', service)
+            for rang in range(cls.PARTICIPANTS_PAR_ETABLISSEMENT):
+                participant = cls.creer_participant(f'client_{numero}_{rang}', service)
+                enregistrer_consommations([
+                    ConsommationParticipant(
+                        participant=participant, service=service, type_boisson=boisson,
+                        quantite=rang + 1, prix_unitaire=boisson.prix_vente, saisi_par=gerant,
+                        date_consommation=maintenant - timedelta(minutes=rang)
+                    )
+                    for boisson in boissons
+                ])
+                Pari.objects.create(
+                    user=cls.alice.user, montant=Decimal('500'), participant=participant,
+                    evenement='GAIN', date_evenement=maintenant.date()
+                )
+                Trophee.objects.create(
+                    type_trophee='sultan_maquis', gagnant=participant, etablissement=service,
+                    date_attribution=maintenant.date() - timedelta(days=rang), montant_total=Decimal('1000')
+                )
+        for participant in (cls.alice, cls.bob):
+            for heures in range(30):
+                ConsommationParticipant.objects.create(
+                    participant=participant, service=cls.maquis, type_boisson=cls.biere,
+                    quantite=1, prix_unitaire=cls.biere.prix_vente, saisi_par=cls.gerant_maquis,
+                    date_consommation=maintenant - timedelta(hours=heures)
+                )
+        Profile.objects.create(user=cls.admin, pseudo='admin_profil', nom='Admin', prenom='Test')
+
+    def setUp(self):
+        super().setUp()
+        horloge = mock.patch('django.utils.timezone.now', return_value=self.MAINTENANT)
+        horloge.start()
+        self.addCleanup(horloge.stop)
+
+    def mesurer(self, url, compte=None):
+        """Requêtes SQL (toutes) et durée d'un GET"""
+        self.client.logout()
+        if compte:
+            self.client.force_login(User.objects.get(username=compte))
+        debut = time.perf_counter()
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+            if reponse.streaming:
+                b''.join(reponse.streaming_content)
+        duree = time.perf_counter() - debut
+        self.assertEqual(reponse.status_code, 200)
+        self.assertLess(duree, self.DUREE_MAX)
+        return [requete['sql'] for requete in requetes.captured_queries]
+
+    def test_budgets(self):
+        for url, compte, max_requetes in self.BUDGETS:
+            with self.subTest(url=url, compte=compte):
+                # Statistiques en cache froid ; versions des données et tableau
+                # des classements chargés explicitement, comme dans un processus déjà démarré
+                cache.clear()
+                version_donnees(PORTEE_CONSOMMATIONS)
+                tableau_classements.prechauffer()
+                sql = self.mesurer(url, compte)
+                self.assertLessEqual(len(sql), max_requetes, '\n'.join(sql))
+
+    def test_budget_api_classements_tableau_froid(self):
+        """Premier appel d'un processus : lecture de la version et chargement du tableau"""
+        cache.clear()
+        tableau_classements.invalider()
+        sql = self.mesurer('/api/classements/')
+        self.assertLessEqual(len(sql), 9, '\n'.join(sql))
+
+
+class GenerationDonneesTests(TestCase):
+    """Jeu de données synthétique (commande generer_donnees)"""
+
+    def test_jeu_de_donnees_coherent(self):
+        maintenant = moment(2025, 8, 16, 14)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            call_command(
+                'generer_donnees', etablissements=4, participants=5, soirees=3, consommations=30,
+                paris=10, graine=7, lot=25, stdout=io.StringIO()
+            )
+
+        # Soirées du 14 et du 15 terminées, celle du 16 pas encore ouverte à 14h
+        self.assertEqual(ConsommationParticipant.objects.count(), 4 * 30 * 2)
+        self.assertEqual(Participant.objects.count(), 20)
+        self.assertEqual(PseudoReserve.objects.count(), Participant.objects.count() + Gestionnaire.objects.count())
+        for consommation in ConsommationParticipant.objects.all():
+            self.assertEqual(consommation.date_soiree, date_soiree(consommation.date_consommation))
+            self.assertEqual(consommation.montant_total, consommation.quantite * consommation.prix_unitaire)
+        ecarts = reconstruire_ventes_soiree(corriger=False)
+        self.assertFalse(any(sum(compteurs.values()) for compteurs in ecarts.values()))
+        self.assertFalse(Pari.objects.filter(date_evenement__lt=date(2025, 8, 16), resultat_disponible=False).exists())
+        self.assertEqual(Trophee.objects.count(), 2 * 4 * 2)  # 2 trophées par établissement et par soirée
+        self.assertTrue(self.client.login(username='synth_p1_0', password='motdepasse'))
+
+        with self.assertRaises(CommandError):
+            call_command('generer_donnees', etablissements=1, stdout=io.StringIO())
+
+
+class TransactionsConcurrentesTests(unittest.TestCase):
+    """
+    Deux écritures simultanées sur un fichier SQLite, avec les OPTIONS du projet
+    La base de test de Django est en mémoire partagée, dont le verrouillage
+    diffère : une base fichier est déclarée pour ce test seulement.
+    """
+
+    def setUp(self):
+        dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dossier, ignore_errors=True)
+        connections.settings['concurrente'] = {
+            **connection.settings_dict, 'NAME': os.path.join(dossier, 'base.sqlite3'),
+            'OPTIONS': settings.DATABASES['default'].get('OPTIONS', {}),
+        }
+        self.addCleanup(connections.settings.pop, 'concurrente')
+        self.addCleanup(connections['concurrente'].close)
+        with connections['concurrente'].cursor() as curseur:
+            curseur.execute('CREATE TABLE inscription (pseudo TEXT UNIQUE)')
+
+    def test_lecture_puis_ecriture_attend_le_verrou(self):
+        # Comme inscription_participant : vérification d'unicité puis création dans la même transaction
+        ecrit = threading.Event()
+
+        def premiere_ecriture():
+            try:
+                with transaction.atomic(using='concurrente'):
+                    connections['concurrente'].cursor().execute("INSERT INTO inscription VALUES ('alice')")
+                    ecrit.set()
+                    time.sleep(0.3)
+            finally:
+                ecrit.set()
+                connections['concurrente'].close()
+
+        fil = threading.Thread(target=premiere_ecriture)
+        fil.start()
+        ecrit.wait()
+        try:
+            with transaction.atomic(using='concurrente'), connections['concurrente'].cursor() as curseur:
+                curseur.execute("SELECT COUNT(*) FROM inscription WHERE pseudo = 'bob'")
+                self.assertEqual(curseur.fetchone(), (0,))
+                curseur.execute("INSERT INTO inscription VALUES ('bob')")
+        finally:
+            fil.join()
+        with connections['concurrente'].cursor() as curseur:
+            curseur.execute('SELECT COUNT(*) FROM inscription')
+            self.assertEqual(curseur.fetchone(), (2,))
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class BancChargeTests(DonneesSoireeMixin, TestCase):
+    """Banc de charge : parcours des utilisateurs virtuels et comparaison à une référence"""
+
+    def test_parcours_sans_erreur(self):
+        mesures = Mesures()
+        utilisateur = UtilisateurVirtuel(ClientProcessus(), charger_comptes(), mesures, random.Random(3), 'motdepasse')
+        with self.captureOnCommitCallbacks(execute=True):
+            for parcours in PARCOURS:
+                getattr(utilisateur, f'parcours_{parcours}')()
+
+        resultat = rapport(mesures, 1.0)
+        self.assertFalse({point: m['erreurs'] for point, m in resultat['points'].items() if m['erreurs']})
+        for point in ('GET /', 'POST /api/consommations/lot/', 'POST /paris/', 'POST /inscription-participant/'):
+            self.assertIn(point, resultat['points'])
+        # Le suivi des classements revalide avec l'ETag : 304 après la première réponse
+        self.assertIsNotNone(utilisateur.etag_classements)
+        self.assertTrue(Pari.objects.exists())
+        self.assertTrue(Participant.objects.filter(pseudo__startswith='charge_').exists())
+
+    def test_donnees_du_banc_supprimees(self):
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.consommer(self.alice, 1, maintenant)
+            instantane = instantane_base()
+            utilisateur = UtilisateurVirtuel(ClientProcessus(), charger_comptes(), Mesures(), random.Random(3), 'motdepasse')
+            with self.captureOnCommitCallbacks(execute=True):
+                for parcours in PARCOURS:
+                    getattr(utilisateur, f'parcours_{parcours}')()
+            self.assertGreater(ConsommationParticipant.objects.count(), 1)
+
+            supprimes = nettoyer_charge(instantane)
+        self.assertEqual(supprimes['comptes'], 1)
+        self.assertEqual(ConsommationParticipant.objects.count(), 1)
+        self.assertFalse(Pari.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='charge_').exists())
+        self.assertEqual(VentesSoiree.objects.get(service=self.maquis).montant_total, Decimal('700'))
+
+    def test_refus_sans_base_jetable(self):
+        with self.assertRaises(CommandError):
+            call_command('banc_charge', duree=1, stdout=io.StringIO())
+
+    def test_percentiles_et_regressions(self):
+        durees = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(durees, 50), 0.05)
+        self.assertEqual(percentile(durees, 99), 0.099)
+        mesures = Mesures()
+        for duree in durees:
+            mesures.enregistrer('GET /', duree, False)
+        reference = rapport(mesures, 10.0)
+        self.assertEqual(reference['points']['GET /']['p95_ms'], 95.0)
+        self.assertEqual(comparer(reference, reference), [])
+
+        for duree in durees:
+            mesures.enregistrer('GET /', duree * 3, True)
+        regressions = comparer(rapport(mesures, 10.0), reference)
+        self.assertEqual(len(regressions), 2)
+
+
+class DiffusionClassementsTests(DonneesSoireeMixin, TestCase):
+    """Diffusion en direct des évolutions du classement"""
+
+    async def test_evolution_diffusee_a_tous_les_abonnes(self):
+        diffuseur = DiffuseurClassements()
+        premier, second = diffuseur.broker.abonner(), diffuseur.broker.abonner()
+        maintenant = moment(2025, 8, 15, 23)
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            await sync_to_async(diffuseur.etat_initial)()
+            await sync_to_async(self.consommer_et_valider)(self.alice, 2, maintenant)
+            message = await sync_to_async(diffuseur.signaler)('maquis')
+
+        self.assertEqual(message['etablissements'], [{
+            'id': self.maquis.pk, 'nom': 'Maquis Test', 'total': Decimal('1400'),
+            'position': 1, 'ancienne_position': 1,
+        }])
+        self.assertEqual(await premier.recevoir(timeout=1), message)
+        self.assertEqual(await second.recevoir(timeout=1), message)
+
+        # Aucun changement : rien n'est publié
+        with mock.patch('django.utils.timezone.now', return_value=maintenant):
+            self.assertIsNone(await sync_to_async(diffuseur.signaler)('maquis'))
+
+    async def test_flux_sse(self):
+        reponse = await self.async_client.get('/api/classements/flux/')
+        self.assertEqual(reponse['Content-Type'], 'text/event-stream')
+        premier_evenement = await anext(reponse.streaming_content)
+        self.assertTrue(premier_evenement.startswith(b'event: classements\n'))
+        self.assertEqual(diffuseur_classements.broker.nombre_abonnes(), 1)
+        for abonnement in list(diffuseur_classements.broker._abonnes):
+            abonnement.fermer()
+
+    def test_flux_refuse_sous_wsgi(self):
+        reponse = self.client.get('/api/classements/flux/')
+        self.assertEqual(reponse.status_code, 204)
+        self.assertEqual(diffuseur_classements.broker.nombre_abonnes(), 0)
+
+    def test_publication_apres_fermeture_de_la_boucle(self):
+        diffuseur = DiffuseurClassements()
+
+        async def abonner():
+            return diffuseur.broker.abonner()
+
+        # Abonnement créé dans une boucle fermée depuis, comme après une requête terminée
+        asyncio.run(abonner())
+        self.assertEqual(diffuseur.broker.nombre_abonnes(), 1)
+        diffuseur.broker.publier({'type': 'maquis', 'etablissements': []})
+        self.assertEqual(diffuseur.broker.nombre_abonnes(), 0)
+
+    async def test_deconnexion_client(self):
+        diffuseur = DiffuseurClassements()
+        abonnement = diffuseur.broker.abonner()
+        flux = flux_evenements(abonnement, {'classements': {}})
+        await anext(flux)
+        await flux.aclose()
+        self.assertEqual(diffuseur.broker.nombre_abonnes(), 0)
+
+
+class VariantesImagesTests(DonneesSoireeMixin, TestCase):
+    """Variantes des images calculées après la validation de la transaction"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        reglages = override_settings(MEDIA_ROOT=self.media, IMAGES_TRAITEMENT_WORKERS=0)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def image(self, nom='photo.png', taille=(1600, 900), format_='PNG', mode='RGB', **options):
+        contenu = io.BytesIO()
+        Image.new('RGB', taille, (200, 40, 40)).convert(mode).save(contenu, format=format_, **options)
+        return SimpleUploadedFile(nom, contenu.getvalue(), content_type=f'image/{format_.lower()}')
+
+    def test_variantes_apres_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as rappels:
+            self.alice.photo = self.image()
+            self.alice.save()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.photo_variantes, {})
+        self.assertEqual(url_variante(self.alice.photo, self.alice.photo_variantes, 'vignette'), self.alice.photo.url)
+        self.assertEqual(url_variante(self.alice.photo, self.alice.photo_variantes, 'vignette', 'webp'), '')
+
+        for rappel in rappels:
+            rappel()
+        self.alice.refresh_from_db()
+        variantes = self.alice.photo_variantes
+        self.assertEqual(variantes['source'], self.alice.photo.name)
+        self.assertEqual((variantes['complete']['largeur'], variantes['complete']['hauteur']), (1080, 608))
+        self.assertEqual((variantes['carte']['largeur'], variantes['carte']['hauteur']), (400, 225))
+        self.assertEqual((variantes['vignette']['largeur'], variantes['vignette']['hauteur']), (128, 128))
+        for taille in ('complete', 'carte', 'vignette'):
+            for format_ in ('jpeg', 'webp'):
+                self.assertTrue(default_storage.exists(variantes[taille][format_]))
+        with default_storage.open(variantes['vignette']['webp']) as fichier, Image.open(fichier) as image:
+            self.assertEqual(image.format, 'WEBP')
+        self.assertTrue(url_variante(self.alice.photo, variantes, 'carte', 'webp').endswith('_carte.webp'))
+
+        # Suppression de la photo : les variantes sont oubliées
+        self.alice.photo = None
+        self.alice.save()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.photo_variantes, {})
+
+    def test_inscription_sans_traitement_synchrone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reponse = self.client.post('/inscription-participant/', {
+                'pseudo': 'dave', 'nom': 'D', 'prenom': 'Dave', 'email': 'dave@example.com',
+                'service': self.maquis.pk, 'photo': self.image('dave.png'),
+            })
+        self.assertEqual(reponse.status_code, 302)
+        participant = Participant.objects.get(pseudo='dave')
+        self.assertEqual(participant.photo_variantes['source'], participant.photo.name)
+
+    def test_commande_rattrapage(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.bob.photo = self.image('bob.png')
+            self.bob.save()
+        sortie = io.StringIO()
+        call_command('generer_variantes', stdout=sortie)
+        self.bob.refresh_from_db()
+        self.assertIn('vignette', self.bob.photo_variantes)
+        self.assertIn('1 image(s)', sortie.getvalue())
+
+    def test_decodage_reduit_et_oriente(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotation de 90° à appliquer
+        photo = self.image('grande.jpg', (6000, 4000), 'JPEG', exif=exif)
+        image = ouvrir_image(photo)
+        # Décodée au quart (draft JPEG) puis remise à l'endroit
+        self.assertEqual(image.size, (1000, 1500))
+        self.assertEqual(image.mode, 'RGB')
+        self.assertFalse(image.getexif())
+
+    def test_original_sans_metadonnees(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        exif[ExifTags.Base.Make] = 'Appareil'
+        exif[ExifTags.Base.GPSInfo] = {ExifTags.GPS.GPSLatitudeRef: 'N', ExifTags.GPS.GPSLatitude: (12.0, 22.0, 16.0)}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.photo = self.image('photo.jpg', (1600, 900), 'JPEG', exif=exif, comment=b'commentaire')
+            self.alice.save()
+        self.alice.refresh_from_db()
+        with default_storage.open(self.alice.photo.name) as fichier:
+            contenu = fichier.read()
+        self.assertNotIn(b'Appareil', contenu)
+        self.assertNotIn(b'commentaire', contenu)
+        with Image.open(io.BytesIO(contenu)) as original:
+            # Seule l'orientation est conservée ; l'image n'est pas réencodée
+            self.assertEqual(dict(original.getexif()), {ExifTags.Base.Orientation: 6})
+            self.assertNotIn('comment', original.info)
+            self.assertEqual(original.size, (1600, 900))
+        # Variantes toujours remises à l'endroit (portrait)
+        complete = self.alice.photo_variantes['complete']
+        self.assertEqual(complete['hauteur'], 1080)
+        self.assertLess(complete['largeur'], complete['hauteur'])
+
+        png = self.image('photo.png', exif=exif)
+        self.assertNotIn(b'Appareil', retirer_metadonnees(png.read()))
+
+    def test_image_a_palette(self):
+        # GIF / PNG à palette : Image.reduce() refuse le mode P
+        image = ouvrir_image(self.image('affiche.gif', (3000, 2400), 'GIF', mode='P'))
+        self.assertEqual(image.mode, 'RGB')
+        self.assertGreaterEqual(max(image.size), 1080)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.photo = self.image('affiche.png', (2400, 2400), mode='P')
+            self.alice.save()
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.photo_variantes['vignette']['largeur'], 128)
+
+    def test_erreur_inattendue_journalisee(self):
+        with mock.patch('soiree.images.generer_variantes', side_effect=RuntimeError('panne')), \
+                self.assertLogs('soiree.images', 'ERROR') as logs, self.captureOnCommitCallbacks(execute=True):
+            self.bob.photo = self.image('bob.png')
+            self.bob.save()
+        self.assertIn('panne', logs.output[0])
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.photo_variantes, {})
+
+    @override_settings(IMAGES_PIXELS_MAX=1_000_000)
+    def test_image_trop_grande_refusee(self):
+        with self.assertRaises(ImageTropGrande):
+            ouvrir_image(self.image(taille=(1200, 900)))
+
+        self.client.login(username='gerant_maquis', password='motdepasse')
+        reponse = self.client.post('/inscription-participant/', {
+            'pseudo': 'eve', 'nom': 'E', 'prenom': 'Eve', 'email': 'eve@example.com',
+            'service': self.maquis.pk, 'photo': self.image('eve.png', (1200, 900)),
+        })
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('Image trop grande', reponse.content.decode())
+        self.assertFalse(Participant.objects.filter(pseudo='eve').exists())
+
+
+class TeleversementVideoTests(TestCase):
+    """Envoi des vidéos de demande d'adhésion par blocs, avec reprise"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.video = os.urandom(250_000)
+
+    def ouvrir(self, **donnees):
+        return self.client.post(
+            '/api/videos/televersements/', json.dumps(donnees or {'taille': len(self.video), 'type': 'video/webm;codecs=vp9'}),
+            content_type='application/json'
+        )
+
+    def envoyer(self, url, position, bloc):
+        return self.client.patch(url, bloc, content_type='application/octet-stream', headers={'Upload-Offset': position})
+
+    def test_envoi_reprise_et_rattachement(self):
+        reponse = self.ouvrir()
+        self.assertEqual(reponse.status_code, 201)
+        url = reponse['Location']
+        televersement = TeleversementVideo.objects.get(pk=reponse.json()['id'])
+
+        self.assertEqual(self.envoyer(url, 0, self.video[:100_000]).json()['recu'], 100_000)
+        # Bloc renvoyé (réponse perdue) : refusé, la position de reprise est indiquée
+        reponse = self.envoyer(url, 0, self.video[:100_000])
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse['Upload-Offset'], '100000')
+
+        # Connexion coupée au milieu d'un bloc : la partie reçue est conservée
+        televersement.refresh_from_db()
+        with self.assertRaises(TeleversementInvalide) as erreur:
+            ajouter_bloc(televersement, 100_000, io.BytesIO(self.video[100_000:130_000]), 100_000)
+        self.assertEqual(erreur.exception.recu, 130_000)
+        self.assertEqual(self.client.get(url).json()['recu'], 130_000)
+        self.assertEqual(self.client.post(url + 'terminer/').status_code, 409)
+
+        self.assertEqual(self.envoyer(url, 130_000, self.video[130_000:]).json()['recu'], len(self.video))
+        reponse = self.client.post(url + 'terminer/')
+        self.assertTrue(reponse.json()['termine'])
+        televersement.refresh_from_db()
+        self.assertTrue(televersement.chemin.startswith('videos/demandes/video_enregistree_'))
+        self.assertTrue(televersement.chemin.endswith('.webm'))
+
+        reponse = self.client.post('/', {
+            'pseudo': 'NouveauMaquis', 'nom_etablissement': 'Nouveau Maquis', 'type_etablissement': 'maquis',
+            'quartier': 'Zone 2', 'ville': 'Ouagadougou', 'nom_gestionnaire': 'N', 'prenom_gestionnaire': 'G',
+            'telephone_gestionnaire': '70000001', 'email_gestionnaire': 'nouveau@example.com',
+            'televersement_video': str(televersement.pk),
+        })
+        self.assertEqual(reponse.status_code, 200)
+        demande = DemandeAdhesion.objects.get(pseudo='NouveauMaquis')
+        self.assertEqual(demande.video_etablissement.name, televersement.chemin)
+        with demande.video_etablissement.open('rb') as fichier:
+            self.assertEqual(fichier.read(), self.video)
+        televersement.refresh_from_db()
+        self.assertEqual(televersement.demande, demande)
+
+    def test_refus(self):
+        self.assertEqual(self.ouvrir(taille=10, type='image/png').status_code, 400)
+        self.assertEqual(self.ouvrir(taille=500 * 1024 * 1024, type='video/mp4').status_code, 400)
+        url = self.ouvrir(taille=10, type='video/mp4')['Location']
+        self.assertEqual(self.envoyer(url, 0, b'x' * 11).status_code, 400)
+        self.assertEqual(self.envoyer(url, 5, b'x' * 5).status_code, 409)
+        self.assertEqual(self.client.get('/api/videos/televersements/%s/' % uuid.uuid4()).status_code, 404)
+
+    def test_envoi_reserve_a_sa_session(self):
+        url = self.ouvrir()['Location']
+        autre = Client()
+        self.assertEqual(autre.get(url).status_code, 404)
+        self.assertEqual(autre.patch(
+            url, self.video[:1000], content_type='application/octet-stream', headers={'Upload-Offset': 0}
+        ).status_code, 404)
+        self.assertEqual(autre.post(url + 'terminer/').status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_nombre_d_envois_ouverts_limite(self):
+        for _ in range(TELEVERSEMENTS_OUVERTS_MAX):
+            self.assertEqual(self.ouvrir().status_code, 201)
+        self.assertEqual(self.ouvrir().status_code, 429)
+        # Autre session derrière la même adresse : limite propre à la session
+        self.assertEqual(Client().post(
+            '/api/videos/televersements/', json.dumps({'taille': 10, 'type': 'video/webm'}),
+            content_type='application/json'
+        ).status_code, 201)
+        # Les envois inactifs expirent et ne comptent plus
+        TeleversementVideo.objects.update(date_mise_a_jour=timezone.now() - timedelta(hours=3))
+        reponse = self.ouvrir()
+        self.assertEqual(reponse.status_code, 201)
+        expire = TeleversementVideo.objects.filter(cle_session=self.client.session.session_key).exclude(
+            pk=reponse.json()['id']
+        ).first()
+        self.assertEqual(self.envoyer(f'/api/videos/televersements/{expire.pk}/', 0, self.video[:1000]).status_code, 400)
+
+    @override_settings(ADRESSE_CLIENT_META='HTTP_X_REAL_IP')
+    def test_limite_par_adresse_derriere_le_proxy(self):
+        def ouvrir(adresse):
+            # Chaque client a sa session ; REMOTE_ADDR est celle du proxy
+            return Client(REMOTE_ADDR='10.0.0.1', HTTP_X_REAL_IP=adresse).post(
+                '/api/videos/televersements/', json.dumps({'taille': 10, 'type': 'video/webm'}),
+                content_type='application/json'
+            )
+
+        for _ in range(TELEVERSEMENTS_OUVERTS_MAX_ADRESSE):
+            self.assertEqual(ouvrir('198.51.100.7').status_code, 201)
+        self.assertEqual(ouvrir('198.51.100.7').status_code, 429)
+        self.assertEqual(ouvrir('203.0.113.9').status_code, 201)
+        self.assertEqual(adresse_client({'HTTP_X_REAL_IP': 'pas une adresse'}), None)
+
+    def test_position_reservee_avant_ecriture(self):
+        url = self.ouvrir()['Location']
+        self.assertEqual(self.envoyer(url, 0, self.video[:1000]).status_code, 200)
+        televersement = TeleversementVideo.objects.get()
+        # Un autre envoi écrit déjà le bloc suivant : le second est refusé sans toucher au fichier
+        TeleversementVideo.objects.update(bloc_commence=timezone.now())
+        reponse = self.envoyer(url, 1000, b'x' * 1000)
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse['Upload-Offset'], '1000')
+        with open(default_storage.path(televersement.chemin), 'rb') as fichier:
+            self.assertEqual(fichier.read(), self.video[:1000])
+        # Réservation abandonnée (processus arrêté en plein bloc) : reprise après DUREE_BLOC_MAX
+        TeleversementVideo.objects.update(bloc_commence=timezone.now() - timedelta(minutes=11))
+        self.assertEqual(self.envoyer(url, 1000, self.video[1000:2000]).json()['recu'], 2000)
+
+
+class StockageContenuTests(DonneesSoireeMixin, TestCase):
+    """Médias adressés par contenu : un fichier identique n'est stocké qu'une fois"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def inode(self, name):
+        return os.stat(default_storage.path(name)).st_ino
+
+    def test_contenus_identiques_partages(self):
+        premier = default_storage.save('videos/demandes/a.webm', ContentFile(b'video' * 1000))
+        second = default_storage.save('videos/demandes/a.webm', ContentFile(b'video' * 1000))
+        autre = default_storage.save('videos/demandes/b.webm', ContentFile(b'autre'))
+        self.assertNotEqual(premier, second)
+        self.assertEqual(self.inode(premier), self.inode(second))
+        self.assertNotEqual(self.inode(premier), self.inode(autre))
+        with default_storage.open(second) as fichier:
+            self.assertEqual(fichier.read(), b'video' * 1000)
+
+        default_storage.delete(premier)
+        self.assertEqual(list(default_storage.contenus_orphelins()), [])
+        default_storage.delete(second)
+        self.assertEqual(len(list(default_storage.contenus_orphelins())), 1)
+
+    def test_approbation_sans_recopie(self):
+        video = default_storage.save('videos/demandes/presentation.webm', ContentFile(os.urandom(4096)))
+        demande = DemandeAdhesion.objects.create(
+            pseudo='Nouveau', nom_etablissement='Nouveau Maquis', type_etablissement='maquis',
+            quartier='Zone 2', nom_gestionnaire='N', prenom_gestionnaire='G',
+            telephone_gestionnaire='70000001', email_gestionnaire='nouveau@example.com',
+            video_etablissement=video,
+        )
+        self.client.login(username='admin', password='motdepasse')
+        self.client.post('/admin-demandes-adhesion/', {'demande_id': demande.pk, 'action': 'approuver'})
+        service = Service.objects.get(nom='Nouveau Maquis')
+        self.assertTrue(service.video_etablissement.name.startswith('videos/etablissements/video_'))
+        self.assertEqual(self.inode(service.video_etablissement.name), self.inode(video))
+
+    def test_commande_deduplication(self):
+        for nom in ('videos/demandes/x.webm', 'videos/etablissements/x.webm'):
+            os.makedirs(os.path.dirname(default_storage.path(nom)), exist_ok=True)
+            with open(default_storage.path(nom), 'wb') as fichier:
+                fichier.write(b'meme contenu' * 100)
+        sortie = io.StringIO()
+        call_command('dedupliquer_media', '--purger', stdout=sortie)
+        self.assertEqual(self.inode('videos/demandes/x.webm'), self.inode('videos/etablissements/x.webm'))
+        self.assertIn('1.2\xa0KB libérés', sortie.getvalue())
+
+
+class ServiceMediasTests(TestCase):
+    """Médias servis par plages d'octets avec revalidation"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.contenu = os.urandom(100_000)
+        self.nom = default_storage.save('videos/etablissements/presentation.webm', ContentFile(self.contenu))
+        self.url = '/media/' + self.nom
+
+    def test_fichier_entier_et_revalidation(self):
+        reponse = self.client.get(self.url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(b''.join(reponse.streaming_content), self.contenu)
+        self.assertEqual(reponse['Content-Type'], 'video/webm')
+        self.assertEqual(reponse['Accept-Ranges'], 'bytes')
+        reponse = self.client.get(self.url, headers={'If-None-Match': reponse['ETag']})
+        self.assertEqual(reponse.status_code, 304)
+
+    def test_plages(self):
+        reponse = self.client.get(self.url, headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(reponse.status_code, 206)
+        self.assertEqual(reponse['Content-Range'], 'bytes 1000-1999/100000')
+        self.assertEqual(reponse['Content-Length'], '1000')
+        self.assertEqual(b''.join(reponse.streaming_content), self.contenu[1000:2000])
+
+        reponse = self.client.get(self.url, headers={'Range': 'bytes=-500'})
+        self.assertEqual(b''.join(reponse.streaming_content), self.contenu[-500:])
+        reponse = self.client.get(self.url, headers={'Range': 'bytes=99000-'})
+        self.assertEqual(reponse['Content-Range'], 'bytes 99000-99999/100000')
+
+        reponse = self.client.get(self.url, headers={'Range': 'bytes=200000-'})
+        self.assertEqual(reponse.status_code, 416)
+        self.assertEqual(reponse['Content-Range'], 'bytes */100000')
+        # If-Range périmé : le fichier entier
+        reponse = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"ancien"'})
+        self.assertEqual(reponse.status_code, 200)
+
+    @override_settings(MEDIA_ENVOI='x-accel-redirect')
+    def test_envoi_delegue(self):
+        reponse = self.client.get(self.url)
+        self.assertEqual(reponse['X-Accel-Redirect'], '/media-interne/' + self.nom)
+        self.assertEqual(reponse.content, b'')
+
+    def test_fichiers_non_publies(self):
+        self.assertEqual(self.client.get('/media/videos/absente.webm').status_code, 404)
+        self.assertEqual(self.client.get('/media/.contenu/').status_code, 404)
+        self.assertEqual(self.client.get('/media/../conf/settings.py').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+        partiel = default_storage.save('videos/demandes/partiels/envoi.part', ContentFile(b'x' * 10))
+        self.assertEqual(self.client.get('/media/' + partiel).status_code, 404)
+        self.assertEqual(self.client.get('/media/' + partiel.replace('partiels', 'Partiels')).status_code, 404)
+
+    def test_route_montee_seulement_si_demandee(self):
+        self.addCleanup(importlib.reload, urls_projet)
+        with override_settings(MEDIA_SERVIR=False):
+            motifs = importlib.reload(urls_projet).urlpatterns
+        self.assertNotIn('media', [getattr(motif, 'name', None) for motif in motifs])
+        with override_settings(MEDIA_SERVIR=True):
+            motifs = importlib.reload(urls_projet).urlpatterns
+        self.assertIn('media', [getattr(motif, 'name', None) for motif in motifs])
+
+
+class NettoyageMediaTests(DonneesSoireeMixin, TestCase):
+    """Suppression des médias qui ne sont plus référencés"""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        reglages = override_settings(MEDIA_ROOT=self.media, IMAGES_TRAITEMENT_WORKERS=0)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def fichier(self, nom, contenu=b'contenu', age_heures=48):
+        nom = default_storage.save(nom, ContentFile(contenu))
+        moment = time.time() - age_heures * 3600
+        os.utime(default_storage.path(nom), (moment, moment))
+        return nom
+
+    def test_orphelins_supprimes(self):
+        photo = io.BytesIO()
+        Image.new('RGB', (300, 300)).save(photo, format='PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.photo = SimpleUploadedFile('alice.png', photo.getvalue())
+            self.alice.save()
+        self.alice.refresh_from_db()
+        vignette = self.alice.photo_variantes['vignette']['webp']
+
+        ancienne_photo = self.fichier('photos/participants/alice_resized_ancienne.jpg', b'ancienne')
+        recent = self.fichier('photos/participants/recent.jpg', b'recente', age_heures=1)
+        video_rejetee = self.fichier('videos/demandes/rejetee.webm', b'video rejetee')
+        demande = DemandeAdhesion.objects.create(
+            pseudo='Refuse', nom_etablissement='Refusé', type_etablissement='maquis', quartier='Zone 3',
+            nom_gestionnaire='R', prenom_gestionnaire='F', telephone_gestionnaire='70000002',
+            email_gestionnaire='refuse@example.com', video_etablissement=video_rejetee, statut='rejetee',
+        )
+        DemandeAdhesion.objects.filter(pk=demande.pk).update(date_traitement=timezone.now() - timedelta(days=3))
+        for nom in (self.alice.photo.name, vignette):
+            moment = time.time() - 48 * 3600
+            os.utime(default_storage.path(nom), (moment, moment))
+
+        sortie = io.StringIO()
+        call_command('nettoyer_media', '--simulation', stdout=sortie)
+        self.assertIn('2 fichier(s) orphelin(s) à supprimer', sortie.getvalue())
+        self.assertTrue(default_storage.exists(ancienne_photo))
+
+        call_command('nettoyer_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(ancienne_photo))
+        self.assertFalse(default_storage.exists(video_rejetee))
+        self.assertTrue(default_storage.exists(recent))
+        self.assertTrue(default_storage.exists(self.alice.photo.name))
+        self.assertTrue(default_storage.exists(vignette))
+        demande.refresh_from_db()
+        self.assertFalse(demande.video_etablissement)
+        # Le contenu dédupliqué des fichiers supprimés est libéré aussi
+        self.assertEqual(list(default_storage.contenus_orphelins()), [])
+
+    def test_video_envoyee_de_demande_rejetee(self):
+        video = self.fichier('videos/demandes/video_enregistree_1.webm', b'video envoyee')
+        demande = DemandeAdhesion.objects.create(
+            pseudo='Tardif', nom_etablissement='Tardif', type_etablissement='maquis', quartier='Zone 4',
+            nom_gestionnaire='T', prenom_gestionnaire='A', telephone_gestionnaire='70000003',
+            email_gestionnaire='tardif@example.com', video_etablissement=video,
+        )
+        TeleversementVideo.objects.create(
+            taille=13, recu=13, type_contenu='video/webm', chemin=video, termine=True, demande=demande
+        )
+        DemandeAdhesion.objects.filter(pk=demande.pk).update(date_demande=timezone.now() - timedelta(days=30))
+        demande.statut = 'rejetee'
+        demande.save()
+        self.assertIsNotNone(demande.date_traitement)
+
+        # Demande ancienne mais rejetée à l'instant : la vidéo est conservée
+        call_command('nettoyer_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(video))
+        self.assertTrue(TeleversementVideo.objects.exists())
+
+        DemandeAdhesion.objects.filter(pk=demande.pk).update(date_traitement=timezone.now() - timedelta(days=2))
+        call_command('nettoyer_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(video))
+        self.assertFalse(TeleversementVideo.objects.exists())
+
+    def test_envoi_abandonne(self):
+        reponse = self.client.post(
+            '/api/videos/televersements/', json.dumps({'taille': 10, 'type': 'video/webm'}), content_type='application/json'
+        )
+        televersement = TeleversementVideo.objects.get(pk=reponse.json()['id'])
+        partiel = default_storage.path(televersement.chemin)
+        moment = time.time() - 48 * 3600
+        os.utime(partiel, (moment, moment))
+
+        call_command('nettoyer_media', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(partiel))  # envoi toujours actif
+
+        TeleversementVideo.objects.filter(pk=televersement.pk).update(date_mise_a_jour=timezone.now() - timedelta(days=2))
+        call_command('nettoyer_media', stdout=io.StringIO())
+        self.assertFalse(os.path.exists(partiel))
+        self.assertFalse(TeleversementVideo.objects.exists())
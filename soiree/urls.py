@@ -29,7 +29,15 @@ urlpatterns = [
     
     # API endpoints
     path("api/classements/", views.api_classements, name='api_classements'),
+    path("api/classements/flux/", views.flux_classements, name='flux_classements'),
     path("api/consommations/", views.api_consommations, name='api_consommations'),
+    path("api/consommations/lot/", views.api_saisie_consommations, name='api_saisie_consommations'),
+    path("api/pseudo-disponible/", views.api_pseudo_disponible, name='api_pseudo_disponible'),
+    path("api/consommations/rejouer/", views.api_rejouer_consommations, name='api_rejouer_consommations'),
+    path("api/videos/televersements/", views.api_televersements_video, name='api_televersements_video'),
+    path("api/videos/televersements/<uuid:televersement_id>/", views.api_televersement_video, name='api_televersement_video'),
+    path("api/videos/televersements/<uuid:televersement_id>/terminer/", views.api_terminer_televersement_video,
+         name='api_terminer_televersement_video'),
     
     # Vue de test
     path("test-boissons/", views.test_boissons, name='test_boissons'),
@@ -0,0 +1,80 @@
+"""
+Versions des données pour les requêtes conditionnelles (ETag / Last-Modified)
+
+Chaque portée (classements, consommations) a un numéro de version, gardé dans
+le cache partagé (réglage CACHES, commun à tous les workers) et remplacé à
+chaque saisie validée. Les API interrogées en continu
+comparent ce numéro à l'en-tête If-None-Match avant toute autre requête et
+répondent 304 si rien n'a changé. La version n'est lue qu'une fois par
+requête (version_requete) : l'ETag, Last-Modified et la vue partagent cette
+lecture, seul accès au cache partagé d'une réponse 304.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import HEURE_FERMETURE_SOIREE, date_soiree_courante
+
+
+PORTEE_CLASSEMENTS = 'classements'
+PORTEE_CONSOMMATIONS = 'consommations'
+
+
+def _cle_version(portee):
+    return f'version_donnees:{portee}'
+
+
+def incrementer_version(*portees):
+    """Marque les données d'une ou plusieurs portées comme modifiées"""
+    # Horodatage en microsecondes : croissant et différent après un redémarrage
+    version = time.time_ns() // 1000
+    cache.set_many({_cle_version(portee): version for portee in portees}, None)
+
+
+def version_donnees(portee):
+    """Version courante d'une portée (initialisée au premier appel)"""
+    version = cache.get(_cle_version(portee))
+    if version is None:
+        version = time.time_ns() // 1000
+        if not cache.add(_cle_version(portee), version, None):
+            version = cache.get(_cle_version(portee), version)
+    return version
+
+
+def version_requete(request, portee):
+    """Version d'une portée lue une seule fois pendant la requête"""
+    versions = request.__dict__.setdefault('_versions_donnees', {})
+    if portee not in versions:
+        versions[portee] = version_donnees(portee)
+    return versions[portee]
+
+
+def _debut_soiree_courante():
+    """Instant où la soirée courante est devenue « aujourd'hui » (11h00)"""
+    return timezone.make_aware(datetime.combine(date_soiree_courante(), HEURE_FERMETURE_SOIREE))
+
+
+def etag_api(portee):
+    """
+    Fonction etag_func pour le décorateur condition()
+    L'ETag dépend de la version, de la soirée courante et des paramètres de la
+    requête (et de l'utilisateur pour les réponses qui en dépendent).
+    """
+    def etag(request):
+        empreinte = hashlib.sha1(request.get_full_path().encode())
+        if request.GET.get('detail'):
+            empreinte.update(str(request.session.get(SESSION_KEY)).encode())
+        return f'{portee}-{version_requete(request, portee)}-{date_soiree_courante():%Y%m%d}-{empreinte.hexdigest()[:12]}'
+    return etag
+
+
+def derniere_modification_api(portee):
+    """Fonction last_modified_func pour le décorateur condition()"""
+    def derniere_modification(request):
+        modification = datetime.fromtimestamp(version_requete(request, portee) / 1_000_000, tz=dt_timezone.utc)
+        return max(modification, _debut_soiree_courante())
+    return derniere_modification
@@ -1,14 +1,17 @@
-import pandas as pd
-import base64
 import os
-from django.http import HttpResponse, JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.template.loader import get_template
-from django.db.models import Sum, Count, Q
+from django.views.decorators.http import condition, require_safe
+from django.db.models import Sum, Count, Q, Prefetch, OuterRef, Subquery, IntegerField, DecimalField
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta, datetime
 from django.contrib.auth.models import User
 from django.contrib.auth import login
@@ -16,20 +19,39 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from .models import (
     Service, TypeBoisson, Profile, Gestionnaire, Participant, 
     ConsommationParticipant, Trophee, Pari, DemandeAdhesion,
-    ClassementQuotidien, ClassementEtablissement
+    ClassementQuotidien, ClassementEtablissement, PseudoIndisponible, TeleversementVideo, date_soiree_courante,
+    pseudo_disponible, normaliser_pseudo
 )
 from .forms import (
     ServiceForm, TypeBoissonForm, ProfileForm, GestionnaireForm,
     ParticipantForm, PariForm, DemandeAdhesionForm, TypeBoissonForm,
-    ConsommationParticipantForm, ProfileForm, GestionnaireForm, ServiceForm
+    ConsommationParticipantForm, ProfileForm, GestionnaireForm, ServiceForm,
+    LigneConsommationFormSet
 )
-from .utils import is_pseudo_unique, generate_random_password, ensure_media_directories, copy_file_to_service, save_recorded_video
+from .utils import is_pseudo_unique, generate_random_password, ensure_media_directories, copy_file_to_service
 from .forms import CustomUserRegistrationForm
+from .tableau_classements import tableau_classements, etablissements_du_tableau, participants_du_tableau
+from .statistiques import statistiques_etablissements
+from .diffusion import diffuseur_classements, flux_evenements
+from .versions import etag_api, derniere_modification_api, version_requete, PORTEE_CLASSEMENTS, PORTEE_CONSOMMATIONS
+from .pagination import paginer, taille_page, CurseurInvalide
+from .medias import reponse_media
+from .saisie import enregistrer_lot, rejouer_saisies, LotInvalide, TAILLE_MAX_REJEU
+from .televersement import (
+    adresse_client, creer_televersement, ajouter_bloc, terminer_televersement, video_terminee, televersement_du_client,
+    TeleversementInvalide, PositionIncorrecte, TropDeTeleversements, TAILLE_BLOC,
+)
+from .exports import (
+    COLONNES_CONSOMMATIONS, COLONNES_CLASSEMENTS_PARTICIPANTS, COLONNES_CLASSEMENTS_ETABLISSEMENTS,
+    consommations_a_exporter, lignes_consommations, lignes_classements_participants,
+    lignes_classements_etablissements, flux_csv, fichier_xlsx,
+)
 import json
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 def is_admin(user):
@@ -71,7 +93,7 @@ def index(request):
                     'total_participants': Participant.objects.filter(actif=True).count(),
                     'top_maquis': [],
                     'top_boites': [],
-                    'trophees_recents': Trophee.objects.all().order_by('-date_attribution')[:3],
+                    'trophees_recents': Trophee.objects.select_related('gagnant', 'etablissement').order_by('-date_attribution')[:3],
                     'etablissements': [],
                     'consommations_aujourd_hui': 0,
                 }
@@ -90,21 +112,12 @@ def index(request):
                 demande.video_etablissement = request.FILES['video_etablissement']
                 print(f"✅ Vidéo uploadée assignée: {demande.video_etablissement.name}")
             
-            # 2. Vérifier s'il y a une vidéo enregistrée directement
-            recorded_video_data = form.cleaned_data.get('recorded_video_data')
-            if recorded_video_data and recorded_video_data.startswith('data:video/'):
+            # 2. Vérifier s'il y a une vidéo enregistrée directement (envoyée par blocs)
+            televersement = video_terminee(form.cleaned_data.get('televersement_video'), request.session.session_key)
+            if televersement:
                 print("🎥 Vidéo enregistrée directement détectée")
-                try:
-                    # Utiliser l'utilitaire pour sauvegarder la vidéo
-                    video_file = save_recorded_video(recorded_video_data, "video_enregistree")
-                    if video_file:
-                        demande.video_etablissement = video_file
-                        print(f"✅ Vidéo enregistrée sauvegardée: {video_file.name}")
-                    else:
-                        print("❌ Erreur lors de la sauvegarde de la vidéo enregistrée")
-                except Exception as e:
-                    print(f"❌ Erreur lors du traitement de la vidéo enregistrée: {e}")
-                    # En cas d'erreur, on continue sans la vidéo
+                demande.video_etablissement = televersement.chemin
+                print(f"✅ Vidéo enregistrée rattachée: {televersement.chemin}")
             
             # 3. Vérifier s'il y a une miniature
             if 'miniature_video' in request.FILES:
@@ -118,21 +131,28 @@ def index(request):
             print("📁 Création des dossiers media...")
             ensure_media_directories()
             
-            demande.save()
-            print(f"✅ Demande sauvegardée avec l'ID: {demande.id}")
+            try:
+                demande.save()
+            except PseudoIndisponible:
+                # Pseudo réservé entre la vérification et l'enregistrement
+                messages.error(request, f'Le pseudo "{pseudo}" est déjà utilisé. Veuillez choisir un autre pseudo.')
+            else:
+                print(f"✅ Demande sauvegardée avec l'ID: {demande.id}")
+                if televersement:
+                    TeleversementVideo.objects.filter(pk=televersement.pk).update(demande=demande)
             
-            # Ajouter le message de succès
-            success_message = f'🎉 Votre demande d\'adhésion pour "{demande.nom_etablissement}" a été envoyée avec succès ! Nous vous contacterons bientôt par email à {demande.email_gestionnaire}.'
-            print(f"📝 Ajout du message de succès: {success_message}")
-            messages.success(request, success_message)
+                # Ajouter le message de succès
+                success_message = f'🎉 Votre demande d\'adhésion pour "{demande.nom_etablissement}" a été envoyée avec succès ! Nous vous contacterons bientôt par email à {demande.email_gestionnaire}.'
+                print(f"📝 Ajout du message de succès: {success_message}")
+                messages.success(request, success_message)
             
-            # Vérifier que le message a été ajouté
-            print(f"🔍 Messages dans la requête après ajout: {list(messages.get_messages(request))}")
+                # Vérifier que le message a été ajouté
+                print(f"🔍 Messages dans la requête après ajout: {list(messages.get_messages(request))}")
             
-            # Au lieu de rediriger, on recharge le formulaire vide et on affiche le message
-            form = DemandeAdhesionForm()
-            print("🔄 Formulaire réinitialisé")
-            # Le message sera affiché par le template
+                # Au lieu de rediriger, on recharge le formulaire vide et on affiche le message
+                form = DemandeAdhesionForm()
+                print("🔄 Formulaire réinitialisé")
+                # Le message sera affiché par le template
     else:
         form = DemandeAdhesionForm()
     
@@ -150,52 +170,23 @@ def index(request):
         else:
             etablissements = []
         
-        # Statistiques personnelles
-        aujourd_hui = timezone.now().date()
+        # Statistiques personnelles (soirée en cours)
         consommations_aujourd_hui = ConsommationParticipant.objects.filter(
             service__in=etablissements,
-            date_consommation__date=aujourd_hui
+            date_soiree=date_soiree_courante()
         ).aggregate(total=Sum('montant_total'))['total'] or 0
     else:
         etablissements = []
         consommations_aujourd_hui = 0
     
     # Classements des établissements par type (entre 17h30 de la veille et 11h00 d'aujourd'hui)
-    maintenant = timezone.now()
-    hier_17h30 = (maintenant - timedelta(days=1)).replace(hour=17, minute=30, second=0, microsecond=0)
-    aujourd_hui_11h = maintenant.replace(hour=11, minute=0, second=0, microsecond=0)
-    
-    if maintenant.hour < 11:
-        debut = hier_17h30
-        fin = aujourd_hui_11h
-    else:
-        debut = maintenant.replace(hour=17, minute=30, second=0, microsecond=0)
-        fin = (maintenant + timedelta(days=1)).replace(hour=11, minute=0, second=0, microsecond=0)
-    
-    # Top 3 maquis
-    top_maquis = Service.objects.filter(
-        type='maquis', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).filter(
-        consommationparticipant__date_consommation__range=[debut, fin]
-    ).order_by('-total_ventes')[:3]
-    
-    # Top 3 boîtes de nuit
-    top_boites = Service.objects.filter(
-        type='boite', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).filter(
-        consommationparticipant__date_consommation__range=[debut, fin]
-    ).order_by('-total_ventes')[:3]
+    # Lus depuis le tableau des classements en mémoire (version lue une fois pour la page)
+    version = version_requete(request, PORTEE_CLASSEMENTS)
+    top_maquis = etablissements_du_tableau('maquis', 3, avec_ventes=True, version=version)
+    top_boites = etablissements_du_tableau('boite', 3, avec_ventes=True, version=version)
     
     # Trophées récents
-    trophees_recents = Trophee.objects.all().order_by('-date_attribution')[:3]
+    trophees_recents = Trophee.objects.select_related('gagnant', 'etablissement').order_by('-date_attribution')[:3]
     
     context = {
         'form': form,
@@ -210,10 +201,53 @@ def index(request):
     return render(request, 'index.html', context)
 
 
+def _services_avec_boissons(services):
+    """
+    Précharge les boissons actives de chaque établissement (attribut boissons_actives)
+    Une seule requête pour toutes les boissons (prefetch) au lieu d'une par établissement
+    """
+    return services.prefetch_related(Prefetch(
+        'typeboisson_set',
+        queryset=TypeBoisson.objects.filter(actif=True).order_by('categorie'),
+        to_attr='boissons_actives'
+    ))
+
+
+def _boissons_par_etablissement(services):
+    """
+    Boissons actives de chaque établissement, pour l'affichage à l'inscription
+    Les services sont ceux renvoyés par _services_avec_boissons.
+    """
+    boissons_par_etablissement = {}
+    for service in services:
+        if service.type == 'boite':
+            # Pour les boîtes de nuit : système d'enchères (pas de prix fixe)
+            boissons_par_etablissement[service.id] = {
+                'nom': service.nom,
+                'type': service.get_type_display(),
+                'type_etablissement': 'boite',
+                'boissons': [{'categorie': b.categorie} for b in service.boissons_actives],
+                'systeme': 'enchères'
+            }
+        else:
+            # Pour les maquis : système de prix fixes
+            boissons_par_etablissement[service.id] = {
+                'nom': service.nom,
+                'type': service.get_type_display(),
+                'type_etablissement': 'maquis',
+                'boissons': [
+                    {'categorie': b.categorie, 'prix_vente': b.prix_vente} for b in service.boissons_actives
+                ],
+                'systeme': 'prix_fixes'
+            }
+    return boissons_par_etablissement
+
+
 def inscription_participant(request):
     """Inscription publique des participants depuis la page d'accueil"""
     if request.method == 'POST':
-        form = ParticipantForm(request.POST)
+        # La photo est enregistrée telle quelle : ses variantes sont calculées en arrière-plan
+        form = ParticipantForm(request.POST, request.FILES)
         if form.is_valid():
             # Vérifier l'unicité du pseudo
             if not is_pseudo_unique(form.cleaned_data['pseudo']):
@@ -256,27 +290,6 @@ def inscription_participant(request):
                     participant = form.save(commit=False)
                     participant.user = user
                     
-                    # Traiter la photo si elle existe
-                    if form.cleaned_data.get('photo'):
-                        try:
-                            # Importer la fonction de traitement des photos
-                            from .utils import process_participant_photo, ensure_photo_directories
-                            
-                            # S'assurer que les dossiers photos existent
-                            ensure_photo_directories()
-                            
-                            # Traiter et redimensionner la photo
-                            processed_photo = process_participant_photo(form.cleaned_data['photo'])
-                            if processed_photo:
-                                participant.photo = processed_photo
-                                print(f"✅ Photo du participant traitée et redimensionnée: {processed_photo.name}")
-                            else:
-                                print("⚠️ Échec du traitement de la photo, utilisation de l'original")
-                        except Exception as e:
-                            print(f"❌ Erreur lors du traitement de la photo: {e}")
-                            # En cas d'erreur, utiliser la photo originale
-                            participant.photo = form.cleaned_data['photo']
-                    
                     participant.save()
                     
                     # Connecter automatiquement l'utilisateur
@@ -319,6 +332,10 @@ def inscription_participant(request):
                     messages.success(request, f'🎉 Bienvenue {pseudo} ! Votre inscription a été effectuée avec succès.')
                     return redirect('app:dashboard')
                     
+            except PseudoIndisponible:
+                messages.error(request, 'Ce pseudo est déjà utilisé. Veuillez en choisir un autre.')
+                context = {'form': form}
+                return render(request, 'inscription_participant.html', context)
             except Exception as e:
                 messages.error(request, f'Erreur lors de l\'inscription : {str(e)}')
                 context = {'form': form}
@@ -326,36 +343,8 @@ def inscription_participant(request):
     else:
         form = ParticipantForm()
     
-    # Débogage : vérifier les établissements disponibles
     services_disponibles = Service.objects.filter(actif=True, types_boissons_enregistres=True)
-    print(f"🔍 Établissements disponibles pour inscription: {services_disponibles.count()}")
-    for service in services_disponibles:
-        print(f"  - {service.nom} ({service.type}) - Actif: {service.actif} - Types boissons: {service.types_boissons_enregistres}")
-    
-    # Récupérer tous les types de boissons par établissement pour l'affichage
-    boissons_par_etablissement = {}
-    for service in services_disponibles:
-        types_boissons = TypeBoisson.objects.filter(service=service, actif=True).order_by('categorie')
-        
-        # Différencier la logique selon le type d'établissement
-        if service.type == 'boite':
-            # Pour les boîtes de nuit : système d'enchères (pas de prix fixe)
-            boissons_par_etablissement[service.id] = {
-                'nom': service.nom,
-                'type': service.get_type_display(),
-                'type_etablissement': 'boite',
-                'boissons': list(types_boissons.values('categorie')),
-                'systeme': 'enchères'
-            }
-        else:
-            # Pour les maquis : système de prix fixes
-            boissons_par_etablissement[service.id] = {
-                'nom': service.nom,
-                'type': service.get_type_display(),
-                'type_etablissement': 'maquis',
-                'boissons': list(types_boissons.values('categorie', 'prix_vente')),
-                'systeme': 'prix_fixes'
-            }
+    boissons_par_etablissement = _boissons_par_etablissement(_services_avec_boissons(services_disponibles))
     
     # Débogage : afficher les données des boissons
     print(f"🔍 Données des boissons préparées: {boissons_par_etablissement}")
@@ -450,55 +439,51 @@ def register(request):
     return render(request, 'register.html', context)
 
 
+def _etablissements_utilisateur(user):
+    """
+    Établissements gérés ou possédés par l'utilisateur, avec leurs compteurs
+    (participants, types de boissons, ventes de la soirée) calculés en sous-requêtes
+    """
+    if hasattr(user, 'gestionnaire'):
+        etablissements = Service.objects.filter(pk=user.gestionnaire.service_id)
+    elif hasattr(user, 'profile'):
+        etablissements = Service.objects.filter(proprietaire=user)
+    else:
+        return []
+
+    def par_etablissement(queryset, expression, output_field):
+        valeurs = queryset.filter(service=OuterRef('pk')).order_by().values('service').annotate(
+            valeur=expression
+        ).values('valeur')
+        return Coalesce(Subquery(valeurs, output_field=output_field), 0, output_field=output_field)
+
+    return etablissements.annotate(
+        nb_participants=par_etablissement(Participant.objects.all(), Count('pk'), IntegerField()),
+        nb_types_boissons=par_etablissement(TypeBoisson.objects.all(), Count('pk'), IntegerField()),
+        ventes_aujourd_hui=par_etablissement(
+            ConsommationParticipant.objects.filter(date_soiree=date_soiree_courante()),
+            Sum('montant_total'), DecimalField(max_digits=12, decimal_places=2)
+        ),
+    )
+
+
 @login_required
 def dashboard(request):
     """Dashboard principal avec statistiques personnalisées"""
     user = request.user
     
     # Récupérer les établissements de l'utilisateur
-    if hasattr(user, 'gestionnaire'):
-        etablissements = [user.gestionnaire.service]
-        # Vérifier si les types de boissons sont enregistrés
-        if not user.gestionnaire.service.types_boissons_enregistres:
-            messages.warning(request, 'Votre établissement ne sera visible aux participants que lorsque vous aurez enregistré vos types de boissons et leurs prix.')
-    elif hasattr(user, 'profile'):
-        etablissements = Service.objects.filter(proprietaire=user)
-    else:
-        etablissements = []
-    
-    # Statistiques des consommations
-    aujourd_hui = timezone.now().date()
-    debut_semaine = aujourd_hui - timedelta(days=aujourd_hui.weekday())
-    debut_mois = aujourd_hui.replace(day=1)
-    
-    consommations_aujourd_hui = ConsommationParticipant.objects.filter(
-        service__in=etablissements,
-        date_consommation__date=aujourd_hui
-    ).aggregate(total=Sum('montant_total'))['total'] or 0
-    
-    consommations_semaine = ConsommationParticipant.objects.filter(
-        service__in=etablissements,
-        date_consommation__date__gte=debut_semaine
-    ).aggregate(total=Sum('montant_total'))['total'] or 0
+    etablissements = _etablissements_utilisateur(user)
+    # Vérifier si les types de boissons sont enregistrés
+    if hasattr(user, 'gestionnaire') and not user.gestionnaire.service.types_boissons_enregistres:
+        messages.warning(request, 'Votre établissement ne sera visible aux participants que lorsque vous aurez enregistré vos types de boissons et leurs prix.')
     
-    consommations_mois = ConsommationParticipant.objects.filter(
-        service__in=etablissements,
-        date_consommation__date__gte=debut_mois
-    ).aggregate(total=Sum('montant_total'))['total'] or 0
-    
-    # Top participants
-    top_participants = Participant.objects.filter(
-        service__in=etablissements
-    ).annotate(
-        total_depenses=Sum('consommationparticipant__montant_total')
-    ).order_by('-total_depenses')[:5]
+    # Statistiques des consommations (par date de soirée), en cache par établissement
+    statistiques = statistiques_etablissements(etablissements)
     
     context = {
         'etablissements': etablissements,
-        'consommations_aujourd_hui': consommations_aujourd_hui,
-        'consommations_semaine': consommations_semaine,
-        'consommations_mois': consommations_mois,
-        'top_participants': top_participants,
+        **statistiques,
     }
     return render(request, 'dashboard.html', context)
 
@@ -506,40 +491,14 @@ def dashboard(request):
 @login_required
 def classements(request):
     """Page des classements des établissements et participants"""
-    # Classement des maquis
-    maquis = Service.objects.filter(
-        type='maquis', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).order_by('-total_ventes')
-    
-    # Classement des boîtes de nuit
-    boites = Service.objects.filter(
-        type='boite', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).order_by('-total_ventes')
+    # Classements de la soirée en cours, lus depuis le tableau en mémoire
+    version = version_requete(request, PORTEE_CLASSEMENTS)
+    maquis = etablissements_du_tableau('maquis', version=version)
+    boites = etablissements_du_tableau('boite', version=version)
     
     # Top participants par type d'établissement
-    top_participants_maquis = Participant.objects.filter(
-        service__type='maquis',
-        service__actif=True,
-        service__types_boissons_enregistres=True
-    ).annotate(
-        total_depenses=Sum('consommationparticipant__montant_total')
-    ).order_by('-total_depenses')[:10]
-    
-    top_participants_boites = Participant.objects.filter(
-        service__type='boite',
-        service__actif=True,
-        service__types_boissons_enregistres=True
-    ).annotate(
-        total_depenses=Sum('consommationparticipant__montant_total')
-    ).order_by('-total_depenses')[:10]
+    top_participants_maquis = participants_du_tableau('maquis', 10, version=version)
+    top_participants_boites = participants_du_tableau('boite', 10, version=version)
     
     context = {
         'maquis': maquis,
@@ -554,14 +513,15 @@ def classements(request):
 def trophees(request):
     """Page des trophées et récompenses"""
     # Trophées récents
-    trophees_recents = Trophee.objects.all().order_by('-date_attribution')[:10]
+    tous_trophees = Trophee.objects.select_related('gagnant', 'etablissement')
+    trophees_recents = tous_trophees.order_by('-date_attribution')[:10]
     
     # Trophées par type
-    trophees_maquis = Trophee.objects.filter(
+    trophees_maquis = tous_trophees.filter(
         type_trophee__in=['sultan_maquis', 'roi_ventes_maquis']
     ).order_by('-date_attribution')[:5]
     
-    trophees_boite = Trophee.objects.filter(
+    trophees_boite = tous_trophees.filter(
         type_trophee__in=['empereur_boite', 'bouquet_or']
     ).order_by('-date_attribution')[:5]
     
@@ -594,17 +554,24 @@ def paris(request):
     else:
         form = PariForm()
     
-    # Paris de l'utilisateur
-    paris_utilisateur = Pari.objects.filter(user=request.user).order_by('-date_pari')
+    # Paris de l'utilisateur, page par page (curseur sur date_pari, id)
+    try:
+        paris_utilisateur, curseur_suivant = paginer(
+            Pari.objects.filter(user=request.user).select_related('participant__service'),
+            'date_pari', request.GET.get('curseur'), taille_page(request.GET.get('taille'), 20)
+        )
+    except CurseurInvalide:
+        return redirect('app:paris')
     
     # Paris actifs (non résolus)
     paris_actifs = Pari.objects.filter(
         gagne__isnull=True
-    ).order_by('-date_pari')[:20]
+    ).select_related('participant__service').order_by('-date_pari')[:20]
     
     context = {
         'form': form,
         'paris_utilisateur': paris_utilisateur,
+        'curseur_suivant': curseur_suivant,
         'paris_actifs': paris_actifs,
     }
     return render(request, 'paris.html', context)
@@ -613,12 +580,7 @@ def paris(request):
 @login_required
 def etablissements(request):
     """Gestion des établissements"""
-    if hasattr(request.user, 'gestionnaire'):
-        etablissements = [request.user.gestionnaire.service]
-    elif hasattr(request.user, 'profile'):
-        etablissements = Service.objects.filter(proprietaire=request.user)
-    else:
-        etablissements = []
+    etablissements = _etablissements_utilisateur(request.user)
     
     context = {
         'etablissements': etablissements,
@@ -630,13 +592,17 @@ def etablissements(request):
 def participants(request):
     """Gestion des participants"""
     if request.method == 'POST':
-        form = ParticipantForm(request.POST)
+        form = ParticipantForm(request.POST, request.FILES)
         if form.is_valid():
             participant = form.save(commit=False)
             participant.user = request.user
-            participant.save()
-            messages.success(request, 'Participant ajouté avec succès !')
-            return redirect('app:participants')
+            try:
+                participant.save()
+            except PseudoIndisponible:
+                form.add_error('pseudo', 'Ce pseudo est déjà utilisé.')
+            else:
+                messages.success(request, 'Participant ajouté avec succès !')
+                return redirect('app:participants')
     else:
         form = ParticipantForm()
     
@@ -646,7 +612,14 @@ def participants(request):
     elif hasattr(request.user, 'profile'):
         participants = Participant.objects.filter(service__proprietaire=request.user)
     else:
-        participants = []
+        participants = Participant.objects.none()
+    # Dépenses de la soirée agrégées dans la même requête que la liste
+    participants = participants.select_related('service', 'user__profile').annotate(
+        depenses_jour=Coalesce(Sum(
+            'consommationparticipant__montant_total',
+            filter=Q(consommationparticipant__date_soiree=date_soiree_courante())
+        ), 0, output_field=DecimalField(max_digits=12, decimal_places=2))
+    )
     
     context = {
         'form': form,
@@ -695,36 +668,233 @@ def gestion_boissons(request):
 
 @login_required
 def gestion_consommations(request):
-    """Gestion des consommations des participants"""
+    """Gestion des consommations des participants (saisie unitaire ou par lot)"""
     if not hasattr(request.user, 'gestionnaire'):
         messages.error(request, 'Accès réservé aux gestionnaires.')
         return redirect('app:dashboard')
     
-    if request.method == 'POST':
+    gestionnaire = request.user.gestionnaire
+    service = gestionnaire.service
+    choix_lot = {
+        'participants': Participant.objects.filter(service=service, actif=True).values_list('id', 'pseudo'),
+        'boissons': [
+            (boisson.id, f"{boisson.get_categorie_display()} ({boisson.prix_vente:.0f} FCFA)")
+            for boisson in TypeBoisson.objects.filter(service=service, actif=True).order_by('categorie')
+        ],
+    }
+    form = ConsommationParticipantForm(user=request.user)
+    formset_lot = LigneConsommationFormSet(prefix='lot', form_kwargs=choix_lot)
+    
+    if request.method == 'POST' and request.POST.get('mode') == 'lot':
+        formset_lot = LigneConsommationFormSet(request.POST, prefix='lot', form_kwargs=choix_lot)
+        if formset_lot.is_valid():
+            lignes = [ligne for ligne in formset_lot.cleaned_data if ligne.get('quantite')]
+            try:
+                consommations = enregistrer_lot(gestionnaire, lignes)
+            except LotInvalide as e:
+                for erreur in e.erreurs:
+                    prefixe = f"Ligne {erreur['ligne']} : " if erreur['ligne'] else ''
+                    messages.error(request, prefixe + erreur['erreur'])
+            else:
+                messages.success(request, f'{len(consommations)} consommation(s) enregistrée(s) avec succès !')
+                return redirect('app:gestion_consommations')
+    elif request.method == 'POST':
         form = ConsommationParticipantForm(request.POST, user=request.user)
         if form.is_valid():
             consommation = form.save(commit=False)
-            consommation.service = request.user.gestionnaire.service
-            consommation.saisi_par = request.user.gestionnaire
-            consommation.save()
+            consommation.service = service
+            consommation.saisi_par = gestionnaire
+            consommation.cle_idempotence = form.cleaned_data.get('cle_idempotence')
+            cle = consommation.cle_idempotence
+            if cle and ConsommationParticipant.objects.filter(cle_idempotence=cle).exists():
+                messages.info(request, 'Cette consommation a déjà été enregistrée.')
+                return redirect('app:gestion_consommations')
+            try:
+                consommation.save()
+            except IntegrityError:
+                # Double envoi simultané : la première requête l'a déjà enregistrée
+                messages.info(request, 'Cette consommation a déjà été enregistrée.')
+                return redirect('app:gestion_consommations')
             messages.success(request, 'Consommation enregistrée avec succès !')
             return redirect('app:gestion_consommations')
-    else:
-        form = ConsommationParticipantForm(user=request.user)
     
-    # Consommations récentes
-    consommations = ConsommationParticipant.objects.filter(
-        service=request.user.gestionnaire.service
-    ).order_by('-date_consommation')[:50]
+    # Consommations récentes, page par page (curseur sur date_consommation, id)
+    try:
+        consommations, curseur_suivant = paginer(
+            ConsommationParticipant.objects.filter(service=service).select_related(
+                'participant', 'type_boisson', 'saisi_par'
+            ),
+            'date_consommation', request.GET.get('curseur'), taille_page(request.GET.get('taille'))
+        )
+    except CurseurInvalide:
+        return redirect('app:gestion_consommations')
     
     context = {
         'form': form,
+        'formset_lot': formset_lot,
         'consommations': consommations,
-        'service': request.user.gestionnaire.service,
+        'curseur_suivant': curseur_suivant,
+        'service': service,
     }
     return render(request, 'gestion_consommations.html', context)
 
 
+@login_required
+def api_rejouer_consommations(request):
+    """
+    Rejeu de la file de saisies d'une tablette (hors ligne ou double envoi)
+    POST JSON : {"saisies": [{"cle": uuid, "date_consommation": ISO 8601, "participant": id,
+                 "type_boisson": id, "quantite": n, "prix_unitaire": optionnel}, ...]}
+    Réponse : statut par clé ("enregistree", "doublon" ou message d'erreur). Les clés
+    "enregistree" et "doublon" peuvent être retirées de la file.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erreur': 'Méthode non autorisée.'}, status=405)
+    if not hasattr(request.user, 'gestionnaire'):
+        return JsonResponse({'erreur': 'Accès réservé aux gestionnaires.'}, status=403)
+    
+    try:
+        saisies = json.loads(request.body).get('saisies')
+    except (ValueError, AttributeError):
+        return JsonResponse({'erreur': 'Corps JSON invalide.'}, status=400)
+    if not isinstance(saisies, list) or not all(isinstance(saisie, dict) for saisie in saisies):
+        return JsonResponse({'erreur': 'Le champ "saisies" doit être une liste d\'objets.'}, status=400)
+    if len(saisies) > TAILLE_MAX_REJEU:
+        return JsonResponse({'erreur': f'Envoyez au plus {TAILLE_MAX_REJEU} saisies par requête.'}, status=400)
+    
+    resultats = rejouer_saisies(request.user.gestionnaire, saisies)
+    return JsonResponse({
+        'resultats': resultats,
+        'enregistrees': sum(1 for statut in resultats.values() if statut == 'enregistree'),
+    })
+
+
+@login_required
+def api_saisie_consommations(request):
+    """
+    API de saisie par lot pour les gestionnaires
+    POST JSON : {"lignes": [{"participant": id, "type_boisson": id, "quantite": n, "prix_unitaire": optionnel}, ...]}
+    Le lot est enregistré entièrement ou pas du tout.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erreur': 'Méthode non autorisée.'}, status=405)
+    if not hasattr(request.user, 'gestionnaire'):
+        return JsonResponse({'erreur': 'Accès réservé aux gestionnaires.'}, status=403)
+    
+    try:
+        lignes = json.loads(request.body).get('lignes')
+    except (ValueError, AttributeError):
+        return JsonResponse({'erreur': 'Corps JSON invalide.'}, status=400)
+    if not isinstance(lignes, list) or not all(isinstance(ligne, dict) for ligne in lignes):
+        return JsonResponse({'erreur': 'Le champ "lignes" doit être une liste d\'objets.'}, status=400)
+    
+    try:
+        consommations = enregistrer_lot(request.user.gestionnaire, lignes)
+    except LotInvalide as e:
+        return JsonResponse({'erreur': str(e), 'erreurs': e.erreurs}, status=400)
+    
+    return JsonResponse({
+        'enregistrees': len(consommations),
+        'montant_total': sum(consommation.montant_total for consommation in consommations),
+    }, status=201)
+
+
+@require_safe
+def servir_media(request, chemin):
+    """Fichiers de MEDIA_URL, avec plages d'octets et revalidation (voir soiree.medias)"""
+    return reponse_media(request, chemin)
+
+
+def _etat_televersement(televersement, status=200, **autres):
+    reponse = JsonResponse({
+        'id': str(televersement.pk),
+        'taille': televersement.taille,
+        'recu': televersement.recu,
+        'termine': televersement.termine,
+        **autres,
+    }, status=status)
+    reponse['Upload-Offset'] = televersement.recu
+    return reponse
+
+
+def _refus_televersement(erreur, status=400):
+    donnees = {'erreur': str(erreur)}
+    if erreur.recu is not None:
+        donnees['recu'] = erreur.recu
+    reponse = JsonResponse(donnees, status=status)
+    if erreur.recu is not None:
+        reponse['Upload-Offset'] = erreur.recu
+    return reponse
+
+
+def api_televersements_video(request):
+    """
+    Ouverture d'un envoi de vidéo par blocs (formulaire de demande d'adhésion)
+    POST JSON : {"taille": octets, "type": "video/webm"}
+    L'envoi est lié à la session du navigateur, créée au besoin.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'erreur': 'Méthode non autorisée.'}, status=405)
+    if not request.session.session_key:
+        request.session.create()
+    try:
+        donnees = json.loads(request.body)
+        televersement = creer_televersement(
+            donnees.get('taille'), donnees.get('type'), request.session.session_key, adresse_client(request.META)
+        )
+    except (ValueError, AttributeError):
+        return JsonResponse({'erreur': 'Corps JSON invalide.'}, status=400)
+    except TropDeTeleversements as e:
+        return _refus_televersement(e, status=429)
+    except TeleversementInvalide as e:
+        return _refus_televersement(e)
+    reponse = _etat_televersement(televersement, status=201, taille_bloc=TAILLE_BLOC)
+    reponse['Location'] = f'{request.path}{televersement.pk}/'
+    return reponse
+
+
+def api_televersement_video(request, televersement_id):
+    """
+    GET : position de reprise ; PATCH : bloc suivant
+    Le corps du PATCH contient les octets bruts du bloc et l'en-tête
+    Upload-Offset sa position : il est recopié sur disque sans être chargé en mémoire.
+    """
+    televersement = televersement_du_client(televersement_id, request.session.session_key)
+    if televersement is None:
+        return JsonResponse({'erreur': 'Téléversement introuvable.'}, status=404)
+    if request.method in ('GET', 'HEAD'):
+        return _etat_televersement(televersement)
+    if request.method != 'PATCH':
+        return JsonResponse({'erreur': 'Méthode non autorisée.'}, status=405)
+
+    try:
+        position = int(request.headers.get('Upload-Offset', ''))
+        longueur = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'erreur': 'En-têtes Upload-Offset et Content-Length requis.'}, status=400)
+    try:
+        ajouter_bloc(televersement, position, request, longueur)
+    except PositionIncorrecte as e:
+        return _refus_televersement(e, status=409)
+    except TeleversementInvalide as e:
+        return _refus_televersement(e)
+    return _etat_televersement(televersement)
+
+
+def api_terminer_televersement_video(request, televersement_id):
+    """Finalisation : la vidéo complète rejoint videos/demandes"""
+    if request.method != 'POST':
+        return JsonResponse({'erreur': 'Méthode non autorisée.'}, status=405)
+    televersement = televersement_du_client(televersement_id, request.session.session_key)
+    if televersement is None:
+        return JsonResponse({'erreur': 'Téléversement introuvable.'}, status=404)
+    try:
+        terminer_televersement(televersement)
+    except TeleversementInvalide as e:
+        return _refus_televersement(e, status=409)
+    return _etat_televersement(televersement)
+
+
 @user_passes_test(is_admin)
 def admin_demandes_adhesion(request):
     """Administration des demandes d'adhésion"""
@@ -831,7 +1001,7 @@ def admin_demandes_adhesion(request):
                     )
                     
                     # Créer le profil gestionnaire avec le pseudo saisi par l'utilisateur
-                    gestionnaire = Gestionnaire.objects.create(
+                    gestionnaire = Gestionnaire(
                         user=user,
                         service=service,
                         tel=demande.telephone_gestionnaire,
@@ -840,6 +1010,8 @@ def admin_demandes_adhesion(request):
                         prenom=demande.prenom_gestionnaire,
                         fonction='gerant'
                     )
+                    # Le pseudo réservé par la demande approuvée passe au gestionnaire
+                    gestionnaire.save(reprise_pseudo=demande)
                     
                     # Envoyer l'email de réinitialisation de mot de passe
                     try:
@@ -906,122 +1078,125 @@ L'équipe SoireeClash''',
 
 
 def export_consommations_excel(request):
-    """Export Excel des consommations"""
+    """
+    Export des consommations (XLSX par défaut, CSV avec ?format=csv)
+    Filtres optionnels : ?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ (dates de soirée) et ?etablissement=<id>
+    """
     if not request.user.is_superuser:
         messages.error(request, 'Accès réservé aux administrateurs.')
         return redirect('app:dashboard')
     
-    consommations = ConsommationParticipant.objects.select_related(
-        'service', 'type_boisson', 'participant', 'saisi_par'
-    ).all()
-    
-    # Créer le DataFrame
-    data = []
-    for c in consommations:
-        data.append({
-            'Établissement': c.service.nom if c.service else 'N/A',
-            'Participant': c.participant.pseudo if c.participant else 'N/A',
-            'Type de boisson': c.type_boisson.get_categorie_display() if c.type_boisson else 'N/A',
-            'Quantité': c.quantite,
-            'Prix unitaire': float(c.prix_unitaire),
-            'Montant total': float(c.montant_total),
-            'Date consommation': c.date_consommation.strftime('%d/%m/%Y %H:%M'),
-            'Saisi par': c.saisi_par.pseudo if c.saisi_par else 'N/A'
-        })
-    
-    df = pd.DataFrame(data)
-    
-    response = HttpResponse(
+    try:
+        debut = parse_date(request.GET.get('debut', ''))
+        fin = parse_date(request.GET.get('fin', ''))
+    except ValueError:
+        debut = fin = None
+    service_id = request.GET.get('etablissement', '')
+    service_id = int(service_id) if service_id.isdigit() else None
+    
+    lignes = lignes_consommations(consommations_a_exporter(debut, fin, service_id))
+    
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(
+            flux_csv(lignes, COLONNES_CONSOMMATIONS), content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'attachment; filename=consommations_soiree_clash.csv'
+        return response
+    
+    return FileResponse(
+        fichier_xlsx([('Consommations', COLONNES_CONSOMMATIONS, lignes)]),
+        as_attachment=True,
+        filename='consommations_soiree_clash.xlsx',
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    response['Content-Disposition'] = 'attachment; filename=consommations_soiree_clash.xlsx'
-    
-    df.to_excel(response, index=False)
-    return response
 
 
 def export_classements_excel(request):
-    """Export Excel des classements"""
+    """
+    Export Excel des classements (un onglet participants, un onglet établissements)
+    Filtres optionnels : ?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ et ?type=maquis|boite
+    """
     if not request.user.is_superuser:
         messages.error(request, 'Accès réservé aux administrateurs.')
         return redirect('app:dashboard')
     
-    # Classements des participants
-    classements_participants = ClassementQuotidien.objects.select_related(
-        'participant', 'etablissement'
-    ).all()
-    
-    # Classements des établissements
-    classements_etablissements = ClassementEtablissement.objects.select_related(
-        'etablissement'
-    ).all()
-    
-    # Créer le DataFrame pour les participants
-    data_participants = []
-    for c in classements_participants:
-        data_participants.append({
-            'Date': c.date.strftime('%d/%m/%Y'),
-            'Type établissement': c.get_type_etablissement_display(),
-            'Participant': c.participant.pseudo if c.participant else 'N/A',
-            'Établissement': c.etablissement.nom if c.etablissement else 'N/A',
-            'Montant total': float(c.montant_total),
-            'Position': c.position
-        })
-    
-    # Créer le DataFrame pour les établissements
-    data_etablissements = []
-    for c in classements_etablissements:
-        data_etablissements.append({
-            'Date': c.date.strftime('%d/%m/%Y'),
-            'Type établissement': c.get_type_etablissement_display(),
-            'Établissement': c.etablissement.nom if c.etablissement else 'N/A',
-            'Montant total': float(c.montant_total),
-            'Position': c.position
-        })
-    
-    # Créer un fichier Excel avec deux onglets
-    with pd.ExcelWriter('classements_soiree_clash.xlsx', engine='openpyxl') as writer:
-        pd.DataFrame(data_participants).to_excel(writer, sheet_name='Classements_Participants', index=False)
-        pd.DataFrame(data_etablissements).to_excel(writer, sheet_name='Classements_Etablissements', index=False)
-    
-    # Lire le fichier et le renvoyer
-    with open('classements_soiree_clash.xlsx', 'rb') as f:
-        response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=classements_soiree_clash.xlsx'
-    
-    return response
+    try:
+        debut = parse_date(request.GET.get('debut', ''))
+        fin = parse_date(request.GET.get('fin', ''))
+    except ValueError:
+        debut = fin = None
+    type_etablissement = request.GET.get('type')
+    if type_etablissement not in dict(Service.TYPE_CHOICES):
+        type_etablissement = None
+    
+    # Fichier temporaire propre à la requête : deux exports simultanés ne se mélangent pas
+    fichier = fichier_xlsx([
+        ('Classements_Participants', COLONNES_CLASSEMENTS_PARTICIPANTS,
+         lignes_classements_participants(debut, fin, type_etablissement)),
+        ('Classements_Etablissements', COLONNES_CLASSEMENTS_ETABLISSEMENTS,
+         lignes_classements_etablissements(debut, fin, type_etablissement)),
+    ])
+    return FileResponse(
+        fichier,
+        as_attachment=True,
+        filename='classements_soiree_clash.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
 
 
 # API endpoints pour les données dynamiques
+# Les requêtes conditionnelles sont résolues avant la vue : 304 sans accès à la base si rien n'a changé
+@condition(etag_func=etag_api(PORTEE_CLASSEMENTS), last_modified_func=derniere_modification_api(PORTEE_CLASSEMENTS))
 def api_classements(request):
-    """API pour les classements"""
-    maquis = Service.objects.filter(
-        type='maquis', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).values('nom', 'total_ventes').order_by('-total_ventes')[:10]
-    
-    boites = Service.objects.filter(
-        type='boite', 
-        actif=True,
-        types_boissons_enregistres=True
-    ).annotate(
-        total_ventes=Sum('consommationparticipant__montant_total')
-    ).values('nom', 'total_ventes').order_by('-total_ventes')[:10]
+    """API pour les classements (servie depuis le tableau en mémoire, sans agrégation SQL)"""
+    # Même version que l'ETag : le tableau est resynchronisé s'il est plus ancien
+    version = version_requete(request, PORTEE_CLASSEMENTS)
+    donnees = {
+        'maquis': [
+            {'nom': ligne['nom'], 'total_ventes': ligne['total_ventes']}
+            for ligne in tableau_classements.top_etablissements('maquis', 10, version=version)
+        ],
+        'boites': [
+            {'nom': ligne['nom'], 'total_ventes': ligne['total_ventes']}
+            for ligne in tableau_classements.top_etablissements('boite', 10, version=version)
+        ],
+    }
     
-    return JsonResponse({
-        'maquis': list(maquis),
-        'boites': list(boites),
-    })
+    # Rang d'un établissement ou d'un participant précis
+    if request.GET.get('etablissement', '').isdigit():
+        donnees['rang_etablissement'] = tableau_classements.rang_etablissement(
+            int(request.GET['etablissement']), version=version
+        )
+    if request.GET.get('participant', '').isdigit():
+        donnees['rang_participant'] = tableau_classements.rang_participant(
+            int(request.GET['participant']), version=version
+        )
+    
+    return JsonResponse(donnees)
 
 
+async def flux_classements(request):
+    """Flux Server-Sent Events des évolutions du classement de la soirée"""
+    if not isinstance(request, ASGIRequest):
+        # Sous WSGI le flux infini bloquerait un worker sans rien envoyer :
+        # 204 indique à EventSource de ne pas se reconnecter, la page garde
+        # le classement rendu côté serveur
+        return HttpResponse(status=204)
+    # Abonnement avant le calcul de l'état initial pour ne manquer aucune évolution
+    abonnement = diffuseur_classements.broker.abonner()
+    etat_initial = await sync_to_async(diffuseur_classements.etat_initial)()
+    response = StreamingHttpResponse(flux_evenements(abonnement, etat_initial), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Désactiver la mise en tampon de nginx
+    return response
+
+
+@condition(etag_func=etag_api(PORTEE_CONSOMMATIONS), last_modified_func=derniere_modification_api(PORTEE_CONSOMMATIONS))
 def api_consommations(request):
     """API pour les données de consommations"""
     periode = request.GET.get('periode', 'jour')
     
-    aujourd_hui = timezone.now().date()
+    aujourd_hui = date_soiree_courante()
     if periode == 'jour':
         debut = aujourd_hui
         fin = aujourd_hui
@@ -1035,8 +1210,11 @@ def api_consommations(request):
         debut = aujourd_hui
         fin = aujourd_hui
     
+    if request.GET.get('detail'):
+        return _api_consommations_detail(request, debut, fin, periode)
+    
     consommations = ConsommationParticipant.objects.filter(
-        date_consommation__date__range=[debut, fin]
+        date_soiree__range=[debut, fin]
     ).values('service__nom').annotate(
         total=Sum('montant_total')
     ).order_by('-total')
@@ -1047,36 +1225,65 @@ def api_consommations(request):
     })
 
 
+def _api_consommations_detail(request, debut, fin, periode):
+    """
+    Consommations une à une, page par page (?detail=1&curseur=...&taille=...)
+    Réservé aux gestionnaires (leur établissement) et aux administrateurs.
+    """
+    consommations = ConsommationParticipant.objects.filter(date_soiree__range=[debut, fin])
+    if hasattr(request.user, 'gestionnaire'):
+        consommations = consommations.filter(service=request.user.gestionnaire.service)
+    elif not request.user.is_superuser:
+        return JsonResponse({'erreur': 'Accès réservé aux gestionnaires.'}, status=403)
+    
+    try:
+        page, curseur_suivant = paginer(
+            consommations.select_related('service', 'participant', 'type_boisson'),
+            'date_consommation', request.GET.get('curseur'), taille_page(request.GET.get('taille'))
+        )
+    except CurseurInvalide:
+        return JsonResponse({'erreur': 'Curseur invalide.'}, status=400)
+    
+    return JsonResponse({
+        'consommations': [
+            {
+                'id': consommation.pk,
+                'etablissement': consommation.service.nom,
+                'participant': consommation.participant.pseudo,
+                'boisson': consommation.type_boisson.get_categorie_display(),
+                'quantite': consommation.quantite,
+                'montant_total': consommation.montant_total,
+                'date_consommation': consommation.date_consommation,
+            }
+            for consommation in page
+        ],
+        'periode': periode,
+        'suivant': curseur_suivant,
+    })
+
+
+def api_pseudo_disponible(request):
+    """Vérification en direct de la disponibilité d'un pseudo (?pseudo=...)"""
+    pseudo = request.GET.get('pseudo', '').strip()
+    if not normaliser_pseudo(pseudo) or len(pseudo) > 30:
+        return JsonResponse({'pseudo': pseudo, 'disponible': False, 'erreur': 'Pseudo invalide.'}, status=400)
+    response = JsonResponse({'pseudo': pseudo, 'disponible': pseudo_disponible(pseudo)})
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 def test_boissons(request):
     """Vue de test pour vérifier les données des boissons"""
     # Récupérer tous les établissements avec leurs boissons
-    services = Service.objects.filter(actif=True, types_boissons_enregistres=True)
+    # Évalués une fois : le tableau du gabarit et le JSON partagent les mêmes boissons préchargées
+    services = list(_services_avec_boissons(Service.objects.filter(actif=True, types_boissons_enregistres=True)))
     
-    boissons_par_etablissement = {}
-    for service in services:
-        types_boissons = TypeBoisson.objects.filter(service=service, actif=True).order_by('categorie')
-        
-        if service.type == 'boite':
-            boissons_par_etablissement[service.id] = {
-                'nom': service.nom,
-                'type': service.get_type_display(),
-                'type_etablissement': 'boite',
-                'boissons': list(types_boissons.values('categorie')),
-                'systeme': 'enchères'
-            }
-        else:
-            boissons_par_etablissement[service.id] = {
-                'nom': service.nom,
-                'type': service.get_type_display(),
-                'type_etablissement': 'maquis',
-                'boissons': list(types_boissons.values('categorie', 'prix_vente')),
-                'systeme': 'prix_fixes'
-            }
+    boissons_par_etablissement = _boissons_par_etablissement(services)
     
     context = {
         'services': services,
         'boissons_par_etablissement': boissons_par_etablissement,
-        'json_data': json.dumps(boissons_par_etablissement, indent=2)
+        'json_data': json.dumps(boissons_par_etablissement, indent=2, cls=DjangoJSONEncoder)
     }
     
     return render(request, 'test_boissons.html', context)
@@ -0,0 +1,27 @@
+// Vérification en direct de la disponibilité du pseudo
+// <small id="pseudo-disponibilite" data-champ="id du champ pseudo" data-url="API pseudo disponible">
+(function () {
+  const retour = document.getElementById('pseudo-disponibilite');
+  const champ = retour && document.getElementById(retour.dataset.champ);
+  if (!champ || !retour.dataset.url) return;
+  let minuteur = null;
+  let controleur = null;
+  champ.addEventListener('input', function () {
+    clearTimeout(minuteur);
+    const pseudo = champ.value.trim();
+    retour.textContent = '';
+    if (!pseudo) return;
+    minuteur = setTimeout(function () {
+      if (controleur) controleur.abort();
+      controleur = new AbortController();
+      fetch(retour.dataset.url + '?pseudo=' + encodeURIComponent(pseudo), {signal: controleur.signal})
+        .then(function (reponse) { return reponse.json(); })
+        .then(function (donnees) {
+          if (donnees.pseudo !== champ.value.trim()) return;
+          retour.textContent = donnees.disponible ? '✅ Pseudo disponible' : '❌ Pseudo déjà utilisé';
+          retour.style.color = donnees.disponible ? '#2ecc71' : '#e74c3c';
+        })
+        .catch(function () {});
+    }, 300);
+  });
+})();